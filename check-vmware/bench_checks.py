@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Offline benchmark of every check in CHECKS against fake vcenters.
+
+For each scale point a FakeVCenter with that many VMs, esxi hosts and
+datastores is generated, then every check runs once through
+run_measurements, the way check_vmware.py runs it. Reported per check: wall
+time, SOAP calls, bytes over the (simulated) wire and peak python memory.
+The fake serializes the responses in-process, so the memory includes the
+response documents, about what a real connection would buffer as well. The
+VMs get TEST-NET-1 addresses and the ping check answers them through
+fake_vcenter.fake_ping: its row covers reading and streaming the targets,
+not the network.
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+import vmware_ping
+
+from argparse import RawTextHelpFormatter
+from fake_vcenter import TEST_NET, FakeVCenter, fake_ping
+from vmware_checks import CHECKS, STATUS_LABELS, run_measurements
+
+# name: (vms, hosts, datastores)
+SCALES = {
+    "small": (1000, 100, 50),
+    "medium": (5000, 500, 250),
+    "large": (10000, 1000, 500),
+}
+
+
+def bench_check(fake, system, measurement, logger):
+    """ Result, seconds, SOAP calls, bytes and peak MB of measurement. It runs twice, tracing
+        the allocations slows the check down too much to time the same run. """
+    # the host checks run against -H, the others against the whole vcenter
+    hostname = fake.props[fake.hosts[0]]["name"] if measurement.startswith("host_") else None
+    fake.stats.reset()
+    start = time.time()
+    [(_, result)] = run_measurements(system, [measurement], hostname=hostname, logger=logger)
+    elapsed = time.time() - start
+    calls, size = fake.stats.total_calls, fake.stats.total_bytes
+
+    tracemalloc.start()
+    try:
+        run_measurements(system, [measurement], hostname=hostname, logger=logger)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, calls, size, peak / 1024.0 ** 2
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "-s",
+        "--scale",
+        dest="scales",
+        help="Comma separated scale points, among {}\n"
+             "or VMS:HOSTS:DATASTORES (default small,large)".format(", ".join(sorted(SCALES))),
+        type=str,
+        default="small,large"
+    )
+    parser.add_argument(
+        "-m",
+        "--measurement",
+        dest="measurements",
+        help="Comma separated checks to run (default all of CHECKS)",
+        type=str
+    )
+    args = parser.parse_args()
+    measurements = args.measurements.split(",") if args.measurements else list(CHECKS)
+    logger = logging.getLogger("bench_checks")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    vmware_ping.ping_all = fake_ping()
+
+    for scale in args.scales.split(","):
+        vms, hosts, datastores = SCALES.get(scale) or [int(n) for n in scale.split(":")]
+        start = time.time()
+        fake = FakeVCenter(vms=vms, hosts=hosts, datastores=datastores, vm_network=TEST_NET)
+        system = fake.system()
+        print("\n{} VMs, {} hosts, {} datastores (generated in {:.1f}s)".format(
+            vms, hosts, datastores, time.time() - start
+        ))
+        print("{:<30}{:>10}{:>10}{:>8}{:>12}{:>10}".format(
+            "check", "status", "seconds", "calls", "kB", "peak MB"
+        ))
+        for measurement in measurements:
+            result, elapsed, calls, size, peak = bench_check(fake, system, measurement, logger)
+            print("{:<30}{:>10}{:>10.3f}{:>8}{:>12,.0f}{:>10.1f}".format(
+                measurement, STATUS_LABELS.get(result.status, result.status), elapsed, calls,
+                size / 1024.0, peak
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmark of the host property fetch of the host checks.
+
+Compares fetching the whole summary and hardware objects of the hosts, which
+is what reading host.summary and host.hardware costs, with fetching only the
+property paths the host checks declare in DEFINITIONS, for a single host
+and for every host of a fake vcenter as in batch mode.
+"""
+import argparse
+import time
+
+from argparse import RawTextHelpFormatter
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vmware_checks import DEFINITIONS, HOST_CHECKS
+from vmware_collector import retrieve_object_properties
+from vmware_planner import plan
+
+WHOLE_OBJECTS = ["name", "overallStatus", "summary", "hardware", "datastore"]
+
+
+def bench(fake, hosts, path_set, repeat):
+    """ Bytes and seconds of one fetch of path_set for hosts, averaged over repeat runs. """
+    fake.stats.reset()
+    start = time.time()
+    for _ in range(repeat):
+        retrieve_object_properties(fake, hosts, vim.HostSystem, path_set)
+    return fake.stats.total_bytes / float(repeat), (time.time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument("--hosts", dest="hosts", help="Hosts of the fake vcenter", type=int,
+                        default=500)
+    parser.add_argument("--repeat", dest="repeat", help="Runs to average over", type=int,
+                        default=5)
+    args = parser.parse_args()
+
+    fake = FakeVCenter(vms=0, hosts=args.hosts, tasks=0)
+    [fetch] = plan(dict((m, DEFINITIONS[m]) for m in HOST_CHECKS))
+    declared = fetch.paths
+    print("{:<34}{:>14}{:>14}".format("", "bytes", "seconds"))
+    for label, hosts in (("one host", fake.hosts[:1]),
+                         ("{} hosts".format(args.hosts), fake.hosts)):
+        for paths_label, path_set in (("whole summary + hardware", WHOLE_OBJECTS),
+                                      ("declared paths", declared)):
+            size, seconds = bench(fake, hosts, path_set, args.repeat)
+            print("{:<34}{:>14,.0f}{:>14.4f}".format(
+                "{}, {}".format(label, paths_label), size, seconds
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmark of the logging overhead of a check.
+
+Prints the time get_logger() takes from the INI files and from the built in
+settings, then the time a check spends logging, per record, with the file
+written synchronously and through the queue, for a short message and the
+message of a datastore status check listing many datastores. --write-delay
+adds a delay to every write to the file, like a busy disk or a log file on
+network storage would.
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from argparse import RawTextHelpFormatter
+import vmware_logconf
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def setup_time(runs, **kwargs):
+    """ Median seconds of a get_logger() call. """
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        vmware_logconf.get_logger(True, **kwargs)
+        timings.append(time.time() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def log_time(logger, message, records):
+    """ Seconds per record the caller spends logging message. """
+    start = time.time()
+    for _ in range(records):
+        logger.info(message)
+    return (time.time() - start) / records
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument("--runs", dest="runs", help="get_logger() calls, the median is shown",
+                        type=int, default=20)
+    parser.add_argument("--records", dest="records", help="Records logged per message",
+                        type=int, default=2000)
+    parser.add_argument("--datastores", dest="datastores",
+                        help="Datastores listed in the long message", type=int, default=2000)
+    parser.add_argument("--write-delay", dest="write_delay",
+                        help="Milliseconds added to every write to the log file", type=float,
+                        default=0)
+    args = parser.parse_args()
+
+    if args.write_delay:
+        emit = logging.FileHandler.emit
+
+        def slow_emit(handler, record):
+            time.sleep(args.write_delay / 1000.0)
+            emit(handler, record)
+        logging.FileHandler.emit = slow_emit
+
+    messages = [
+        ("short", "Ok: all datastores are accessible"),
+        ("{} datastores".format(args.datastores), "Critical: Datastores not accessible: {}".format(
+            ["datastore{}".format(i) for i in range(args.datastores)]
+        )),
+    ]
+    # local mode writes vmware-checks.log to the working directory
+    cwd = os.getcwd()
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    try:
+        config = os.path.join(HERE, "vmware_logconf", "local_config.ini")
+        print("{:<24}{:>12}".format("setup", "ms"))
+        print("{:<24}{:>12.3f}".format("INI file", setup_time(args.runs, config=config) * 1000))
+        print("{:<24}{:>12.3f}".format("built in", setup_time(args.runs) * 1000))
+
+        print("\n{:<24}{:>12}{:>12}".format("message", "sync (us)", "queued (us)"))
+        for name, message in messages:
+            timings = []
+            for queued in (False, True):
+                logger = vmware_logconf.get_logger(True, queued=queued)
+                timings.append(log_time(logger, message, args.records))
+                # wait for the writer, it would compete with the next run
+                vmware_logconf._stop_listener()
+            print("{:<24}{:>12.1f}{:>12.1f}".format(name, timings[0] * 1e6, timings[1] * 1e6))
+        size = os.path.getsize("vmware-checks.log")
+        print("\nlog file: {:.1f} MB".format(size / 1e6))
+    finally:
+        logging.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
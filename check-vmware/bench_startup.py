@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmark of the start-up cost of a check invocation.
+
+Starts a fresh interpreter importing what each way of running a check loads,
+and prints the wall clock and peak RSS of those processes, followed by the
+slowest imports according to `python -X importtime`.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from argparse import RawTextHelpFormatter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# what check_vmware.py imports on each path: the checks are only loaded when they run in
+# the process, the socket client only relays the result of the daemon
+SCENARIOS = [
+    ("interpreter", "pass"),
+    ("lean check", "import check_vmware, vmware_checks, vmware_connection"),
+    ("socket client", "import check_vmware, vmware_daemon"),
+    ("system ping check", "import check_vmware, vmware_checks, vmware_connection, vmware_ping"),
+    ("wrapanapi check",
+     "import check_vmware, vmware_checks, vmware_connection, wrapanapi.systems.virtualcenter"),
+]
+
+
+def run(code, *options):
+    """ Exit code, wall clock and stderr of a python process running code. """
+    start = time.time()
+    process = subprocess.Popen(
+        [sys.executable] + list(options) + ["-c", code],
+        cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    _, stderr = process.communicate()
+    return process.returncode, time.time() - start, stderr.decode("utf-8", "replace")
+
+
+def measure_rss(code):
+    """ Peak RSS in MB of a python process running code, measured from inside it as the
+        ru_maxrss of the children is the largest of all of them. """
+    probe = "{}\nimport resource\nprint(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    output = subprocess.check_output([sys.executable, "-c", probe.format(code)], cwd=HERE)
+    return int(output.split()[-1]) / 1024.0
+
+
+def import_times(code, top):
+    """ The top slowest imports (cumulative microseconds, module) of a process running code. """
+    returncode, _, stderr = run(code, "-X", "importtime")
+    if returncode:
+        return []
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        try:
+            times.append((int(cumulative), module.rstrip()))
+        except ValueError:
+            # the header line
+            continue
+    return sorted(times, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument("--runs", dest="runs", help="Runs per scenario, the median is shown",
+                        type=int, default=10)
+    parser.add_argument("--top", dest="top", help="Slowest imports listed per scenario",
+                        type=int, default=8)
+    args = parser.parse_args()
+
+    print("{:<20}{:>12}{:>12}".format("scenario", "wall (ms)", "rss (MB)"))
+    for name, code in SCENARIOS:
+        timings = []
+        for _ in range(args.runs):
+            returncode, elapsed, _ = run(code)
+            if returncode:
+                break
+            timings.append(elapsed)
+        if not timings:
+            print("{:<20}{:>24}".format(name, "import failed"))
+            continue
+        median = sorted(timings)[len(timings) // 2]
+        print("{:<20}{:>12.1f}{:>12.1f}".format(name, median * 1000, measure_rss(code)))
+
+    for name, code in SCENARIOS[1:]:
+        times = import_times(code, args.top)
+        if not times:
+            continue
+        print("\n{} (-X importtime, cumulative ms)".format(name))
+        for cumulative, module in times:
+            print("  {:>8.1f}  {}".format(cumulative / 1000.0, module))
+
+
+if __name__ == "__main__":
+    main()
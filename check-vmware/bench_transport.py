@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmark of the http and TLS settings of the connection to a vcenter.
+
+Serves a simulated vcenter over https on the loopback from another process
+(with a throwaway self signed certificate made by openssl) and times runs of
+a check listing every VM, each run a new login like a new check process or a
+reconnecting daemon, with each Transport of vmware_connection. Prints the
+bytes on the wire, the seconds and the TLS handshakes per run. The loopback
+has no bandwidth limit, over a real network the seconds saved by the smaller
+responses come on top.
+"""
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+import vmware_connection
+
+from argparse import RawTextHelpFormatter
+from fake_vcenter import FakeVCenter, FakeVCenterServer, make_certificate
+from vmware_connection import PLAIN, TUNED, Transport, VSphereSystem
+from vmware_profile import CallStats
+
+TRANSPORTS = [
+    ("plain", PLAIN),
+    ("gzip", Transport(compress=True, keep_alive=False, resume_tls=False)),
+    ("keep-alive", Transport(compress=False, keep_alive=True, resume_tls=False)),
+    ("keep-alive + resumption", Transport(compress=False, keep_alive=True, resume_tls=True)),
+    ("all (default)", TUNED),
+]
+
+
+def serve(cert, key, vms, port, handshakes, resumed):
+    """ Run a FakeVCenterServer of vms VMs, its port and TLS handshake counts shared with the
+        benchmark process. """
+    class CountingServer(FakeVCenterServer):
+        def count_handshake(self, reused):
+            with handshakes.get_lock():
+                handshakes.value += 1
+                resumed.value += reused
+
+    server = CountingServer(FakeVCenter(vms=vms, hosts=max(1, vms // 50)), cert, key)
+    port.value = server.port
+    server.serve_forever()
+
+
+def bench(server, transport, runs):
+    """ Bytes, seconds, full and resumed TLS handshakes per run. server is a namespace with the
+        port and the shared handshake counters. """
+    # every transport starts without a session to resume
+    vmware_connection._tls_sessions.clear()
+    handshakes, resumed = server.handshakes.value, server.resumed.value
+    size = seconds = 0
+    for _ in range(runs):
+        stats = CallStats()
+        start = time.time()
+        system = VSphereSystem(
+            "127.0.0.1", "user", "pass", port=server.port.value, stats=stats,
+            transport=transport
+        )
+        system.list_vms()
+        seconds += time.time() - start
+        size += stats.total_bytes
+        system.service_instance._stub.DropConnections()
+    resumed = server.resumed.value - resumed
+    return (
+        size / float(runs), seconds / runs,
+        (server.handshakes.value - handshakes - resumed) / float(runs), resumed / float(runs)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument("--vms", dest="vms", help="VMs in the inventory", type=int,
+                        default=10000)
+    parser.add_argument("--runs", dest="runs", help="Runs to average over", type=int,
+                        default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        cert, key = make_certificate(directory)
+        server = argparse.Namespace(
+            port=multiprocessing.Value("i", 0), handshakes=multiprocessing.Value("i", 0),
+            resumed=multiprocessing.Value("i", 0)
+        )
+        process = multiprocessing.Process(target=serve, args=(
+            cert, key, args.vms, server.port, server.handshakes, server.resumed
+        ), daemon=True)
+        process.start()
+        while not server.port.value:
+            time.sleep(0.1)
+        results = [(label, bench(server, transport, args.runs)) for label, transport in TRANSPORTS]
+        process.terminate()
+    finally:
+        shutil.rmtree(directory)
+
+    print("{} VMs listed over https, average of {} runs".format(args.vms, args.runs))
+    print("{:<26}{:>14}{:>10}{:>12}{:>10}".format(
+        "", "bytes/run", "s/run", "full TLS", "resumed"
+    ))
+    for label, (size, seconds, full, resumed) in results:
+        print("{:<26}{:>14,.0f}{:>10.3f}{:>12.1f}{:>10.1f}".format(
+            label, size, seconds, full, resumed
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmark of the incremental inventory tracking against full retrievals.
+
+Polls the connection state of every VM of a simulated vcenter, where a
+fraction of the VMs change state between polls, once with a full
+retrieve_properties per poll and once with an InventoryTracker, and prints
+the bytes transferred and the time spent per poll by both.
+"""
+import argparse
+import time
+
+from argparse import RawTextHelpFormatter
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vmware_checks import VM_CONNECTION_PROPERTIES
+from vmware_collector import retrieve_properties
+from vmware_updates import InventoryTracker
+
+CONNECTION_STATES = ["connected", "disconnected", "orphaned", "inaccessible"]
+
+
+def bench(fake, poll, polls, churn):
+    """ Bytes and seconds per poll over polls polls, changing churn of the VMs before each. """
+    poll()
+    fake.stats.reset()
+    seconds = 0
+    for _ in range(polls):
+        fake.churn(fake.vms, churn, "summary.runtime.connectionState", CONNECTION_STATES)
+        start = time.time()
+        poll()
+        seconds += time.time() - start
+    return fake.stats.total_bytes / float(polls), seconds / polls
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument("--vms", dest="vms", help="VMs in the inventory", type=int,
+                        default=20000)
+    parser.add_argument("--polls", dest="polls", help="Polls to average over", type=int,
+                        default=5)
+    parser.add_argument("--churn", dest="churn", help="Fraction of the VMs changing per poll",
+                        type=float, default=0.01)
+    args = parser.parse_args()
+
+    fake = FakeVCenter(vms=args.vms, hosts=max(1, args.vms // 50))
+    full = bench(
+        fake,
+        lambda: retrieve_properties(fake, vim.VirtualMachine, VM_CONNECTION_PROPERTIES),
+        args.polls, args.churn
+    )
+    tracker = InventoryTracker(fake, vim.VirtualMachine, VM_CONNECTION_PROPERTIES)
+    incremental = bench(fake, tracker.poll, args.polls, args.churn)
+    tracker.destroy()
+
+    print("{} VMs, {:.1%} churn per poll, average of {} polls".format(
+        args.vms, args.churn, args.polls
+    ))
+    print("{:<24}{:>16}{:>16}".format("", "bytes/poll", "seconds/poll"))
+    for label, (size, seconds) in (("full retrieval", full),
+                                   ("WaitForUpdatesEx", incremental)):
+        print("{:<24}{:>16,.0f}{:>16.3f}".format(label, size, seconds))
+    print("{:<24}{:>15.0f}x{:>15.0f}x".format(
+        "reduction", full[0] / max(incremental[0], 1), full[1] / max(incremental[1], 1e-6)
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,28 +5,115 @@ This script performs checks for vmware hosts through the
 vcenter API
 """
 import argparse
+import json
+import os
 import sys
 
 from argparse import RawTextHelpFormatter
-from pyVmomi import vim
-from vmware_checks import CHECKS
 from vmware_logconf import get_logger
-from wrapanapi.systems.virtualcenter import VMWareSystem
+from vmware_status import UNKNOWN, CheckResult
 
 
 def get_measurement(measurement):
+    from vmware_checks import CHECKS
+
     return CHECKS.get(measurement, None)
 
 
+def run_batch(system, measurements, args, logger, cache=None, **options):
+    """ --all-hosts: run the host measurements for every host, hand out the per-host results
+        and return a summary result for the plugin output. options are passed on to the checks
+        (samples, thresholds). """
+    from pyVmomi import vim
+    from vmware_checks import HOST_CHECKS, run_host_batch, summarize_batch
+
+    measurements = [m for m in measurements if m] or HOST_CHECKS
+    not_host = [m for m in measurements if m not in HOST_CHECKS]
+    if not_host:
+        msg = "Error: --all-hosts only runs host measurements, got {}".format(not_host)
+        logger.error(msg)
+        return CheckResult(UNKNOWN, msg)
+    # limit the batch to a cluster or datacenter
+    container = None
+    for obj_type, name in ((vim.ClusterComputeResource, args.cluster),
+                           (vim.Datacenter, args.datacenter)):
+        if name and not container:
+            container = system.get_obj(obj_type, name)
+            if not container:
+                msg = "Error: {} {} does not exist on vSphere {}".format(
+                    obj_type.__name__, name, args.vsphere
+                )
+                logger.error(msg)
+                return CheckResult(UNKNOWN, msg)
+
+    results = run_host_batch(
+        system, measurements, container=container, warn=args.warning, crit=args.critical,
+        logger=logger, cache=cache, **options
+    )
+    if args.passive_results:
+        from vmware_passive import format_service_result, submit
+
+        submit([
+            format_service_result(hostname, measurement, result)
+            for hostname, measurement, result in results
+        ], args.passive_results)
+    if args.json:
+        # write then rename, so readers never see a half written file
+        with open(args.json + ".tmp", "w") as stream:
+            json.dump([
+                {"host": hostname, "measurement": measurement,
+                 "status": result.status, "message": result.message}
+                for hostname, measurement, result in results
+            ], stream, indent=2)
+        os.rename(args.json + ".tmp", args.json)
+    return summarize_batch(results)
+
+
+def run_vcenters(endpoints, measurements, args, logger, stats=None):
+    """ Several vSphere clients: run the measurements against each of them concurrently and
+        return one result listing all of them. """
+    from functools import partial
+    from vmware_connection import PLAIN, TUNED, connect
+    from vmware_daemon import SessionPool
+    from vmware_fanout import run_fanout, summarize_vcenters
+
+    sessions = SessionPool(logger, trackers=False, connect=partial(
+        connect, wrapanapi=args.wrapanapi, stats=stats,
+        transport=PLAIN if args.transport == "plain" else TUNED
+    ))
+    tallies = {}
+    results = run_fanout(
+        sessions, endpoints, measurements, hostname=args.hostname, warn=args.warning,
+        crit=args.critical, logger=logger, workers=args.workers, tallies=tallies
+    )
+    return summarize_vcenters(results, tallies, warn=args.warning)
+
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
     parser.add_argument(
         "-V",
         "--vsphere",
         dest="vsphere",
-        help="Hostname of vSphere client",
+        help="Hostname of vSphere client, several can be given comma separated: the checks\n"
+             "run against each of them concurrently and the output lists every result",
+        type=str
+    )
+    parser.add_argument(
+        "--vsphere-file",
+        dest="vsphere_file",
+        help="JSON file listing vSphere clients to check along with -V, as\n"
+             '[{"vsphere": "vcenter1", "user": "...", "password": "..."}, ...],\n'
+             "user and password default to -u and -p",
         type=str
     )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="vSphere clients checked at the same time when there are several",
+        type=int,
+        default=8
+    )
     parser.add_argument(
         "-H",
         "--hostname",
@@ -52,22 +139,42 @@ def main():
         "-m",
         "--measurement",
         dest="measurement",
-        help="Type of measurement to carry out",
+        help="Type of measurement to carry out, several can be given comma separated\n"
+             "(e.g. host_cpu,host_memory), they share one connection and data fetch",
         type=str
     )
+    parser.add_argument(
+        "--all-host-checks",
+        dest="all_host_checks",
+        help="Run every host_* measurement against the -H host",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--all-system-checks",
+        dest="all_system_checks",
+        help="Run every vcenter level measurement",
+        action="store_true",
+        default=False
+    )
     parser.add_argument(
         "-w",
         "--warning",
         dest="warning",
-        help="Warning value for the check as a fraction. (e.g. 0.8)",
-        default=0.75
+        help="Warning value for the check, as a fraction for the usage checks (e.g. 0.8,\n"
+             "default 0.75), as a number for the counts (vm_count, template_count: default 20,\n"
+             "system_tasks: default 7), in days to full for system_datastore_forecast (default\n"
+             "30). Several checks only take it when they all use the same unit",
+        type=float
     )
     parser.add_argument(
         "-c",
         "--critical",
         dest="critical",
-        help="Critical value for the check as a fraction. (e.g. 0.9)",
-        default=0.9
+        help="Critical value for the check, like -w (default 0.9 for the usage checks, 30 for\n"
+             "vm_count and template_count, 15 for system_tasks, 7 days for\n"
+             "system_datastore_forecast)",
+        type=float
     )
     parser.add_argument(
         "-l",
@@ -77,48 +184,322 @@ def main():
         action="store_true",
         default=False
     )
+    parser.add_argument(
+        "--log-queue",
+        dest="log_queue",
+        help="Write the log file from a background thread, the check only queues the records",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--log-config",
+        dest="log_config",
+        help="logging INI file (see vmware_logconf/) to configure the logging with instead of\n"
+             "the built in settings",
+        type=str
+    )
+    parser.add_argument(
+        "-S",
+        "--socket",
+        dest="socket",
+        help="Unix socket of a running vmware_daemon.py to run the check through",
+        type=str
+    )
+    parser.add_argument(
+        "--all-hosts",
+        dest="all_hosts",
+        help="Batch mode: run the host measurements (default all of them) for every esxi\n"
+             "host from one bulk fetch, always runs locally",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--cluster",
+        dest="cluster",
+        help="Only check the hosts of this cluster in batch mode",
+        type=str
+    )
+    parser.add_argument(
+        "--datacenter",
+        dest="datacenter",
+        help="Only check the hosts of this datacenter in batch mode",
+        type=str
+    )
+    parser.add_argument(
+        "--passive-results",
+        dest="passive_results",
+        help="Batch mode: write per-host PROCESS_SERVICE_CHECK_RESULT commands to this\n"
+             "shinken/nagios command file",
+        type=str
+    )
+    parser.add_argument(
+        "--json",
+        dest="json",
+        help="Batch mode: write per-host results to this file as JSON",
+        type=str
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        dest="cache_ttl",
+        help="Share inventory wide queries (all datastores, networks...) with the other\n"
+             "check processes through a local cache for this many seconds (default off)",
+        type=float,
+        default=0
+    )
+    parser.add_argument(
+        "--cache-path",
+        dest="cache_path",
+        help="SQLite file of the inventory cache",
+        type=str
+    )
+    parser.add_argument(
+        "--task-cursor",
+        dest="task_cursor",
+        help="system_tasks: only count the tasks that failed since the previous run, which\n"
+             "is remembered in this file (one per vcenter)",
+        type=str
+    )
+    parser.add_argument(
+        "--host-index",
+        dest="host_index",
+        help="Resolve -H through an index of the host names of the vcenter kept in this\n"
+             "file (one per vcenter), instead of listing every host on each run",
+        type=str
+    )
+    parser.add_argument(
+        "--samples",
+        dest="samples",
+        help="Record the measured values (host cpu and memory, datastore usage, failed tasks,\n"
+             "VM and template counts) in this directory, see vmware_samples.py to read them.\n"
+             "Only for checks run by this process, not through --socket",
+        type=str
+    )
+    parser.add_argument(
+        "--thresholds",
+        dest="thresholds",
+        help="JSON file of per datastore and per host thresholds overriding -w/-c, see\n"
+             "vmware_thresholds.py. Only for checks run by this process, not through --socket",
+        type=str
+    )
+    parser.add_argument(
+        "--retries",
+        dest="retries",
+        help="Retry the vSphere API calls failing on network errors or a busy vcenter this\n"
+             "many times, waiting longer each time (default 2)",
+        type=int,
+        default=2
+    )
+    parser.add_argument(
+        "--guard-dir",
+        dest="guard_dir",
+        help="Share the vcenter state with the other check processes in this directory:\n"
+             "at most --max-sessions of them talk to a vcenter at once, and after 3 failed\n"
+             "connections in a row the vcenter is known down for --down-for seconds, the\n"
+             "checks return UNKNOWN at once instead of connecting",
+        type=str
+    )
+    parser.add_argument(
+        "--max-sessions",
+        dest="max_sessions",
+        help="With --guard-dir, check processes connected to a vcenter at once (default 4)",
+        type=int,
+        default=4
+    )
+    parser.add_argument(
+        "--down-for",
+        dest="down_for",
+        help="With --guard-dir, seconds a vcenter is known down (default 120)",
+        type=float,
+        default=120
+    )
+    parser.add_argument(
+        "--transport",
+        dest="transport",
+        help="tuned (default): gzip compressed responses, connections kept open between\n"
+             "calls and TLS sessions resumed. plain: none of them, to compare against",
+        choices=["tuned", "plain"],
+        default="tuned"
+    )
+    parser.add_argument(
+        "--wrapanapi",
+        dest="wrapanapi",
+        help="Connect through wrapanapi instead of the lean pyVmomi connection, slower to\n"
+             "start but a reference to compare results against",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Log the vSphere API calls made by the check: count, bytes and latency per\n"
+             "method and object type, property reads off objects are listed separately.\n"
+             "Only for checks run by this process, not through --socket",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--profile-perfdata",
+        dest="profile_perfdata",
+        help="Like --profile, and add the totals to the performance data of the output",
+        action="store_true",
+        default=False
+    )
     args = parser.parse_args()
     # set logger
-    logger = get_logger(args.local)
-
-    if float(args.warning) > float(args.critical):
-        logger.error("Error: warning value can not be greater than critical value")
-        sys.exit(3)
-
-    # connect to the system
-    logger.info("Connecting to Vsphere %s as user %s", args.vsphere, args.user)
-    system = VMWareSystem(args.vsphere, args.user, args.password)
-    # get the host object
-    host = None
-    if args.hostname:
-        host = system.get_obj(vim.HostSystem, args.hostname)
-        if not host:
-            logger.error("Error: esxi hostname {} does not exist on vSphere {}".format(
-                args.hostname, args.vsphere
-            ))
+    logger = get_logger(args.local, queued=args.log_queue, config=args.log_config)
+
+    thresholds = None
+    if args.thresholds:
+        from vmware_thresholds import ThresholdRules
+
+        try:
+            thresholds = ThresholdRules.load(args.thresholds)
+        except (IOError, ValueError) as e:
+            logger.error("Error: invalid thresholds file %s: %s", args.thresholds, e)
+            print("Error: invalid thresholds file {}: {}".format(args.thresholds, e))
+            sys.exit(3)
+
+    measurements = args.measurement.split(",") if args.measurement else []
+    # the modules of the other modes are imported on demand, a single check only loads
+    # what it needs
+    stats = None
+    endpoints = None
+    if args.vsphere_file or "," in (args.vsphere or ""):
+        from vmware_fanout import parse_endpoints
+
+        endpoints = parse_endpoints(args.vsphere, args.user, args.password, args.vsphere_file)
+        unsupported = [option for option, value in (
+            ("--all-hosts", args.all_hosts), ("--task-cursor", args.task_cursor),
+            ("--host-index", args.host_index), ("--cache-ttl", args.cache_ttl > 0),
+            ("--samples", args.samples), ("--guard-dir", args.guard_dir),
+            ("--thresholds", args.thresholds)
+        ) if value]
+        if unsupported:
+            logger.error("Error: %s only run against a single vSphere", ", ".join(unsupported))
             sys.exit(3)
-    # get measurement function
-    measure_func = get_measurement(args.measurement)
-    if not measure_func:
-        logger.error("Error: measurement {} not understood".format(args.measurement))
-        sys.exit(3)
-    # run the measurement function
-    try:
-        logger.info("Calling check %s", measure_func.__name__)
-        measure_func(host or system, warn=args.warning, crit=args.critical, logger=logger)
-    except Exception as e:
-        logger.error(
-            "Exception occurred during execution of %s",
-            measure_func.__name__,
-            exc_info=True
+
+    if args.socket and not args.all_hosts:
+        from vmware_daemon import request_check
+
+        # hand the check over to a running vmware_daemon.py, which selects the measurements
+        # and checks the thresholds
+        result = request_check(args.socket, {
+            "vsphere": args.vsphere,
+            "user": args.user,
+            "password": args.password,
+            "endpoints": endpoints,
+            "hostname": args.hostname,
+            "measurements": measurements,
+            "all_host_checks": args.all_host_checks,
+            "all_system_checks": args.all_system_checks,
+            "warning": args.warning,
+            "critical": args.critical,
+        }, logger=logger)
+    else:
+        from vmware_checks import (
+            combine_results,
+            run_measurements,
+            select_measurements,
+            threshold_error
         )
-        print(
-            "ERROR: exception '{}' occurred during execution of '{}', check logs for trace".format(
-                e,
-                measure_func.__name__
-            )
+        from vmware_connection import PLAIN, TUNED, connect
+
+        measurements = select_measurements(
+            measurements, args.all_host_checks, args.all_system_checks
         )
-        sys.exit(3)
+        error = threshold_error(measurements, args.warning, args.critical)
+        if error:
+            logger.error(error)
+            print(error)
+            sys.exit(3)
+
+        if args.profile or args.profile_perfdata:
+            from vmware_profile import CallStats
+
+            stats = CallStats()
+        guard = refused = system = None
+        if args.guard_dir and not endpoints:
+            from vmware_guard import Guard
+
+            # the session slot is held until the process exits
+            guard = Guard(args.guard_dir, args.vsphere, max_sessions=args.max_sessions,
+                          down_for=args.down_for, logger=logger)
+            refused = guard.enter()
+        if endpoints:
+            result = run_vcenters(endpoints, measurements, args, logger, stats=stats)
+        elif refused:
+            # the vcenter is known down, or busy with the other checks
+            result = refused
+        else:
+            # connect to the system
+            logger.info("Connecting to Vsphere %s as user %s", args.vsphere, args.user)
+            try:
+                system = connect(
+                    args.vsphere, args.user, args.password, wrapanapi=args.wrapanapi,
+                    stats=stats, retries=args.retries, logger=logger,
+                    transport=PLAIN if args.transport == "plain" else TUNED
+                )
+            except Exception as e:
+                if guard:
+                    guard.failed(e)
+                logger.error("Unable to connect to Vsphere %s", args.vsphere, exc_info=True)
+                result = CheckResult(
+                    UNKNOWN,
+                    "ERROR: exception '{}' occurred while connecting to vSphere {}, check logs "
+                    "for trace".format(e, args.vsphere)
+                )
+            if guard and system:
+                guard.succeeded()
+        if system:
+            cache = None
+            if args.cache_ttl > 0:
+                from vmware_cache import InventoryCache, default_path
+
+                cache = InventoryCache(
+                    args.cache_path or default_path(args.local), ttl=args.cache_ttl, logger=logger
+                )
+            options = {}
+            if args.samples:
+                from vmware_samples import SampleStore
+
+                options["samples"] = SampleStore(args.samples, args.vsphere)
+            if thresholds:
+                options["thresholds"] = thresholds
+            try:
+                if args.all_hosts:
+                    result = run_batch(system, measurements, args, logger, cache=cache, **options)
+                else:
+                    if args.task_cursor:
+                        from vmware_cursor import TaskCursor
+
+                        options["task_cursor"] = TaskCursor(args.task_cursor, args.vsphere)
+                    if args.host_index and args.hostname:
+                        from vmware_hostindex import HostIndex
+
+                        options["host_index"] = HostIndex(args.host_index, args.vsphere)
+                    result = combine_results(run_measurements(
+                        system,
+                        measurements,
+                        hostname=args.hostname,
+                        warn=args.warning,
+                        crit=args.critical,
+                        logger=logger,
+                        cache=cache,
+                        **options
+                    ))
+            finally:
+                if "samples" in options:
+                    options["samples"].close()
+    message = result.message
+    if stats is not None:
+        for line in stats.report():
+            logger.info(line)
+        if args.profile_perfdata:
+            from vmware_profile import add_perfdata
+
+            message = add_perfdata(message, stats.perfdata())
+    print(message)
+    sys.exit(result.status)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,759 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+In-process fake vcenter, for benchmarks and tests that can not reach a real one.
+
+FakeVCenter holds a synthetic inventory and answers the vSphere API calls the
+checks make through FakeStub, a pyVmomi stub adapter. Requests and responses
+are still serialized to SOAP and parsed back by pyVmomi, so the managed and
+data objects the checks see are the real pyVmomi types, and the payload sizes
+and parsing costs recorded in FakeVCenter.stats are the ones a real vcenter
+would cause.
+
+FakeVCenterServer serves a FakeVCenter over https on the loopback, for the
+benchmarks of the http and TLS side of the connection.
+"""
+import datetime
+import gzip
+import ipaddress
+import itertools
+import os
+import random
+import re
+import ssl
+import subprocess
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pyVmomi import Iso8601, SoapAdapter, VmomiSupport, vim, vmodl
+from vmware_profile import CallStats
+
+PC = vmodl.query.PropertyCollector
+VERSION = VmomiSupport.newestVersions.Get("vim")
+# objects per RetrievePropertiesEx page when the caller does not set maxObjects
+DEFAULT_PAGE_SIZE = 1000
+# key, group, name, rollup type and unit of the performance counters of the fake
+PERF_COUNTERS = [
+    (2, "cpu", "usage", "average", "percent"),
+    (240, "disk", "used", "latest", "kiloBytes"),
+    (241, "disk", "capacity", "latest", "kiloBytes"),
+    (242, "disk", "provisioned", "latest", "kiloBytes"),
+]
+XSI_NS = 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+XSD_NS = 'xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+# networks for the addresses of the VMs, TEST-NET-1 is reserved for documentation
+LOOPBACK = "127.0.0.0/8"
+TEST_NET = "192.0.2.0/24"
+
+
+class FakeStub(SoapAdapter.SoapStubAdapterBase):
+    """ pyVmomi stub adapter answering from a FakeVCenter instead of over http. """
+
+    def __init__(self, server):
+        SoapAdapter.SoapStubAdapterBase.__init__(self, version=VERSION)
+        # read by SerializeRequest
+        self.requestContext = None
+        self.server = server
+
+    def InvokeMethod(self, mo, info, args):
+        start = time.time()
+        request = self.SerializeRequest(mo, info, args)
+        response = b""
+        try:
+            if self.server.latency:
+                # network round trip and vcenter processing time
+                time.sleep(self.server.latency)
+            if self.server.faults:
+                raise self.server.faults.pop(0)
+            result = self.server.invoke(mo, info.wsdlName, args)
+            response = self._serialize_response(info, result)
+            return SoapAdapter.SoapResponseDeserializer(self).Deserialize(
+                BytesIO(response), info.result
+            )
+        finally:
+            self.server.stats.record(
+                info.wsdlName, mo, len(request), len(response), time.time() - start
+            )
+
+    def _serialize_response(self, info, result):
+        ns_map = SoapAdapter.SOAP_NSMAP.copy()
+        default_ns = VmomiSupport.GetWsdlNamespace(self.version)
+        ns_map[default_ns] = ""
+        body = ""
+        if result is not None:
+            body = SoapAdapter.SerializeToUnicode(
+                result,
+                VmomiSupport.Object(
+                    name="returnval", type=info.result, version=self.version,
+                    flags=info.resultFlags
+                ),
+                self.version,
+                ns_map
+            )
+        return "".join([
+            SoapAdapter.XML_HEADER, "\n", SoapAdapter.SOAP_START,
+            '<{0}Response xmlns="{1}">'.format(info.wsdlName, default_ns), body,
+            "</{0}Response>".format(info.wsdlName),
+            SoapAdapter.SOAP_BODY_END, SoapAdapter.SOAP_ENVELOPE_END
+        ]).encode(SoapAdapter.XML_ENCODING)
+
+
+class _Filter(object):
+    def __init__(self, collector, spec):
+        self.collector = collector
+        self.spec = spec
+        # object -> {path: value} last sent to the client
+        self.sent = {}
+
+
+class FakeVCenter(object):
+    """ A synthetic inventory of vms, esxi hosts, datastores, networks and recent tasks. The
+        hosts are split over clusters of cluster_size hosts, every host mounts every datastore.
+        The VMs get addresses of vm_network: by default loopback ones, which the checks skip,
+        so nothing is ever pinged. With TEST_NET (pair it with fake_ping) the ping check has
+        targets. Every API call takes at least latency seconds. The exceptions put in faults are raised by the next calls,
+        one per call. """
+
+    def __init__(self, vms=100, hosts=10, datastores=10, networks=5, tasks=20, cluster_size=32,
+                 template_ratio=0.1, task_error_ratio=0.2, seed=0, hostname="fake-vcenter",
+                 latency=0, vm_network=LOOPBACK):
+        self.hostname = hostname
+        self.vm_network = ipaddress.ip_network(vm_network)
+        self.latency = latency
+        self.faults = []
+        self.stub = FakeStub(self)
+        self.stats = CallStats()
+        self.random = random.Random(seed)
+        self.props = {}
+        self.members = {}
+        self.version = 0
+        self.change_log = []
+        self.filters = {}
+        self.tokens = {}
+        self._ids = itertools.count(1)
+
+        self.root = self._add(vim.Folder, "group-d1", name="Datacenters")
+        self.datacenter = self._add(vim.Datacenter, "datacenter-1", name="Datacenter")
+        self.service_instance = vim.ServiceInstance("ServiceInstance", self.stub)
+        self.content = vim.ServiceInstanceContent(
+            rootFolder=self.root,
+            propertyCollector=self._add(PC, "propertyCollector"),
+            viewManager=self._add(vim.view.ViewManager, "ViewManager"),
+            searchIndex=self._add(vim.SearchIndex, "SearchIndex"),
+            sessionManager=self._add(vim.SessionManager, "SessionManager"),
+            taskManager=self._add(vim.TaskManager, "TaskManager"),
+            perfManager=self._add(vim.PerformanceManager, "PerfMgr"),
+            about=vim.AboutInfo(
+                name="Fake vCenter", fullName="Fake vCenter", vendor="check-vmware",
+                version="6.7.0", build="1", osType="linux-x64", productLineId="vpx",
+                apiType="VirtualCenter", apiVersion="6.7"
+            ),
+        )
+        self.props[self.service_instance] = {"content": self.content}
+        self.props[self.content.sessionManager]["currentSession"] = vim.UserSession(
+            key="session-1", userName="fake", fullName="fake", loginTime=_now(),
+            lastActiveTime=_now(), locale="en", messageLocale="en", extensionSession=False,
+            ipAddress="127.0.0.1", userAgent="pyvmomi", callCount=0
+        )
+
+        # datastore -> growth of its usage per day, read back by QueryPerf as a linear history
+        self.growth = {}
+        self.datastores = [self._add_datastore(i) for i in range(datastores)]
+        self.networks = [self._add_network(i) for i in range(networks)]
+        self.clusters = []
+        self.hosts = []
+        for i in range(hosts):
+            if i % cluster_size == 0:
+                self.clusters.append(self._add(
+                    vim.ClusterComputeResource, "domain-c{}".format(len(self.clusters) + 1),
+                    name="cluster-{}".format(len(self.clusters) + 1)
+                ))
+                self.members[self.clusters[-1]] = []
+            host = self._add_host(i)
+            self.hosts.append(host)
+            self.members[self.clusters[-1]].append(host)
+        self.vms = [self._add_vm(i, i < vms * template_ratio) for i in range(vms)]
+        # the tasks complete one second apart, up to the current time of the vcenter
+        self.now = _now() - datetime.timedelta(seconds=tasks)
+        self.props[self.content.taskManager]["recentTask"] = vim.Task.Array()
+        for i in range(tasks):
+            self.add_task(i < tasks * task_error_ratio)
+
+    def system(self):
+        """ A vmware_connection.VSphereSystem logged in to this vcenter. """
+        from vmware_connection import VSphereSystem
+
+        return VSphereSystem(self.hostname, "fake", "fake", stub=self.stub)
+
+    #------------------------------- inventory ---------------------------------------------#
+    def _add(self, obj_type, moid, **props):
+        obj = obj_type(moid, self.stub)
+        self.props[obj] = props
+        return obj
+
+    def _add_datastore(self, i):
+        capacity = 4 * 1024 ** 4
+        obj = self._add(vim.Datastore, "datastore-{}".format(i), name="datastore{}".format(i),
+                        overallStatus="green")
+        self.props[obj]["summary"] = vim.Datastore.Summary(
+            datastore=obj, name="datastore{}".format(i), url="ds:///vmfs/volumes/{}/".format(i),
+            capacity=capacity, freeSpace=int(capacity * self.random.uniform(0.2, 0.8)),
+            accessible=True, multipleHostAccess=True, type="VMFS"
+        )
+        self.growth[obj] = self.random.uniform(0, 0.01)
+        return obj
+
+    def _add_network(self, i):
+        obj = self._add(vim.Network, "network-{}".format(i), name="VM Network {}".format(i))
+        self.props[obj]["summary"] = vim.Network.Summary(
+            network=obj, name="VM Network {}".format(i), accessible=True, ipPoolName=""
+        )
+        return obj
+
+    def _add_host(self, i):
+        name = "esxi{}.example.com".format(i)
+        obj = self._add(vim.HostSystem, "host-{}".format(i), name=name, overallStatus="green")
+        cpu_mhz, cores, memory = 2600, 32, 512 * 1024 ** 3
+        self.props[obj]["summary"] = vim.host.Summary(
+            host=obj,
+            hardware=vim.host.Summary.HardwareSummary(
+                vendor="Fake", model="Fake Server", uuid="host-{}".format(i),
+                memorySize=memory, cpuModel="Fake CPU", cpuMhz=cpu_mhz, numCpuPkgs=2,
+                numCpuCores=cores, numCpuThreads=cores * 2, numNics=4, numHBAs=2
+            ),
+            quickStats=vim.host.Summary.QuickStats(
+                overallCpuUsage=int(cpu_mhz * cores * self.random.uniform(0.1, 0.7)),
+                overallMemoryUsage=int(memory / 1024 ** 2 * self.random.uniform(0.2, 0.7))
+            ),
+            config=vim.host.Summary.ConfigSummary(
+                name=name, port=443, vmotionEnabled=True, faultToleranceEnabled=False
+            ),
+            overallStatus="green",
+            rebootRequired=False
+        )
+        # the full hardware blob is large on real hosts, mostly pci devices and numa info
+        self.props[obj]["hardware"] = vim.host.HardwareInfo(
+            systemInfo=vim.host.SystemInfo(vendor="Fake", model="Fake Server", uuid=name),
+            cpuInfo=vim.host.CpuInfo(
+                numCpuPackages=2, numCpuCores=cores, numCpuThreads=cores * 2, hz=cpu_mhz * 10 ** 6
+            ),
+            cpuPkg=[
+                vim.host.CpuPackage(index=p, vendor="intel", hz=cpu_mhz * 10 ** 6, busHz=10 ** 8,
+                                    description="Fake CPU", threadId=list(range(cores)))
+                for p in range(2)
+            ],
+            memorySize=memory,
+            smcPresent=False,
+            pciDevice=[
+                vim.host.PciDevice(
+                    id="0000:{:02x}:00.0".format(d), classId=0x200, bus=d, slot=0, function=0,
+                    vendorId=0x8086, subVendorId=0x8086, vendorName="Intel Corporation",
+                    deviceId=0x1572, subDeviceId=0, parentBridge="", deviceName="Ethernet"
+                ) for d in range(40)
+            ],
+            numaInfo=vim.host.NumaInfo(type="NUMA", numNodes=2),
+        )
+        self.props[obj]["datastore"] = vim.Datastore.Array(self.datastores)
+        return obj
+
+    def _add_vm(self, i, template):
+        name = "vm{}".format(i)
+        obj = self._add(vim.VirtualMachine, "vm-{}".format(i), name=name)
+        # skip the network and broadcast addresses, a small network is reused
+        ip = str(self.vm_network[1 + i % (self.vm_network.num_addresses - 2)])
+        runtime = vim.vm.RuntimeInfo(
+            connectionState="connected",
+            powerState="poweredOff" if template else "poweredOn",
+            host=self.hosts[i % len(self.hosts)] if self.hosts else None,
+            faultToleranceState="notConfigured", toolsInstallerMounted=False, numMksConnections=0,
+            recordReplayState="inactive", onlineStandby=False, consolidationNeeded=False
+        )
+        guest = vim.vm.GuestInfo(
+            guestState="notRunning" if template else "running",
+            ipAddress=None if template else ip,
+            net=vim.vm.GuestInfo.NicInfo.Array([] if template else [
+                vim.vm.GuestInfo.NicInfo(network="VM Network", ipAddress=[ip], connected=True,
+                                         deviceConfigId=4000)
+            ])
+        )
+        self.props[obj].update(
+            config=vim.vm.ConfigInfo(
+                name=name, template=template, guestFullName="Fake Linux", version="vmx-13",
+                uuid="uuid-{}".format(i), guestId="otherLinux64Guest", changeVersion="1",
+                modified=_now(), alternateGuestName="", files=vim.vm.FileInfo(),
+                flags=vim.vm.FlagInfo(), defaultPowerOps=vim.vm.DefaultPowerOpInfo(),
+                hardware=vim.vm.VirtualHardware(numCPU=2, memoryMB=4096)
+            ),
+            runtime=runtime,
+            guest=guest,
+            summary=vim.vm.Summary(
+                vm=obj,
+                runtime=runtime,
+                guest=vim.vm.Summary.GuestSummary(ipAddress=guest.ipAddress, hostName=name),
+                config=vim.vm.Summary.ConfigSummary(
+                    name=name, template=template, vmPathName="[datastore0] {0}/{0}.vmx".format(name),
+                    memorySizeMB=4096, numCpu=2, guestFullName="Fake Linux"
+                ),
+                storage=vim.vm.Summary.StorageSummary(
+                    committed=20 * 1024 ** 3, uncommitted=0, unshared=20 * 1024 ** 3,
+                    timestamp=_now()
+                ),
+                quickStats=vim.vm.Summary.QuickStats(
+                    overallCpuUsage=100, guestMemoryUsage=1024, guestHeartbeatStatus="green"
+                ),
+                overallStatus="green"
+            ),
+        )
+        return obj
+
+    def add_task(self, failed=False):
+        """ Complete a new recent task one second after the previous one. """
+        recent = self.props[self.content.taskManager]["recentTask"]
+        i = len(recent)
+        self.now += datetime.timedelta(seconds=1)
+        obj = self._add(vim.Task, "task-{}".format(i))
+        vm = self.vms[i % len(self.vms)] if self.vms else None
+        self.props[obj]["info"] = vim.TaskInfo(
+            key="task-{}".format(i), task=obj, descriptionId="VirtualMachine.powerOn",
+            entity=vm, entityName=self.props[vm]["name"] if vm else None,
+            state="error" if failed else "success", cancelled=False, cancelable=False,
+            error=vmodl.MethodFault(
+                msg="Fake failure",
+                faultMessage=[vmodl.LocalizableMessage(key="fake", message="Fake failure")]
+            ) if failed else None,
+            reason=vim.TaskReasonUser(userName="fake"), queueTime=self.now, startTime=self.now,
+            completeTime=self.now, eventChainId=i
+        )
+        recent.append(obj)
+        return obj
+
+    def set(self, obj, path, value):
+        """ Change one property (path may be nested, e.g. "runtime.powerState") of an object. """
+        parent_path, _, attr = path.rpartition(".")
+        if parent_path:
+            setattr(self.get(obj, parent_path), attr, value)
+        else:
+            self.props[obj][attr] = value
+        self.version += 1
+        self.change_log.append((self.version, obj))
+
+    def churn(self, objs, fraction, path, values):
+        """ Set path to a random pick of values on a random fraction of objs. """
+        changed = self.random.sample(objs, int(len(objs) * fraction))
+        for obj in changed:
+            self.set(obj, path, self.random.choice(values))
+        return changed
+
+    def remove(self, obj):
+        """ Delete an object from the inventory, like removing a host from vcenter. """
+        del self.props[obj]
+        for members in self.members.values():
+            if obj in members:
+                members.remove(obj)
+
+    def get(self, obj, path):
+        value = self.props[obj]
+        for i, part in enumerate(path.split(".")):
+            value = value.get(part) if i == 0 else getattr(value, part, None)
+            if value is None:
+                return None
+        return value
+
+    def _container_members(self, container):
+        if container in self.members:
+            return self.members[container]
+        # the root folder and the datacenter contain everything
+        return list(self.props)
+
+    #------------------------------- api ---------------------------------------------------#
+    def handle_soap(self, body):
+        """ The SOAP response to body, a SOAP request as sent to a vcenter over http. """
+        start = time.time()
+        method = re.search(rb"<soapenv:Body>(<(\w+) .*)</soapenv:Body>", body, re.S)
+        info = VmomiSupport.GetWsdlMethod("urn:vim25", method.group(2).decode()).info
+        # the arguments are read as the properties of a data object, the xsi:type attributes
+        # refer to the namespaces of the envelope
+        xml = method.group(1).replace(
+            b'xmlns="urn:vim25"', 'xmlns="urn:vim25" {} {}'.format(XSI_NS, XSD_NS).encode(), 1
+        )
+        request = SoapAdapter.Deserialize(xml, _request_type(info), stub=self.stub)
+        response = b""
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            result = self.invoke(
+                request._this, info.wsdlName, [getattr(request, p.name) for p in info.params]
+            )
+            response = self.stub._serialize_response(info, result)
+            return response
+        finally:
+            self.stats.record(
+                info.wsdlName, request._this, len(body), len(response), time.time() - start
+            )
+
+    def invoke(self, mo, method, args):
+        handler = getattr(self, "_api_" + method, None)
+        if handler is None:
+            raise vmodl.fault.MethodNotFound(receiver=mo, method=method)
+        return handler(mo, *args)
+
+    def _api_RetrieveServiceContent(self, mo):
+        return self.content
+
+    def _api_CurrentTime(self, mo):
+        return self.now
+
+    def _api_Login(self, mo, user_name, password, locale=None):
+        return self.get(mo, "currentSession")
+
+    def _api_Logout(self, mo):
+        pass
+
+    def _api_CreateContainerView(self, mo, container, types, recursive):
+        view = self._add(vim.view.ContainerView, "session[fake]view-{}".format(next(self._ids)))
+        self.props[view]["view"] = VmomiSupport.GetVmodlType("vmodl.ManagedObject").Array([
+            obj for obj in self._container_members(container)
+            if any(isinstance(obj, t) for t in types)
+        ])
+        return view
+
+    def _api_DestroyView(self, mo):
+        self.props.pop(mo, None)
+
+    def _api_RetrievePropertiesEx(self, mo, spec_set, options):
+        # built page by page like vcenter does, so the first page is not delayed by the rest
+        objects = (content for spec in spec_set for content in self._object_contents(spec))
+        return self._page(objects, options.maxObjects or DEFAULT_PAGE_SIZE)
+
+    def _api_ContinueRetrievePropertiesEx(self, mo, token):
+        objects, page_size = self.tokens.pop(token)
+        return self._page(objects, page_size)
+
+    def _api_CancelRetrievePropertiesEx(self, mo, token):
+        self.tokens.pop(token, None)
+
+    def _page(self, objects, page_size):
+        page = list(itertools.islice(objects, page_size + 1))
+        token = None
+        if len(page) > page_size:
+            token = "token-{}".format(next(self._ids))
+            self.tokens[token] = (itertools.chain(page[page_size:], objects), page_size)
+        if not page:
+            return None
+        return PC.RetrieveResult(objects=page[:page_size], token=token)
+
+    def _object_contents(self, spec):
+        for obj, paths in self._spec_objects(spec):
+            content = PC.ObjectContent(obj=obj, propSet=[], missingSet=[])
+            for path, value in self._values(obj, paths).items():
+                content.propSet.append(vmodl.DynamicProperty(name=path, val=value))
+            yield content
+
+    def _spec_objects(self, spec):
+        for obj_spec in spec.objectSet:
+            if obj_spec.obj not in self.props:
+                raise vmodl.fault.ManagedObjectNotFound(obj=obj_spec.obj)
+            candidates = [] if obj_spec.skip else [obj_spec.obj]
+            for select in obj_spec.selectSet:
+                candidates.extend(self.props[obj_spec.obj].get(select.path) or [])
+            for obj in candidates:
+                for prop_spec in spec.propSet:
+                    if isinstance(obj, prop_spec.type):
+                        paths = list(self.props[obj]) if prop_spec.all else prop_spec.pathSet
+                        yield obj, paths
+
+    def _values(self, obj, paths):
+        values = {}
+        for path in paths:
+            value = self.get(obj, path)
+            if value is not None:
+                values[path] = value
+        return values
+
+    def _api_FindByDnsName(self, mo, datacenter, dns_name, vm_search):
+        # the hosts were added to the inventory under their dns name, which renaming them in
+        # the inventory does not change
+        return self._find_host(dns_name, vm_search)
+
+    def _api_FindByIp(self, mo, datacenter, ip, vm_search):
+        return self._find_host(ip, vm_search)
+
+    def _find_host(self, name, vm_search):
+        if not vm_search:
+            for host in self.hosts:
+                if host in self.props and self.get(host, "summary.config.name") == name.lower():
+                    return host
+        return None
+
+    def _api_QueryPerfCounterByLevel(self, mo, level):
+        return vim.PerformanceManager.CounterInfo.Array([
+            vim.PerformanceManager.CounterInfo(
+                key=key,
+                nameInfo=vim.ElementDescription(label=name, summary=name, key=name),
+                groupInfo=vim.ElementDescription(label=group, summary=group, key=group),
+                unitInfo=vim.ElementDescription(label=unit, summary=unit, key=unit),
+                rollupType=rollup, statsType="absolute", level=1
+            )
+            for key, group, name, rollup, unit in PERF_COUNTERS
+        ])
+
+    def _api_QueryPerf(self, mo, query_specs):
+        counters = dict((key, (group, name)) for key, group, name, _, _ in PERF_COUNTERS)
+        metrics = []
+        # the sample times, and their csv, are the same for every datastore
+        sample_times = {}
+        for spec in query_specs:
+            if spec.entity not in self.growth:
+                continue
+            key = (spec.intervalId, spec.maxSample)
+            if key not in sample_times:
+                # the latest samples of the interval, up to the current time of the vcenter
+                latest = self.now - datetime.timedelta(
+                    seconds=self.now.timestamp() % spec.intervalId
+                )
+                timestamps = [
+                    latest - datetime.timedelta(seconds=spec.intervalId * i)
+                    for i in reversed(range(spec.maxSample or 1))
+                ]
+                sample_times[key] = latest, timestamps, ",".join(
+                    "{},{}".format(spec.intervalId, Iso8601.ISO8601Format(t)) for t in timestamps
+                )
+            latest, timestamps, sample_info_csv = sample_times[key]
+            capacity = self.get(spec.entity, "summary.capacity")
+            usage = 1 - float(self.get(spec.entity, "summary.freeSpace")) / capacity
+            series = []
+            for metric_id in spec.metricId:
+                if counters.get(metric_id.counterId) == ("disk", "used"):
+                    values = [
+                        int(max(usage - self.growth[spec.entity] * (latest - t).total_seconds()
+                                / 86400, 0) * capacity / 1024)
+                        for t in timestamps
+                    ]
+                elif counters.get(metric_id.counterId) == ("disk", "capacity"):
+                    values = [capacity // 1024] * len(timestamps)
+                else:
+                    continue
+                if spec.format == "csv":
+                    series.append(vim.PerformanceManager.MetricSeriesCSV(
+                        id=metric_id, value=",".join(str(value) for value in values)
+                    ))
+                else:
+                    series.append(vim.PerformanceManager.IntSeries(id=metric_id, value=values))
+            if spec.format == "csv":
+                metrics.append(vim.PerformanceManager.EntityMetricCSV(
+                    entity=spec.entity,
+                    sampleInfoCSV=sample_info_csv,
+                    value=series
+                ))
+                continue
+            metrics.append(vim.PerformanceManager.EntityMetric(
+                entity=spec.entity,
+                sampleInfo=[
+                    vim.PerformanceManager.SampleInfo(timestamp=t, interval=spec.intervalId)
+                    for t in timestamps
+                ],
+                value=series
+            ))
+        return vim.PerformanceManager.EntityMetricBase.Array(metrics)
+
+    def _api_CreateCollectorForTasks(self, mo, spec):
+        collector = self._add(
+            vim.TaskHistoryCollector, "session[fake]taskcollector-{}".format(next(self._ids))
+        )
+        tasks = []
+        for task in self.props[mo]["recentTask"]:
+            info = self.props[task]["info"]
+            if spec.state and info.state not in spec.state:
+                continue
+            if spec.time and spec.time.beginTime and info.completeTime < spec.time.beginTime:
+                continue
+            if spec.time and spec.time.endTime and info.completeTime > spec.time.endTime:
+                continue
+            tasks.append(info)
+        self.props[collector]["pending"] = tasks
+        return collector
+
+    def _api_ReadNextTasks(self, mo, max_count):
+        pending = self.props[mo]["pending"]
+        self.props[mo]["pending"] = pending[max_count:]
+        return vim.TaskInfo.Array(pending[:max_count])
+
+    def _api_DestroyCollector(self, mo):
+        self.props.pop(mo, None)
+
+    def _api_CreatePropertyCollector(self, mo):
+        return self._add(PC, "session[fake]collector-{}".format(next(self._ids)))
+
+    def _api_DestroyPropertyCollector(self, mo):
+        self.props.pop(mo, None)
+
+    def _api_CreateFilter(self, mo, spec, partial_updates):
+        obj = self._add(PC.Filter, "session[fake]filter-{}".format(next(self._ids)))
+        self.filters[obj] = _Filter(mo, spec)
+        return obj
+
+    def _api_DestroyPropertyFilter(self, mo):
+        self.filters.pop(mo, None)
+        self.props.pop(mo, None)
+
+    def _api_WaitForUpdatesEx(self, mo, version, options):
+        since = int(version) if version else None
+        filter_sets = []
+        for filter_obj, state in self.filters.items():
+            if state.collector != mo:
+                continue
+            updates = self._filter_updates(state, since)
+            if updates:
+                filter_sets.append(PC.FilterUpdate(filter=filter_obj, objectSet=updates))
+        if not filter_sets and since is not None:
+            # maxWaitSeconds elapsed without changes
+            return None
+        return PC.UpdateSet(version=str(self.version), filterSet=filter_sets, truncated=False)
+
+    def _filter_updates(self, state, since):
+        if since is None:
+            dirty = None
+        else:
+            dirty = set(obj for version, obj in self.change_log if version > since)
+        updates = []
+        for obj, paths in self._spec_objects(state.spec):
+            if dirty is not None and obj not in dirty:
+                continue
+            values = self._values(obj, paths)
+            sent = state.sent.get(obj)
+            if sent is None:
+                changes = [PC.Change(name=path, op="assign", val=value)
+                           for path, value in values.items()]
+                updates.append(PC.ObjectUpdate(kind="enter", obj=obj, changeSet=changes))
+            else:
+                changes = [PC.Change(name=path, op="assign", val=value)
+                           for path, value in values.items() if sent.get(path) != value]
+                changes.extend(PC.Change(name=path, op="remove")
+                               for path in sent if path not in values)
+                if changes:
+                    updates.append(PC.ObjectUpdate(kind="modify", obj=obj, changeSet=changes))
+            state.sent[obj] = values
+        return updates
+
+
+class FakeVCenterServer(ThreadingHTTPServer):
+    """ A FakeVCenter answering SOAP over https on 127.0.0.1, like a vcenter: the responses are
+        gzip compressed for the clients accepting it, the connections are kept alive, and the
+        clients may resume their TLS sessions. handshakes counts the TLS handshakes, resumed
+        those that resumed a session. """
+    daemon_threads = True
+
+    def __init__(self, fake, certfile, keyfile, port=0):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", port), _SoapHandler)
+        self.fake = fake
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(certfile, keyfile)
+        self.handshakes = self.resumed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count_handshake(self, resumed):
+        with self._lock:
+            self.handshakes += 1
+            self.resumed += resumed
+
+
+class _SoapHandler(BaseHTTPRequestHandler):
+    # keep-alive
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # the handshake is done in the thread of the connection
+        self.request = self.server.context.wrap_socket(self.request, server_side=True)
+        self.server.count_handshake(self.request.session_reused)
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        try:
+            response = self.server.fake.handle_soap(body)
+        except Exception:
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            response = gzip.compress(response, compresslevel=6)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(response)))
+        # sent along with the headers, in one write
+        self._headers_buffer.extend([b"\r\n", response])
+        self.flush_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def fake_ping(down=()):
+    """ A stand-in for vmware_ping.ping_all answering for the TEST_NET addresses of the fake
+        VMs without sending anything: every target is up, but those of down. """
+    from vmware_ping import DOWN, UP
+
+    def ping_all(targets, **kwargs):
+        # consumes the targets as they come, like ping_all
+        return dict((ip, DOWN if ip in down else UP) for ip in targets)
+
+    return ping_all
+
+
+def fake_sessions(fakes, logger, trackers=False):
+    """ A vmware_daemon.SessionPool logging in to the FakeVCenters of fakes, a dict of vsphere
+        name: FakeVCenter. The connections to the other names are refused. """
+    from vmware_daemon import SessionPool
+
+    def connect(vsphere, user, password):
+        if vsphere not in fakes:
+            raise IOError("connection refused")
+        return fakes[vsphere].system()
+    return SessionPool(logger, trackers=trackers, connect=connect)
+
+
+def make_certificate(directory):
+    """ Paths of a self signed certificate and its key for 127.0.0.1, made by openssl in
+        directory, for FakeVCenterServer. """
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.check_call([
+        "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+        "-subj", "/CN=127.0.0.1", "-keyout", key, "-out", cert
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+_request_types = {}
+
+
+def _request_type(info):
+    # a data type with the _this and parameters of the method info as properties, to read
+    # the requests of that method
+    if info.wsdlName not in _request_types:
+        props = [("_this", "vmodl.ManagedObject", VERSION, 0)] + [
+            (param.name, VmomiSupport.GetVmodlName(param.type), VERSION, param.flags)
+            for param in info.params
+        ]
+        _request_types[info.wsdlName] = VmomiSupport.CreateAndLoadDataType(
+            "checkvmware.fake.{}Request".format(info.wsdlName), "{}Request".format(info.wsdlName),
+            "vmodl.DynamicData", VERSION, props
+        )
+    return _request_types[info.wsdlName]
+
+
+def _now():
+    return datetime.datetime(2019, 8, 23, tzinfo=Iso8601.TZManager.GetTZInfo())
@@ -6,7 +6,7 @@ import yaycl
 import yaycl_crypt
 
 from pyVmomi import vim
-from vmware_checks import CHECKS
+from vmware_checks import CHECKS, CheckResult
 from vmware_logconf import get_logger
 from wrapanapi.systems.virtualcenter import VMWareSystem
 
@@ -57,9 +57,6 @@ def credentials(provider_data):
 @pytest.mark.parametrize("measurement", list(CHECKS.keys()))
 def test_checks(provider_data, credentials, measurement):
     # get the necessary config
-    if measurement == "system_ping_vms":
-        # this test is very slow at present, and not used in shinken pack, so skip
-        pytest.skip("Measurement {} is unused, so skipping".format(measurement))
     measure_func = CHECKS[measurement]
     hostname = provider_data.get("hostname")
     username, password = credentials.get("username"), credentials.get("password")
@@ -77,6 +74,6 @@ def test_checks(provider_data, credentials, measurement):
         host = system.get_obj(vim.HostSystem, host)
 
     # now try run the check
-    with pytest.raises(SystemExit) as pytest_wrapped_e:
-        measure_func(host or system, logger=logger)
-    assert pytest_wrapped_e.type == SystemExit
+    result = measure_func(host or system, logger=logger)
+    assert isinstance(result, CheckResult)
+    assert result.status in (0, 1, 2, 3)
@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+import vmware_ping
+
+from fake_vcenter import TEST_NET, FakeVCenter, fake_ping
+from vmware_checks import CHECKS, CRITICAL, OK, UNKNOWN, CheckResult, run_measurements
+
+logger = logging.getLogger("test_fake_vcenter")
+
+
+@pytest.fixture(scope="module")
+def fake():
+    return FakeVCenter(vms=40, hosts=4, datastores=6, vm_network=TEST_NET)
+
+
+@pytest.mark.parametrize("measurement", sorted(CHECKS))
+def test_check_runs_against_fake(fake, measurement, monkeypatch):
+    monkeypatch.setattr(vmware_ping, "ping_all", fake_ping())
+    hostname = "esxi0.example.com" if measurement.startswith("host_") else None
+    [(_, result)] = run_measurements(
+        fake.system(), [measurement], hostname=hostname, logger=logger
+    )
+    assert isinstance(result, CheckResult)
+    assert result.status != UNKNOWN, result.message
+
+
+def test_stats_count_soap_calls(fake):
+    system = fake.system()
+    fake.stats.reset()
+    system.list_vms()
+    assert fake.stats.total_calls == 3
+    assert fake.stats.calls[("RetrievePropertiesEx", "PropertyCollector")] == 1
+    assert fake.stats.total_bytes > 0
+
+
+def test_vm_and_template_count_share_one_retrieval():
+    fake = FakeVCenter(vms=100, hosts=2, template_ratio=0.3)
+    fake.set(fake.vms[-1], "runtime.powerState", "suspended")
+    fake.stats.reset()
+    results = dict(run_measurements(
+        fake.system(), ["vm_count", "template_count"], warn=1000, crit=2000, logger=logger
+    ))
+    assert "VM Count = 70 (69 poweredOn, 1 suspended)" in results["vm_count"].message
+    assert "Template Count = 30" in results["template_count"].message
+    assert fake.stats.calls[("RetrievePropertiesEx", "PropertyCollector")] == 1
+
+
+def test_inaccessible_and_unconfigured_vms_are_not_counted():
+    fake = FakeVCenter(vms=10, hosts=1, template_ratio=0.3)
+    # 7 VMs and 3 templates
+    template, vm = fake.vms[0], fake.vms[-1]
+    assert fake.get(template, "config.template") and not fake.get(vm, "config.template")
+    fake.set(vm, "summary.runtime.connectionState", "inaccessible")
+    fake.set(template, "summary.runtime.connectionState", "inaccessible")
+    # a VM being created has no config yet
+    del fake.props[fake.vms[-2]]["config"]
+    results = dict(run_measurements(fake.system(), ["vm_count", "template_count"], logger=logger))
+    assert "VM Count = 5 (5 poweredOn)" in results["vm_count"].message
+    assert "Template Count = 2" in results["template_count"].message
+
+
+def test_ping_check_reports_down_vms(fake, monkeypatch):
+    pinged = []
+
+    def ping_all(targets, **kwargs):
+        targets = list(targets)
+        pinged.extend(targets)
+        return fake_ping(down=["192.0.2.10"])(targets)
+
+    monkeypatch.setattr(vmware_ping, "ping_all", ping_all)
+    [(_, result)] = run_measurements(fake.system(), ["system_ping_vms"], logger=logger)
+    # the 4 templates are not pinged
+    assert len(pinged) == 36
+    assert result.status == CRITICAL
+    assert result.message == (
+        "Critical: the following VMs are inaccessible: [('vm9', '192.0.2.10', 'Down')]"
+    )
+
+    # loopback addresses are skipped, the down one is not pinged
+    monkeypatch.setattr(vmware_ping, "ping_all", fake_ping(down=["127.0.0.10"]))
+    loopback = FakeVCenter(vms=10, hosts=1)
+    [(_, result)] = run_measurements(loopback.system(), ["system_ping_vms"], logger=logger)
+    assert result.status == OK
@@ -0,0 +1,64 @@
+import argparse
+import json
+import logging
+
+from check_vmware import run_batch
+from fake_vcenter import FakeVCenter
+from vmware_checks import CRITICAL, OK, UNKNOWN, WARNING, CheckResult, combine_results
+
+logger = logging.getLogger("test_vmware_batch")
+
+
+def batch_args(fake, **kwargs):
+    args = dict(
+        vsphere=fake.hostname, cluster=None, datacenter=None, warning=None, critical=None,
+        passive_results=None, json=None
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def test_batch_of_a_cluster(tmpdir):
+    # cluster-1: esxi0 and esxi1, cluster-2: esxi2 and esxi3, cluster-3: esxi4
+    fake = FakeVCenter(vms=10, hosts=5, cluster_size=2)
+    host = fake.hosts[3]
+    total = fake.get(host, "summary.hardware.cpuMhz") * fake.get(
+        host, "summary.hardware.numCpuCores"
+    )
+    fake.set(host, "summary.quickStats.overallCpuUsage", total)
+    path = str(tmpdir.join("results.json"))
+    args = batch_args(fake, cluster="cluster-2", json=path)
+    result = run_batch(fake.system(), ["host_cpu", "host_status"], args, logger)
+    assert result.status == CRITICAL
+    assert result.message.splitlines() == [
+        "Critical: 4 checks run on 2 hosts, 1 critical, 0 warning, 0 unknown",
+        "esxi3.example.com host_cpu - Critical: cpu usage is 100.0%",
+    ]
+    with open(path) as stream:
+        items = json.load(stream)
+    assert [(item["host"], item["measurement"], item["status"]) for item in items] == [
+        ("esxi2.example.com", "host_cpu", OK), ("esxi2.example.com", "host_status", OK),
+        ("esxi3.example.com", "host_cpu", CRITICAL), ("esxi3.example.com", "host_status", OK),
+    ]
+
+    result = run_batch(fake.system(), [], batch_args(fake, cluster="missing"), logger)
+    assert result.status == UNKNOWN
+    assert "ClusterComputeResource missing does not exist" in result.message
+    result = run_batch(fake.system(), ["vm_count"], batch_args(fake), logger)
+    assert result.status == UNKNOWN
+    assert "only runs host measurements" in result.message
+
+
+def test_worst_status_wins():
+    ok, warning = CheckResult(OK, "Ok: fine"), CheckResult(WARNING, "Warning: high")
+    unknown, critical = CheckResult(UNKNOWN, "Unknown: ?"), CheckResult(CRITICAL, "Critical: full")
+    # a single check keeps its own output
+    assert combine_results([("host_cpu", warning)]) == warning
+    result = combine_results([("a", ok), ("b", unknown), ("c", warning)])
+    assert result.status == WARNING
+    assert result.message.splitlines() == [
+        "Warning: 3 checks run, 0 critical, 1 warning, 1 unknown",
+        "a - Ok: fine", "b - Unknown: ?", "c - Warning: high",
+    ]
+    assert combine_results([("a", ok), ("b", unknown)]).status == UNKNOWN
+    assert combine_results([("a", critical), ("b", warning)]).status == CRITICAL
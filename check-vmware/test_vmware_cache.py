@@ -0,0 +1,64 @@
+import json
+import logging
+import time
+
+from fake_vcenter import FakeVCenter
+from pyVmomi import vim
+from vmware_cache import InventoryCache, _decode, _encode, _LazyStub
+from vmware_checks import OK, run_measurements
+
+logger = logging.getLogger("test_vmware_cache")
+
+MEASUREMENTS = ["system_datastore_usage", "system_network_accessibility", "vm_count"]
+
+
+def run(fake, cache):
+    fake.stats.reset()
+    results = run_measurements(fake.system(), MEASUREMENTS, logger=logger, cache=cache)
+    assert [result.status for _, result in results] == [OK] * 3
+    return fake.stats.calls[("RetrievePropertiesEx", "PropertyCollector")]
+
+
+def test_managed_and_data_objects_survive_the_cache():
+    fake = FakeVCenter(vms=5, hosts=1)
+    system = fake.system()
+    datastore = fake.datastores[0]
+    summary = fake.get(datastore, "summary")
+    payload = json.dumps({"obj": datastore, "summary": summary}, default=_encode)
+    value = json.loads(payload, object_hook=lambda obj: _decode(obj, _LazyStub(system)))
+
+    assert isinstance(value["obj"], vim.Datastore)
+    assert value["obj"]._moId == datastore._moId
+    assert isinstance(value["summary"], vim.Datastore.Summary)
+    assert value["summary"].capacity == summary.capacity
+    assert value["summary"].datastore._moId == datastore._moId
+    # a property that was not cached is read from the vcenter through the session
+    fake.stats.reset()
+    assert value["obj"].name == fake.get(datastore, "name")
+    assert fake.stats.calls[("RetrievePropertiesEx", "PropertyCollector")] == 1
+
+
+def test_second_run_is_served_from_the_cache(tmpdir):
+    fake = FakeVCenter(vms=20, hosts=2, datastores=3)
+    path = str(tmpdir.join("inventory.db"))
+    assert run(fake, InventoryCache(path, ttl=60, logger=logger)) == 3
+    # another check process, with its own connection to the cache file
+    assert run(fake, InventoryCache(path, ttl=60, logger=logger)) == 0
+    # another vcenter has its own entries
+    other = FakeVCenter(vms=20, hosts=2, datastores=3, hostname="other.example.com")
+    assert run(other, InventoryCache(path, ttl=60, logger=logger)) == 3
+
+
+def test_stale_entries_are_fetched_again(tmpdir):
+    fake = FakeVCenter(vms=20, hosts=2, datastores=3)
+    cache = InventoryCache(str(tmpdir.join("inventory.db")), ttl=0.2, logger=logger)
+    assert run(fake, cache) == 3
+    assert run(fake, cache) == 0
+    time.sleep(0.3)
+    fake.set(fake.datastores[0], "summary.freeSpace", 0)
+    fake.stats.reset()
+    [(_, result)] = run_measurements(
+        fake.system(), ["system_datastore_usage"], logger=logger, cache=cache
+    )
+    assert result.status != OK
+    assert fake.stats.calls[("RetrievePropertiesEx", "PropertyCollector")] == 1
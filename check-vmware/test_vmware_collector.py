@@ -0,0 +1,32 @@
+from pyVmomi import vim
+
+from fake_vcenter import FakeVCenter
+from vmware_checks import VM_CONNECTION_PROPERTIES
+from vmware_collector import iter_properties, retrieve_properties
+
+PAGE = ("RetrievePropertiesEx", "PropertyCollector")
+NEXT_PAGE = ("ContinueRetrievePropertiesEx", "PropertyCollector")
+
+
+def test_iter_properties_pages():
+    fake = FakeVCenter(vms=250, hosts=2)
+    fake.stats.reset()
+    items = list(iter_properties(fake, vim.VirtualMachine, VM_CONNECTION_PROPERTIES, page_size=100))
+    assert (fake.stats.calls[PAGE], fake.stats.calls[NEXT_PAGE]) == (1, 2)
+    assert items == retrieve_properties(fake, vim.VirtualMachine, VM_CONNECTION_PROPERTIES)
+
+
+def test_iter_properties_stopped_early_cancels():
+    fake = FakeVCenter(vms=250, hosts=2)
+    fake.stats.reset()
+    items = iter_properties(fake, vim.VirtualMachine, ["name"], page_size=100)
+    assert next(items)["name"] == "vm0"
+    items.close()
+    assert fake.stats.calls[("CancelRetrievePropertiesEx", "PropertyCollector")] == 1
+    assert fake.stats.calls[("DestroyView", "ContainerView")] == 1
+    assert not fake.tokens
+
+
+def test_iter_properties_empty():
+    fake = FakeVCenter(vms=0, hosts=0, tasks=0)
+    assert list(iter_properties(fake, vim.VirtualMachine, ["name"])) == []
@@ -0,0 +1,69 @@
+import shutil
+
+import pytest
+import vmware_connection
+
+from fake_vcenter import FakeVCenter, FakeVCenterServer, make_certificate
+from pyVmomi import vim
+from vmware_connection import PLAIN, TUNED, VSphereSystem
+from vmware_profile import CallStats
+
+
+def _connect(monkeypatch, fake):
+    # go through the version negotiation too
+    monkeypatch.setattr(vmware_connection, "SoapStubAdapter", lambda **kwargs: fake.stub)
+    return VSphereSystem(fake.hostname, "user", "password")
+
+
+def test_list_vms_and_templates(monkeypatch):
+    fake = FakeVCenter(vms=50, hosts=2, template_ratio=0.2)
+    system = _connect(monkeypatch, fake)
+    vms, templates = system.list_vms(), system.list_templates()
+    assert (len(vms), len(templates)) == (40, 10)
+    # the fake vms only report loopback addresses
+    assert all(vm.state == "VmState.RUNNING" and vm.ip is None for vm in vms)
+    assert all(template.ip is None for template in templates)
+
+
+def test_vm_ip_skips_loopback_and_ipv6(monkeypatch):
+    fake = FakeVCenter(vms=2, hosts=1, template_ratio=0)
+    vm = fake.vms[0]
+    fake.set(vm, "guest.ipAddress", "127.0.1.1")
+    fake.set(vm, "guest.net", vim.vm.GuestInfo.NicInfo.Array([
+        vim.vm.GuestInfo.NicInfo(ipAddress=["127.0.0.1", "fe80::1", "192.0.2.10"])
+    ]))
+    system = _connect(monkeypatch, fake)
+    assert [vm.ip for vm in system.list_vms()] == ["192.0.2.10", None]
+
+
+def test_get_obj(monkeypatch):
+    fake = FakeVCenter(vms=10, hosts=3)
+    system = _connect(monkeypatch, fake)
+    host = system.get_obj(vim.HostSystem, "esxi1.example.com")
+    assert host == fake.hosts[1]
+    assert system.get_obj(vim.HostSystem, "missing.example.com") is None
+    assert len(system.get_obj_list(vim.Datastore)) == 10
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="needs openssl for a certificate")
+def test_tuned_transport_over_https(tmpdir):
+    fake = FakeVCenter(vms=200, hosts=2)
+    server = FakeVCenterServer(fake, *make_certificate(str(tmpdir))).start()
+    try:
+        sizes, calls = [], []
+        for transport in (PLAIN, TUNED, TUNED):
+            stats = CallStats()
+            system = VSphereSystem(
+                "127.0.0.1", "user", "password", port=server.port, stats=stats,
+                transport=transport
+            )
+            assert len(system.list_vms()) == 180
+            sizes.append(stats.total_bytes)
+            calls.append(stats.total_calls)
+            system.service_instance._stub.DropConnections()
+    finally:
+        server.stop()
+    assert sizes[1] < sizes[0] / 5
+    # a connection per call without keep-alive, one per session with it, the second session
+    # resumes the TLS session of the first
+    assert (server.handshakes, server.resumed) == (calls[0] + 2, 1)
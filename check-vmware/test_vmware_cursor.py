@@ -0,0 +1,82 @@
+import datetime
+import logging
+
+from fake_vcenter import FakeVCenter
+from vmware_checks import CRITICAL, OK, WARNING, run_measurements
+from vmware_cursor import TaskCursor
+
+logger = logging.getLogger("test_vmware_cursor")
+
+
+def test_recent_tasks_in_one_call():
+    fake = FakeVCenter(vms=20, hosts=2, tasks=200, task_error_ratio=0.1)
+    fake.stats.reset()
+    [(_, result)] = run_measurements(fake.system(), ["system_tasks"], logger=logger)
+    assert result.status == CRITICAL
+    assert result.message.count("Fake failure") == 20
+    assert fake.stats.calls[("RetrievePropertiesEx", "PropertyCollector")] == 1
+    assert ("info read", "Task") not in fake.stats.calls
+
+
+def test_cursor_only_reports_new_failures(tmpdir):
+    fake = FakeVCenter(vms=20, hosts=2, tasks=50, task_error_ratio=0.2)
+    system = fake.system()
+    path = str(tmpdir.join("cursor.json"))
+
+    def run():
+        cursor = TaskCursor(path, fake.hostname)
+        [(_, result)] = run_measurements(
+            system, ["system_tasks"], warn=1, crit=5, logger=logger, task_cursor=cursor
+        )
+        return result
+
+    assert run().status == CRITICAL
+    # nothing failed since the previous run
+    assert run().status == OK
+    fake.add_task(failed=True)
+    fake.add_task(failed=True)
+    fake.add_task()
+    result = run()
+    assert result.status == WARNING
+    assert result.message.count("Fake failure") == 2
+    assert run().status == OK
+
+
+def test_failure_during_a_run_is_reported_by_the_next(tmpdir):
+    fake = FakeVCenter(vms=5, hosts=1, tasks=5, task_error_ratio=0)
+    system = fake.system()
+    path = str(tmpdir.join("cursor.json"))
+
+    def run():
+        [(_, result)] = run_measurements(
+            system, ["system_tasks"], warn=0, crit=5, logger=logger,
+            task_cursor=TaskCursor(path, fake.hostname)
+        )
+        return result
+
+    assert run().status == OK
+    read_next = fake._api_ReadNextTasks
+
+    def read_then_fail(mo, max_count):
+        # a task fails right after the history was read, and the clock moves on
+        page = read_next(mo, max_count)
+        if not page and not failed:
+            failed.append(fake.add_task(failed=True))
+            fake.now += datetime.timedelta(seconds=1)
+        return page
+
+    failed = []
+    fake._api_ReadNextTasks = read_then_fail
+    assert run().status == OK
+    fake._api_ReadNextTasks = read_next
+    result = run()
+    assert result.status == WARNING
+    assert result.message.count("Fake failure") == 1
+
+
+def test_cursor_of_another_vcenter_is_ignored(tmpdir):
+    fake = FakeVCenter(vms=5, hosts=1, tasks=5)
+    path = str(tmpdir.join("cursor.json"))
+    TaskCursor(path, "other-vcenter").advance(fake.now, [])
+    assert TaskCursor(path, fake.hostname).time is None
+    assert TaskCursor(path, "other-vcenter").time == fake.now
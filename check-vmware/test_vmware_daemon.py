@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import socket
+import stat
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from fake_vcenter import FakeVCenter, fake_sessions
+from pyVmomi import vmodl
+from vmware_checks import OK, UNKNOWN
+from vmware_daemon import CheckRequestHandler, CheckServer, request_check
+
+logger = logging.getLogger("test_vmware_daemon")
+
+
+@pytest.fixture
+def fakes():
+    return {"vc1": FakeVCenter(vms=10, hosts=2, hostname="vc1")}
+
+
+@pytest.fixture
+def daemon(tmpdir, fakes):
+    path = str(tmpdir.join("checks.sock"))
+    server = CheckServer(path, logger, sessions=fake_sessions(fakes, logger))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def test_socket_is_private_and_idle_clients_are_dropped(daemon, monkeypatch):
+    assert stat.S_IMODE(os.stat(daemon).st_mode) == 0o600
+    monkeypatch.setattr(CheckRequestHandler, "timeout", 0.2)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    try:
+        sock.connect(daemon)
+        sock.sendall(b'{"vsphere": ')
+        # the daemon closes the connection without an answer
+        assert sock.recv(1024) == b""
+    finally:
+        sock.close()
+
+
+def test_checks_run_through_the_socket(daemon, fakes):
+    request = {
+        "vsphere": "vc1", "user": "user", "password": "pass", "hostname": "esxi0.example.com"
+    }
+    result = request_check(daemon, dict(request, measurements=["host_status", "vm_count"]))
+    assert result.status == OK
+    assert result.message.startswith("Ok: 2 checks run")
+
+    # a check failing on the vcenter side, the daemon keeps serving
+    fakes["vc1"].faults = [vmodl.fault.SystemError(reason="busy")]
+    result = request_check(daemon, dict(request, hostname=None, measurements=["vm_count"]))
+    assert result.status == UNKNOWN
+    assert "reason = 'busy'" in result.message
+    assert "occurred during execution of 'classify_vm_count'" in result.message
+    assert request_check(daemon, dict(request, measurements=["vm_count"])).status == OK
+
+    # the daemon selects the measurements and checks the thresholds for the client
+    result = request_check(daemon, dict(request, measurements=[], all_host_checks=True))
+    assert result.message.startswith("Ok: 6 checks run")
+    result = request_check(daemon, dict(request, measurements=["vm_count"], warning=30,
+                                        critical=20))
+    assert result.status == UNKNOWN
+    assert result.message == "Error: warning value can not be greater than critical value"
+
+    # a vcenter the daemon can not log in to
+    result = request_check(daemon, dict(request, vsphere="down", measurements=["vm_count"]))
+    assert result.status == UNKNOWN
+    assert "daemon failed to run the check: 'connection refused'" in result.message
+
+
+def test_malformed_requests_get_an_answer(daemon):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    try:
+        sock.connect(daemon)
+        sock.sendall(b"host_cpu esxi0\n")
+        with sock.makefile("rb") as stream:
+            response = json.loads(stream.readline().decode("utf-8"))
+    finally:
+        sock.close()
+    assert response["status"] == UNKNOWN
+    assert response["message"].startswith("ERROR: daemon failed to run the check")
+
+    # a request without the vsphere
+    result = request_check(daemon, {"measurements": ["vm_count"]})
+    assert result.status == UNKNOWN
+    assert "'vsphere'" in result.message
+    # no daemon listening
+    result = request_check(daemon + ".missing", {"measurements": ["vm_count"]})
+    assert result.status == UNKNOWN
+    assert result.message.startswith("Error: unable to run check through daemon socket")
+
+
+def test_client_does_not_import_the_checks():
+    code = (
+        "import sys, check_vmware, vmware_daemon\n"
+        "print(sorted(m for m in ('pyVmomi', 'vmware_checks') if m in sys.modules))"
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    assert output.strip() == b"[]"
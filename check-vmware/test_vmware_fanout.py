@@ -0,0 +1,63 @@
+import json
+import logging
+import threading
+
+from fake_vcenter import FakeStub, FakeVCenter, fake_sessions
+from vmware_checks import CRITICAL, OK, UNKNOWN
+from vmware_fanout import parse_endpoints, run_fanout, summarize_vcenters
+
+logger = logging.getLogger("test_vmware_fanout")
+
+
+def test_parse_endpoints(tmpdir):
+    path = tmpdir.join("vcenters.json")
+    path.write(json.dumps([{"vsphere": "vc3", "user": "other"}]))
+    assert parse_endpoints("vc1, vc2", "user", "pass", str(path)) == [
+        {"vsphere": "vc1", "user": "user", "password": "pass"},
+        {"vsphere": "vc2", "user": "user", "password": "pass"},
+        {"vsphere": "vc3", "user": "other", "password": "pass"},
+    ]
+
+
+def test_vcenters_are_checked_concurrently(monkeypatch):
+    fakes = dict(
+        ("vc{}".format(i), FakeVCenter(vms=20, hosts=2, hostname="vc{}".format(i)))
+        for i in range(4)
+    )
+    fakes["vc2"].set(fakes["vc2"].datastores[0], "summary.freeSpace", 0)
+    # the first call to every vcenter waits until all of them are in flight, checked one after
+    # the other the barrier breaks
+    barrier = threading.Barrier(len(fakes), timeout=10)
+    started = set()
+    invoke = FakeStub.InvokeMethod
+
+    def first_calls_meet(self, mo, info, args):
+        if self.server not in started:
+            started.add(self.server)
+            barrier.wait()
+        return invoke(self, mo, info, args)
+
+    monkeypatch.setattr(FakeStub, "InvokeMethod", first_calls_meet)
+    endpoints = parse_endpoints("vc0,vc1,vc2,vc3,down", "user", "pass")
+    tallies = {}
+    results = run_fanout(
+        fake_sessions(fakes, logger), endpoints, ["system_datastore_usage", "vm_count"],
+        logger=logger, tallies=tallies
+    )
+    assert not barrier.broken
+
+    assert [(vsphere, measurement) for vsphere, measurement, _ in results][:2] == [
+        ("vc0", "system_datastore_usage"), ("vc0", "vm_count")
+    ]
+    statuses = dict(((vsphere, m), result.status) for vsphere, m, result in results)
+    assert statuses[("vc2", "system_datastore_usage")] == CRITICAL
+    assert statuses[("vc1", "system_datastore_usage")] == OK
+    assert statuses[("down", "vm_count")] == UNKNOWN
+    result = summarize_vcenters(results, tallies)
+    assert result.status == CRITICAL
+    lines = result.message.splitlines()
+    assert lines[0] == "Critical: 10 checks run on 5 vSphere, 1 critical, 0 warning, 2 unknown"
+    # 18 VMs and 2 templates per vcenter, 10 datastores each
+    assert lines[1] == "Across 4 vSphere: 72 VMs, 1 of 40 datastores over 75.0% usage: " \
+                       "vc2 datastore0 (100.0%)"
+    assert "vc2 system_datastore_usage - Critical" in result.message
@@ -0,0 +1,78 @@
+import logging
+
+import pytest
+import vmware_forecast
+
+from fake_vcenter import FakeVCenter
+from vmware_checks import CRITICAL, OK, UNKNOWN, WARNING, run_measurements
+from vmware_forecast import _slope, fit_slopes
+
+logger = logging.getLogger("test_vmware_forecast")
+
+
+def test_fit_slopes():
+    assert fit_slopes([([0, 1, 2, 3], [1, 3, 5, 7]), ([5], [1]), ([1, 1], [0, 2])]) == [
+        2.0, None, None
+    ]
+
+
+def test_vectorized_slopes_match_python(monkeypatch):
+    pytest.importorskip("numpy")
+    series = [
+        ([0, 1, 2, 3], [1, 3, 5, 7]),
+        # different lengths, the shorter rows are padded
+        ([-3600.0 * i for i in range(336, 0, -1)], [0.5 + 1e-6 * i for i in range(336)]),
+        ([0, 10, 30], [0.2, 0.1, 0.4]),
+        # flat
+        ([0, 1, 2], [0.5, 0.5, 0.5]),
+        # too few distinct xs
+        ([5], [1]),
+        ([1, 1], [0, 2]),
+    ]
+    expected = [_slope(xs, ys) for xs, ys in series]
+    monkeypatch.setattr(vmware_forecast, "VECTORIZE_SAMPLES", 1)
+    slopes = fit_slopes(series)
+    assert [slope is None for slope in slopes] == [slope is None for slope in expected]
+    assert [slope for slope in slopes if slope is not None] == pytest.approx(
+        [slope for slope in expected if slope is not None], rel=1e-9, abs=1e-15
+    )
+    assert slopes[3] == 0
+
+
+def forecast(fake, system=None, **kwargs):
+    [(_, result)] = run_measurements(
+        system or fake.system(), ["system_datastore_forecast"], logger=logger, **kwargs
+    )
+    return result
+
+
+def test_forecast_from_usage_history():
+    fake = FakeVCenter(vms=10, hosts=2, datastores=40)
+    capacity = fake.get(fake.datastores[0], "summary.capacity")
+    for datastore in fake.datastores:
+        fake.set(datastore, "summary.freeSpace", capacity // 2)
+        fake.growth[datastore] = 0.001
+    system = fake.system()
+    fake.stats.reset()
+    assert forecast(fake, system=system).status == OK
+    # 40 datastores, two metrics each, in queries of 64 metrics at most
+    assert fake.stats.calls[("QueryPerf", "PerformanceManager")] == 2
+    # the history is fetched with the datastores, through the content of the session
+    assert fake.stats.calls[("RetrieveServiceContent", "ServiceInstance")] == 0
+
+    # 5% a day from 50%: full in 10 days
+    fake.growth[fake.datastores[1]] = 0.05
+    result = forecast(fake)
+    assert result.status == WARNING
+    assert "('datastore1', '50.0% used, full in 10.0 days')" in result.message
+    assert forecast(fake, warn=60, crit=12).status == CRITICAL
+
+    # shrinking datastores are not growing full
+    fake.growth[fake.datastores[1]] = -0.05
+    result = forecast(fake)
+    assert result.status == OK
+    assert "('datastore1', '50.0% used, not growing')" in result.message
+    del fake.growth[fake.datastores[2]]
+    result = forecast(fake)
+    assert result.status == UNKNOWN
+    assert "('datastore2', 'no usage history')" in result.message
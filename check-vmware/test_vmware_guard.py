@@ -0,0 +1,66 @@
+import logging
+import socket
+import time
+
+import pytest
+import vmware_guard
+
+from fake_vcenter import FakeVCenter
+from pyVmomi import vim, vmodl
+from vmware_checks import UNKNOWN
+from vmware_connection import VSphereSystem
+from vmware_guard import Guard
+
+logger = logging.getLogger("test_vmware_guard")
+
+
+def test_transient_faults_are_retried(monkeypatch):
+    monkeypatch.setattr(vmware_guard, "BASE_DELAY", 0.01)
+    fake = FakeVCenter(vms=5, hosts=1)
+    fake.faults = [socket.timeout("timed out"), vmodl.fault.SystemError(reason="busy")]
+    system = VSphereSystem(fake.hostname, "fake", "fake", stub=fake.stub, retries=2)
+    assert not fake.faults
+    assert len(system.list_vms()) == 4
+
+    fake.faults = [vim.fault.InvalidLogin()]
+    with pytest.raises(vim.fault.InvalidLogin):
+        system.list_vms()
+    fake.faults = [socket.timeout("timed out")] * 3
+    with pytest.raises(socket.timeout):
+        system.list_vms()
+
+
+def test_sessions_are_limited(tmpdir):
+    first, second, third = [Guard(str(tmpdir), "vc1", max_sessions=2) for _ in range(3)]
+    assert first.enter() is None
+    assert second.enter() is None
+    start = time.time()
+    result = third.enter(wait=0.2)
+    assert result.status == UNKNOWN
+    assert 0.2 <= time.time() - start < 1
+    # another vcenter has its own slots
+    assert Guard(str(tmpdir), "vc2", max_sessions=2).enter() is None
+    first.exit()
+    assert third.enter(wait=0) is None
+
+
+def test_breaker_opens_after_failures(tmpdir):
+    guard = Guard(str(tmpdir), "vc1", down_for=0.2, logger=logger)
+    guard.failed(vim.fault.InvalidLogin())
+    for _ in range(vmware_guard.BREAKER_FAILURES):
+        assert guard.enter() is None
+        guard.exit()
+        guard.failed(socket.error("connection refused"))
+
+    other = Guard(str(tmpdir), "vc1")
+    result = other.enter()
+    assert result.status == UNKNOWN
+    assert "vSphere vc1 is down" in result.message
+    assert "connection refused" in result.message
+
+    time.sleep(0.2)
+    # one check tries again, the others still fail fast
+    assert guard.enter() is None
+    assert other.enter().status == UNKNOWN
+    guard.succeeded()
+    assert other.enter() is None
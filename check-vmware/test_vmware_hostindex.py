@@ -0,0 +1,51 @@
+import logging
+
+from fake_vcenter import FakeVCenter
+from vmware_checks import OK, UNKNOWN, run_measurements
+from vmware_hostindex import HostIndex
+
+logger = logging.getLogger("test_vmware_hostindex")
+
+
+def run(fake, system, path, hostname):
+    [(_, result)] = run_measurements(
+        system, ["host_cpu"], hostname=hostname, logger=logger,
+        host_index=HostIndex(path, fake.hostname)
+    )
+    return result
+
+
+def test_indexed_host_needs_no_lookup(tmpdir):
+    fake = FakeVCenter(vms=5, hosts=50)
+    system = fake.system()
+    path = str(tmpdir.join("hosts.json"))
+    fake.stats.reset()
+    assert run(fake, system, path, "esxi7.example.com").status == OK
+    assert fake.stats.calls[("FindByDnsName", "SearchIndex")] == 1
+    assert ("CreateContainerView", "ViewManager") not in fake.stats.calls
+
+    fake.stats.reset()
+    assert run(fake, system, path, "esxi7.example.com").status == OK
+    # the host prefetch of the check is the only call
+    assert fake.stats.total_calls == 1
+
+
+def test_stale_entries_are_looked_up_again(tmpdir):
+    fake = FakeVCenter(vms=5, hosts=3)
+    system = fake.system()
+    path = str(tmpdir.join("hosts.json"))
+    assert run(fake, system, path, "esxi1.example.com").status == OK
+    assert run(fake, system, path, "esxi2.example.com").status == OK
+
+    # esxi1 renamed in the inventory, its dns name stays the same, esxi2 removed
+    fake.set(fake.hosts[1], "name", "esxi1")
+    fake.remove(fake.hosts[2])
+    assert run(fake, system, path, "esxi1").status == OK
+    assert HostIndex(path, fake.hostname).hosts == {
+        "esxi0.example.com": "host-0", "esxi1": "host-1"
+    }
+    result = run(fake, system, path, "esxi2.example.com")
+    assert result.status == UNKNOWN
+    assert "does not exist" in result.message
+    result = run(fake, system, path, "esxi1.example.com")
+    assert result.status == UNKNOWN
@@ -0,0 +1,36 @@
+import logging
+
+import vmware_logconf
+from vmware_logconf import MESSAGE_LIMIT, get_logger
+
+
+def teardown_function(function):
+    vmware_logconf._stop_listener()
+    for handler in list(logging.getLogger().handlers):
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+
+
+def test_long_messages_are_capped(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    logger = get_logger(True)
+    logger.info("Critical: Datastores not accessible: %s", "x" * (MESSAGE_LIMIT + 100))
+    logger.debug("not written")
+    line = tmpdir.join("vmware-checks.log").read().strip()
+    assert line.endswith("x ... [137 more characters]")
+    assert "INFO" in line and "test_vmware_logconf.py" in line
+
+
+def test_queued_records_are_written(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    logger = get_logger(True, queued=True)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("Check %s failed", "host_cpu")
+    logger.info("y" * (MESSAGE_LIMIT + 1))
+    vmware_logconf._stop_listener()
+    lines = tmpdir.join("vmware-checks.log").read().splitlines()
+    assert lines[0].endswith("ERROR  ] Check host_cpu failed")
+    assert "ZeroDivisionError" in lines[-2]
+    assert lines[-1].endswith("y ... [1 more characters]")
@@ -0,0 +1,118 @@
+import errno
+import socket
+import threading
+
+import vmware_ping
+
+from vmware_ping import DOWN, UP, ping_all
+
+# sending to the limited broadcast address is refused by the kernel, so it never answers
+UNREACHABLE = "255.255.255.255"
+
+
+def test_ping_loopback():
+    targets = ["127.0.0.{}".format(i) for i in range(1, 51)]
+    results = ping_all(targets, timeout=2)
+    assert results == {target: UP for target in targets}
+
+
+def test_ping_unreachable_is_down():
+    results = ping_all([UNREACHABLE, "127.0.0.1"], timeout=0.5)
+    assert results == {UNREACHABLE: DOWN, "127.0.0.1": UP}
+
+
+def test_ping_timeouts_run_concurrently(monkeypatch):
+    # drop every reply, so each target uses all its attempts
+    monkeypatch.setattr(vmware_ping.IcmpPinger, "_on_readable", lambda self: None)
+    sends = []
+    send = vmware_ping.IcmpPinger._send
+
+    def record(self, packet, address, timeout):
+        sends.append(address)
+        return send(self, packet, address, timeout)
+
+    monkeypatch.setattr(vmware_ping.IcmpPinger, "_send", record)
+    targets = ["127.0.0.{}".format(i) for i in range(1, 21)]
+    results = ping_all(targets, timeout=0.2, retries=2)
+    assert results == {target: DOWN for target in targets}
+    # every target is pinged before any of them times out, not one after the other
+    assert len(sends) == 60
+    assert sorted(sends[:20]) == sorted(targets)
+
+
+def test_ping_tcp_fallback(monkeypatch):
+    # pretend ICMP sockets are not permitted
+    monkeypatch.setattr(vmware_ping, "_open_icmp_pinger", lambda loop, logger: None)
+    listener = socket.socket()
+    listener.bind(("127.0.0.2", 0))
+    listener.listen(1)
+    try:
+        port = listener.getsockname()[1]
+        monkeypatch.setattr(vmware_ping, "TCP_PORTS", (port,))
+        results = ping_all(["127.0.0.2", UNREACHABLE], timeout=0.5, retries=0)
+    finally:
+        listener.close()
+    assert results == {"127.0.0.2": UP, UNREACHABLE: DOWN}
+
+
+def test_ping_concurrency_window():
+    targets = ["127.0.0.{}".format(i) for i in range(1, 21)]
+    assert ping_all(targets, timeout=2, concurrency=3) == {target: UP for target in targets}
+
+
+def test_ping_full_window_without_drops():
+    # a whole concurrency window of replies arriving at once must not overflow the socket,
+    # without retries a single dropped reply is a host down
+    targets = ["127.0.{}.{}".format(i // 256, i % 256) for i in range(1, 1001)]
+    assert ping_all(targets, timeout=2, retries=0) == {target: UP for target in targets}
+
+
+def test_full_send_buffer_is_waited_for(monkeypatch):
+    open_pinger = vmware_ping._open_icmp_pinger
+
+    class FullSocket(object):
+        # the first sends find the send buffer full
+        def __init__(self, sock):
+            self.sock = sock
+            self.full = 5
+
+        def sendto(self, packet, address):
+            if self.full:
+                self.full -= 1
+                raise BlockingIOError(errno.EAGAIN, "Resource temporarily unavailable")
+            return self.sock.sendto(packet, address)
+
+        def __getattr__(self, name):
+            return getattr(self.sock, name)
+
+    def open_full_pinger(loop, logger):
+        pinger = open_pinger(loop, logger)
+        pinger.sock = FullSocket(pinger.sock)
+        return pinger
+    monkeypatch.setattr(vmware_ping, "_open_icmp_pinger", open_full_pinger)
+    targets = ["127.0.0.{}".format(i) for i in range(1, 4)]
+    assert ping_all(targets, timeout=2, retries=0) == {target: UP for target in targets}
+
+
+def test_checksum_roundtrip():
+    packet = vmware_ping._echo_request(0x1234, 7)
+    assert vmware_ping._checksum(packet) == 0
+
+
+def test_ping_starts_before_the_targets_are_all_read(monkeypatch):
+    started = threading.Event()
+    ping = vmware_ping.IcmpPinger.ping
+
+    def recording_ping(self, address, timeout, retries):
+        started.set()
+        return ping(self, address, timeout, retries)
+    monkeypatch.setattr(vmware_ping.IcmpPinger, "ping", recording_ping)
+
+    def targets():
+        yield "127.0.0.1"
+        # like waiting for the next page of VMs
+        assert started.wait(2)
+        yield "127.0.0.2"
+        yield "127.0.0.1"
+
+    assert ping_all(targets(), timeout=2) == {"127.0.0.1": UP, "127.0.0.2": UP}
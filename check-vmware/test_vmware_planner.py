@@ -0,0 +1,71 @@
+import logging
+
+from pyVmomi import vim
+
+from fake_vcenter import FakeVCenter
+from vmware_checks import (
+    CHECKS,
+    DEFINITIONS,
+    OK,
+    UNKNOWN,
+    WARNING,
+    check_host_cpu_usage,
+    run_measurements
+)
+from vmware_planner import plan
+
+logger = logging.getLogger("test_vmware_planner")
+
+
+def test_plan_merges_paths_per_object_type():
+    names = ["system_connection_vms", "vm_count", "template_count", "host_datastore_status",
+             "host_datastore_usage", "system_datastore_status"]
+    fetches = plan(dict((name, DEFINITIONS[name]) for name in names))
+    assert [(f.obj_type, f.per_object) for f in fetches] == [
+        (vim.VirtualMachine, False), (vim.HostSystem, True), (vim.Datastore, False)
+    ]
+    assert fetches[0].paths == [
+        "name", "summary.runtime.connectionState", "config.template", "runtime.powerState"
+    ]
+    assert fetches[1].paths == ["name", "datastore"]
+    assert fetches[1].related["datastore"] == (
+        vim.Datastore, ["name", "overallStatus", "summary.freeSpace", "summary.capacity"]
+    )
+
+
+def test_checks_sharing_objects_fetch_them_once():
+    fake = FakeVCenter(vms=15, hosts=3, datastores=4)
+    fake.stats.reset()
+    results = run_measurements(
+        fake.system(),
+        ["system_connection_vms", "vm_count", "template_count", "system_datastore_status",
+         "system_datastore_usage", "host_status", "host_datastore_usage"],
+        hostname="esxi1.example.com", logger=logger
+    )
+    assert [result.status for _, result in results] == [OK] * 7
+    # vms, datastores, the host lookup, the host and its datastores
+    assert fake.stats.calls[("RetrievePropertiesEx", "PropertyCollector")] == 5
+
+
+def test_check_functions_run_alone():
+    fake = FakeVCenter(vms=10, hosts=2)
+    assert check_host_cpu_usage(fake.hosts[1], logger=logger).status == OK
+    assert CHECKS["system_network_accessibility"](fake.system(), logger=logger).status == OK
+
+
+def test_thresholds_are_only_shared_by_checks_of_one_unit():
+    # 22 VMs and 3 templates
+    fake = FakeVCenter(vms=25, hosts=1)
+    system = fake.system()
+    measurements = ["system_datastore_usage", "vm_count"]
+    # each check uses its own defaults, 0.75/0.9 of the datastores and 20/30 VMs
+    results = dict(run_measurements(system, measurements, logger=logger))
+    assert results["system_datastore_usage"].status == OK
+    assert results["vm_count"].status == WARNING
+
+    [(_, datastore), (_, count)] = run_measurements(system, measurements, warn=0.5, logger=logger)
+    assert datastore.status == count.status == UNKNOWN
+    assert "fraction thresholds of system_datastore_usage and the count thresholds of " \
+           "vm_count" in count.message
+    assert dict(run_measurements(system, ["vm_count"], warn=100, crit=200, logger=logger))[
+        "vm_count"].status == OK
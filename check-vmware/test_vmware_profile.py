@@ -0,0 +1,25 @@
+from pyVmomi import vim
+
+from fake_vcenter import FakeVCenter
+from vmware_connection import VSphereSystem
+from vmware_profile import CallStats, add_perfdata
+
+
+def test_property_reads_are_told_apart():
+    fake = FakeVCenter(vms=10, hosts=2, datastores=4)
+    stats = CallStats()
+    system = VSphereSystem(fake.hostname, "user", "password", stub=fake.stub, stats=stats)
+    assert stats.calls[("Login", "SessionManager")] == 1
+    host = system.get_obj(vim.HostSystem, "esxi0.example.com")
+    stats.reset()
+    free = [datastore.summary.freeSpace for datastore in host.datastore]
+    assert len(free) == 4
+    assert stats.calls == {("datastore read", "HostSystem"): 1, ("summary read", "Datastore"): 4}
+    assert stats.property_reads == 5
+    assert sum(stats.histograms[("summary read", "Datastore")]) == 4
+
+
+def test_add_perfdata():
+    assert add_perfdata("Ok: fine", "a=1") == "Ok: fine | a=1"
+    assert add_perfdata("Ok: fine\nline", "a=1") == "Ok: fine | a=1\nline"
+    assert add_perfdata("Ok: fine | b=2\nline", "a=1") == "Ok: fine | b=2 a=1\nline"
@@ -0,0 +1,65 @@
+import logging
+
+from fake_vcenter import FakeVCenter
+from vmware_checks import OK, run_measurements
+from vmware_samples import SampleStore, Stats
+
+logger = logging.getLogger("test_vmware_samples")
+
+
+def test_ring_keeps_the_latest_samples(tmpdir):
+    store = SampleStore(str(tmpdir), "vc1", capacity=8)
+    for i in range(20):
+        store.append("cpu_frac", "esxi/1", i / 100.0, timestamp=1000 + 10 * i)
+    store.close()
+
+    # read back from the files
+    store = SampleStore(str(tmpdir), "vc1", capacity=8)
+    assert store.last("cpu_frac", "esxi/1", 3) == [(1170, 0.17), (1180, 0.18), (1190, 0.19)]
+    assert len(store.series("cpu_frac", "esxi/1")) == 8
+    assert [t for t, _ in store.scan("cpu_frac", "esxi/1", 1105, 1140)] == [1120, 1130, 1140]
+    # the oldest samples were overwritten
+    assert store.scan("cpu_frac", "esxi/1", 0, 1115) == []
+    assert store.stats("cpu_frac", "esxi/1", 30, now=1190) == Stats(4, 0.16, 0.19, 0.175)
+    assert round(store.rate("cpu_frac", "esxi/1", 30, now=1190), 6) == 0.001
+    assert store.last("cpu_frac", "esxi2") == []
+    assert store.stats("mem_frac", "esxi/1", 30) is None
+
+
+def test_checks_record_samples(tmpdir):
+    fake = FakeVCenter(vms=20, hosts=2)
+    host = fake.hosts[0]
+    store = SampleStore(str(tmpdir), fake.hostname)
+    run_measurements(
+        fake.system(), ["host_cpu", "system_datastore_usage", "template_count"],
+        hostname=host.name, logger=logger, samples=store
+    )
+    [(_, cpu_frac)] = store.last("cpu_frac", host.name)
+    assert 0 <= cpu_frac <= 1
+    datastore = fake.datastores[0].name
+    assert len(store.last("datastore_usage", datastore)) == 1
+    assert store.last("template_count", fake.hostname)[0][1] == 2
+
+
+def test_samples_keep_few_files_open(tmpdir):
+    fake = FakeVCenter(vms=5, hosts=1, datastores=20)
+    store = SampleStore(str(tmpdir), fake.hostname, max_open=4)
+    [(_, result)] = run_measurements(
+        fake.system(), ["system_datastore_usage"], logger=logger, samples=store
+    )
+    assert result.status == OK
+    assert len(store._series) == 4
+    assert all(len(store.last("datastore_usage", datastore.name)) == 1
+               for datastore in fake.datastores)
+    store.close()
+
+
+def test_failing_samples_do_not_change_the_result(tmpdir):
+    fake = FakeVCenter(vms=5, hosts=1, datastores=3)
+    # the store directory can not be created below a file
+    tmpdir.join("file").write("")
+    store = SampleStore(str(tmpdir.join("file")), fake.hostname)
+    [(_, result)] = run_measurements(
+        fake.system(), ["system_datastore_usage"], logger=logger, samples=store
+    )
+    assert result.status == OK
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import threading
+
+from fake_vcenter import FakeVCenter, fake_sessions
+from vmware_scheduler import Scheduler, Spool, parse_manifest
+
+logger = logging.getLogger("test_vmware_scheduler")
+
+
+def write_manifest(tmpdir, manifest):
+    path = tmpdir.join("manifest.json")
+    path.write(json.dumps(manifest))
+    return str(path)
+
+
+def test_checks_sharing_a_vcenter_are_grouped(tmpdir):
+    vcenter = {"vsphere": "vc1", "user": "user", "password": "pass"}
+    jobs, output = parse_manifest(write_manifest(tmpdir, {"spool": str(tmpdir), "checks": [
+        dict(vcenter, hosts=["esxi0.example.com"], measurements=["host_cpu"]),
+        dict(vcenter, hosts=["esxi1.example.com"], measurements=["host_cpu", "host_memory"]),
+        dict(vcenter, measurements=["vm_count"]),
+        dict(vcenter, measurements=["vm_count"], interval=60),
+    ]}))
+    assert isinstance(output, Spool)
+    assert [(job.hosts, job.measurements, job.interval) for job in jobs] == [
+        (["esxi0.example.com", "esxi1.example.com"], ["host_cpu", "host_memory", "vm_count"], 300),
+        (None, ["vm_count"], 60),
+    ]
+    assert jobs[0].wanted == {
+        "host_cpu": ["esxi0.example.com", "esxi1.example.com"],
+        "host_memory": ["esxi1.example.com"],
+    }
+
+    # both hosts are fetched together, but esxi0 only asked for host_cpu
+    fakes = {"vc1": FakeVCenter(vms=10, hosts=2, hostname="vc1")}
+    Scheduler(jobs[:1], output, fake_sessions(fakes, logger), logger).run_once()
+    [spooled] = [name for name in os.listdir(str(tmpdir)) if name.endswith(".cmd")]
+    with open(str(tmpdir.join(spooled))) as stream:
+        services = sorted(tuple(line.split(";")[1:3]) for line in stream)
+    assert services == [
+        ("esxi0.example.com", "host_cpu"), ("esxi1.example.com", "host_cpu"),
+        ("esxi1.example.com", "host_memory"), ("vc1", "vm_count"),
+    ]
+
+
+def test_results_are_written_to_the_command_pipe(tmpdir):
+    fifo = str(tmpdir.join("nagios.cmd"))
+    os.mkfifo(fifo)
+    jobs, output = parse_manifest(write_manifest(tmpdir, {"command_file": fifo, "checks": [
+        {"vsphere": "vc1", "hosts": ["esxi0.example.com", "missing"],
+         "measurements": ["host_cpu", "system_datastore_usage"]},
+        {"vsphere": "down", "measurements": ["vm_count"]},
+    ]}))
+    # shinken keeps the pipe open for reading
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(open(fifo).readlines()))
+    reader.start()
+    keep_open = os.open(fifo, os.O_WRONLY)
+    try:
+        fakes = {"vc1": FakeVCenter(vms=10, hosts=2, hostname="vc1")}
+        Scheduler(jobs, output, fake_sessions(fakes, logger), logger).run_once()
+    finally:
+        os.close(keep_open)
+    reader.join(10)
+
+    commands = sorted(line.split("] ", 1)[1].split(";")[:4] for line in received)
+    assert commands == [
+        ["PROCESS_SERVICE_CHECK_RESULT", "down", "vm_count", "3"],
+        ["PROCESS_SERVICE_CHECK_RESULT", "esxi0.example.com", "host_cpu", "0"],
+        ["PROCESS_SERVICE_CHECK_RESULT", "missing", "host_cpu", "3"],
+        ["PROCESS_SERVICE_CHECK_RESULT", "vc1", "system_datastore_usage", "0"],
+    ]
@@ -0,0 +1,70 @@
+import logging
+
+import pytest
+
+from fake_vcenter import FakeVCenter
+from vmware_checks import CRITICAL, OK, WARNING, run_measurements
+from vmware_thresholds import ThresholdRules
+
+logger = logging.getLogger("test_vmware_thresholds")
+
+
+def test_exact_names_then_first_matching_pattern():
+    rules = ThresholdRules([
+        {"type": "datastore", "name": "scratch-*", "warning": 0.95, "critical": 0.98},
+        {"type": "datastore", "regex": "scratch-(db|web)[0-9]+", "warning": 0.5, "critical": 0.6},
+        {"type": "datastore", "name": "scratch-web1", "critical": 0.99},
+        {"type": "host", "regex": "esxi[0-9]", "warning": 0.8},
+    ])
+    assert rules.lookup("datastore", "scratch-db1", 0.75, 0.9) == (0.95, 0.98)
+    assert rules.lookup("datastore", "scratch-web1", 0.75, 0.9) == (0.75, 0.99)
+    assert rules.lookup("datastore", "prod-db1", 0.75, 0.9) == (0.75, 0.9)
+    # the regex matches whole names
+    assert rules.lookup("host", "esxi1", 0.75, 0.9) == (0.8, 0.9)
+    assert rules.lookup("host", "esxi10", 0.75, 0.9) == (0.75, 0.9)
+    assert rules.lookup("host", "scratch-db1", 0.75, 0.9) == (0.75, 0.9)
+
+    with pytest.raises(ValueError):
+        ThresholdRules([{"type": "vm", "name": "vm1"}])
+    with pytest.raises(ValueError):
+        ThresholdRules([{"type": "host", "regex": "esxi[", "warning": 0.8}])
+    with pytest.raises(ValueError):
+        ThresholdRules([{"type": "host", "name": "esxi1", "warning": 0.9, "critical": 0.8}])
+
+
+def test_regex_groups_do_not_leak_into_other_rules():
+    rules = ThresholdRules([
+        {"type": "host", "regex": "(?P<site>par|lon)-esxi[0-9]+", "warning": 0.5},
+        {"type": "host", "regex": "(?P<site>nyc)-esxi[0-9]+", "warning": 0.6},
+        {"type": "host", "regex": "(a|b)x\\1", "warning": 0.7},
+        {"type": "host", "regex": "(?i)ESXI-[0-9]", "warning": 0.8},
+        {"type": "host", "name": "*", "warning": 0.1},
+    ])
+    assert rules.lookup("host", "lon-esxi1", 0.75, 0.9) == (0.5, 0.9)
+    assert rules.lookup("host", "nyc-esxi1", 0.75, 0.9) == (0.6, 0.9)
+    # the backreference still refers to the group of its own rule
+    assert rules.lookup("host", "axa", 0.75, 0.9) == (0.7, 0.9)
+    assert rules.lookup("host", "axb", 0.75, 0.9) == (0.1, 0.9)
+    assert rules.lookup("host", "esxi-1", 0.75, 0.9) == (0.8, 0.9)
+    assert rules.lookup("host", "other", 0.75, 0.9) == (0.1, 0.9)
+
+
+def test_datastores_get_their_own_thresholds():
+    fake = FakeVCenter(vms=5, hosts=1, datastores=3)
+    capacity = fake.get(fake.datastores[0], "summary.capacity")
+    for datastore in fake.datastores:
+        fake.set(datastore, "summary.freeSpace", int(capacity * 0.15))
+    system = fake.system()
+
+    def status(rules):
+        [(_, result)] = run_measurements(
+            system, ["system_datastore_usage"], logger=logger, thresholds=ThresholdRules(rules)
+        )
+        return result.status
+
+    assert status([]) == WARNING
+    assert status([{"type": "datastore", "name": "datastore*", "warning": 0.9}]) == OK
+    assert status([
+        {"type": "datastore", "name": "datastore1", "critical": 0.8},
+        {"type": "datastore", "name": "datastore*", "warning": 0.9},
+    ]) == CRITICAL
@@ -0,0 +1,83 @@
+import vmware_updates
+
+from pyVmomi import vim
+
+from fake_vcenter import FakeVCenter
+from vmware_checks import VM_CONNECTION_PROPERTIES
+from vmware_collector import retrieve_properties
+from vmware_updates import InventoryTracker, InventoryTrackers
+
+
+def _states(items):
+    return sorted((item["name"], item["summary.runtime.connectionState"]) for item in items)
+
+
+def test_tracker_matches_full_retrieval():
+    fake = FakeVCenter(vms=200, hosts=4)
+    tracker = InventoryTracker(fake, vim.VirtualMachine, VM_CONNECTION_PROPERTIES)
+    assert tracker.poll() == 200
+    fake.churn(fake.vms, 0.05, "summary.runtime.connectionState", ["disconnected"])
+    assert tracker.poll() == 10
+    full = retrieve_properties(fake, vim.VirtualMachine, VM_CONNECTION_PROPERTIES)
+    assert _states(tracker.items()) == _states(full)
+    tracker.destroy()
+
+
+def test_tracker_poll_only_transfers_changes():
+    fake = FakeVCenter(vms=500, hosts=5)
+    tracker = InventoryTracker(fake, vim.VirtualMachine, VM_CONNECTION_PROPERTIES)
+    fake.stats.reset()
+    tracker.poll()
+    initial = fake.stats.total_bytes
+    fake.churn(fake.vms, 0.01, "summary.runtime.connectionState", ["orphaned"])
+    fake.stats.reset()
+    assert tracker.poll() == 5
+    assert fake.stats.total_bytes * 20 < initial
+    # nothing changed since the last poll
+    assert tracker.poll() == 0
+
+
+def test_trackers_reuse_the_filter():
+    fake = FakeVCenter(vms=50, hosts=2)
+    trackers = InventoryTrackers()
+    key = ("retrieve_properties", vim.VirtualMachine, tuple(VM_CONNECTION_PROPERTIES), None)
+    fetch = lambda: retrieve_properties(fake, vim.VirtualMachine, VM_CONNECTION_PROPERTIES)
+    assert len(trackers.get(fake, key, fetch)) == 50
+    fake.stats.reset()
+    assert len(trackers.get(fake, key, fetch)) == 50
+    assert ("CreateFilter", "PropertyCollector") not in fake.stats.calls
+    assert ("RetrievePropertiesEx", "PropertyCollector") not in fake.stats.calls
+    trackers.destroy()
+
+
+def test_trackers_are_bounded(monkeypatch):
+    fake = FakeVCenter(vms=20, hosts=2)
+    trackers = InventoryTrackers(max_trackers=2, idle=60)
+    clock = [1000.0]
+    monkeypatch.setattr(vmware_updates.time, "time", lambda: clock[0])
+
+    def get(paths):
+        key = ("retrieve_properties", vim.VirtualMachine, tuple(paths), None)
+        return trackers.get(
+            fake, key, lambda: retrieve_properties(fake, vim.VirtualMachine, paths)
+        )
+
+    get(["name"])
+    get(["runtime.powerState"])
+    get(["name"])
+    fake.stats.reset()
+    # the least recently used tracker makes room
+    get(["config.template"])
+    assert fake.stats.calls[("DestroyPropertyCollector", "PropertyCollector")] == 1
+    assert [list(key[2]) for key in trackers._trackers] == [["name"], ["config.template"]]
+
+    # trackers not used for a while are destroyed
+    clock[0] += 30
+    get(["name"])
+    clock[0] += 45
+    fake.stats.reset()
+    trackers.expire()
+    assert fake.stats.calls[("DestroyPropertyCollector", "PropertyCollector")] == 1
+    assert [list(key[2]) for key in trackers._trackers] == [["name"]]
+    trackers.destroy()
+    assert not trackers._trackers
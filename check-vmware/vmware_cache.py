@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Inventory snapshot cache shared by concurrent check processes.
+
+Bulk property retrievals of a whole object type (all datastores, all
+networks...) are stored in a local SQLite file keyed by vcenter and query,
+and reused until they are older than the TTL. The first process to find a
+stale or missing entry refreshes it while holding a file lock, the processes
+started at the same time wait for that lock and then read the fresh entry
+instead of all querying vcenter.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from pyVmomi import SoapAdapter, VmomiSupport
+from pyVmomi.VmomiSupport import DataObject, ManagedObject
+
+DEFAULT_PATH = "/var/lib/shinken/vmware-inventory.db"
+
+
+class InventoryCache(object):
+    """ TTL cache of property retrieval results, see retrieve_properties. """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=60, logger=None):
+        self.path = path
+        self.ttl = ttl
+        self.logger = logger
+        self._db = sqlite3.connect(path, timeout=30)
+        # readers do not block the refreshing writer and vice versa
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "vcenter TEXT, key TEXT, fetched REAL, payload TEXT, PRIMARY KEY (vcenter, key))"
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def get(self, system, key, fetch):
+        """ The cached value of key (a retrieval described as a tuple) for this vcenter, or
+            fetch() stored as the new value when the entry is missing or older than the TTL. """
+        vcenter = system.hostname
+        key = "|".join(_key_part(part) for part in key)
+        start = time.time()
+        entry = self._read(vcenter, key)
+        if entry and start - entry[0] < self.ttl:
+            return self._hit(system, vcenter, key, entry, start)
+
+        with open(self._lock_path(vcenter, key), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # another process may have refreshed the entry while we waited for the lock
+                entry = self._read(vcenter, key)
+                if entry and time.time() - entry[0] < self.ttl:
+                    return self._hit(system, vcenter, key, entry, start)
+                value = fetch()
+                fetched = time.time()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)",
+                    (vcenter, key, fetched, json.dumps(value, default=_encode))
+                )
+                self._db.commit()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._log(
+            "Inventory cache refresh for %s %s took %.3fs (%d objects)",
+            vcenter, key, fetched - start, len(value)
+        )
+        return value
+
+    def _hit(self, system, vcenter, key, entry, start):
+        fetched, payload = entry
+        stub = _LazyStub(system)
+        value = json.loads(payload, object_hook=lambda obj: _decode(obj, stub))
+        self._log(
+            "Inventory cache hit for %s %s, %.0fs old, read in %.3fs",
+            vcenter, key, start - fetched, time.time() - start
+        )
+        return value
+
+    def _read(self, vcenter, key):
+        return self._db.execute(
+            "SELECT fetched, payload FROM snapshots WHERE vcenter = ? AND key = ?", (vcenter, key)
+        ).fetchone()
+
+    def _lock_path(self, vcenter, key):
+        digest = hashlib.sha1("{}|{}".format(vcenter, key).encode("utf-8")).hexdigest()[:16]
+        return "{}.{}.lock".format(self.path, digest)
+
+    def _log(self, msg, *args):
+        if self.logger:
+            self.logger.info(msg, *args)
+
+
+class _LazyStub(object):
+    """ Stub for managed objects read back from the cache. It only logs in to vcenter if a
+        property that was not cached is read off one of them. """
+    # read by the deserializer, cached objects are always serialized with the default version
+    version = None
+
+    def __init__(self, system):
+        self._system = system
+
+    def __getattr__(self, name):
+        return getattr(self._system.service_instance._stub, name)
+
+
+def _key_part(part):
+    if isinstance(part, type):
+        return part.__name__
+    if isinstance(part, tuple):
+        return ",".join(part)
+    return str(part)
+
+
+def _encode(value):
+    if isinstance(value, ManagedObject):
+        return {"__mo__": [VmomiSupport.GetVmodlName(value.__class__), value._moId]}
+    if isinstance(value, DataObject):
+        xml = SoapAdapter.Serialize(value).decode("utf-8")
+        return {"__do__": [VmomiSupport.GetVmodlName(value.__class__), xml]}
+    raise TypeError("{!r} can not be cached".format(value))
+
+
+def _decode(obj, stub):
+    if "__mo__" in obj:
+        name, moid = obj["__mo__"]
+        return VmomiSupport.GetVmodlType(name)(moid, stub)
+    if "__do__" in obj:
+        name, xml = obj["__do__"]
+        return SoapAdapter.Deserialize(xml, VmomiSupport.GetVmodlType(name), stub)
+    return obj
+
+
+def default_path(local):
+    """ Cache file next to the checks when testing locally, like the log file. """
+    return os.path.join(os.getcwd(), "vmware-inventory.db") if local else DEFAULT_PATH
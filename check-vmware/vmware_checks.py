@@ -5,525 +5,805 @@ These are the functions to check vmware hosts through the
 vcenter API.
 Checks against a host begin with "check_host"
 Checks against vcenter begin with "check_system"
-"""
-import subprocess
-import sys
+Every check returns a CheckResult, the caller decides how to report it.
 
+Most checks are defined declaratively in DEFINITIONS: the object type they
+read, the property paths they need and a classify_* function of the fetched
+values, see vmware_planner. The check_* functions of CHECKS run them alone.
+"""
+from collections import Counter, OrderedDict
 from pyVmomi import vim
+from vmware_collector import (
+    Snapshot,
+    retrieve_properties,
+    retrieve_related_properties,
+    unwrap
+)
+from vmware_connection import VM_PROPERTIES, VirtualMachine
+from vmware_planner import collect, define, object_system, plan
+from vmware_status import CRITICAL, OK, STATUS_LABELS, UNKNOWN, WARNING, CheckResult
+
+VM_CONNECTION_PROPERTIES = ["name", "summary.runtime.connectionState"]
+VM_POWER_STATES = ["poweredOn", "poweredOff", "suspended"]
+
+# tasks read per call from the task history
+TASK_PAGE_SIZE = 100
 
 #----------------------------- HOST LEVEL CHECKS -----------------------------------------------#
-def check_host_overall_status(host, **kwargs):
+def classify_host_overall_status(host, **kwargs):
     """ Check overall host status. """
     logger = kwargs["logger"]
-    status = host.overallStatus
+    status = host.get("overallStatus")
     # determine ok, warning, critical, unknown state
     if status == "green":
-        msg = "Ok: overall status of host {} is {}".format(host.name, status)
+        msg = "Ok: overall status of host {} is {}".format(host["name"], status)
         logger.info(msg)
-        print(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
     elif status == "yellow":
-        msg = "Warning: esxi host {} may have a problem.".format(host.name)
+        msg = "Warning: esxi host {} may have a problem.".format(host["name"])
         logger.warning(msg)
-        print(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif status == "red":
-        msg = "Critical: esxi host {} definitely has a problem".format(host.name)
+        msg = "Critical: esxi host {} definitely has a problem".format(host["name"])
         logger.error(msg)
-        print(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
-        msg = "Unknown: status of esxi host {} is unknown".format(host.name)
+        msg = "Unknown: status of esxi host {} is unknown".format(host["name"])
         logger.info(msg)
-        print(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
 
 
-def check_host_cpu_usage(host, warn=0.75, crit=0.9, **kwargs):
+def classify_host_cpu_usage(host, warn=0.75, crit=0.9, **kwargs):
+    """ Check cpu usage of the host. """
     logger = kwargs["logger"]
     warn = float(warn)
     crit = float(crit)
 
-    cpu_usage = float(host.summary.quickStats.overallCpuUsage)
-    cpu_total = float((host.hardware.cpuInfo.hz / 1024 / 1024) * host.hardware.cpuInfo.numCpuCores)
+    # both in MHz
+    cpu_usage = float(host["summary.quickStats.overallCpuUsage"])
+    cpu_total = float(host["summary.hardware.cpuMhz"] * host["summary.hardware.numCpuCores"])
 
     cpu_frac = round(cpu_usage / cpu_total, 3)
     cpu_pct = cpu_frac * 100
+    record_sample(kwargs, "cpu_frac", host["name"], cpu_frac)
+    warn, crit = object_thresholds(kwargs, "host", host["name"], warn, crit)
 
     if cpu_frac < warn:
         msg = "Ok: cpu usage is {}%.".format(cpu_pct)
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
     elif cpu_frac < crit:
         msg = "Warning: cpu usage is {}% ".format(cpu_pct)
-        print(msg)
         logger.warning(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif cpu_frac > crit:
         msg = ("Critical: cpu usage is {}%".format(cpu_pct))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
-        msg = ("Unknown: cpu usage is unknown on host {}".format(host.name))
-        print(msg)
+        msg = ("Unknown: cpu usage is unknown on host {}".format(host["name"]))
         logger.info(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
 
 
-def check_host_datastore_accessibility(host, **kwargs):
+def classify_host_datastore_accessibility(host, **kwargs):
     """ Check that the datastores are accessible to the host. This check has only two states"""
     logger = kwargs["logger"]
     okay, critical, all_items = [], [], []
-    datastores = host.datastore
+    datastores = host["datastore"]
     for datastore in datastores:
-        accessible = datastore.summary.accessible
+        name, accessible = datastore["name"], datastore.get("summary.accessible")
         if accessible:
-            okay.append((datastore.name, "accessible"))
+            okay.append((name, "accessible"))
         else:
-            critical.append((datastore.name, "inaccessible"))
-        all_items.append((datastore.name, "accessible" if accessible else "inaccessible"))
+            critical.append((name, "inaccessible"))
+        all_items.append((name, "accessible" if accessible else "inaccessible"))
     if critical:
         msg = ("Critical: The following datastores are inaccessible: {}".format(critical))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
         msg = ("Okay: All datastores connected to this host are accessible")
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
-def check_host_datastore_status(host, **kwargs):
+def classify_host_datastore_status(host, **kwargs):
     """ Check the status of all the datastores on the host. """
     logger = kwargs["logger"]
     okay, warning, critical, unknown, all_items = [], [], [], [], []
-    datastores = host.datastore
+    datastores = host["datastore"]
     for datastore in datastores:
-        status = datastore.overallStatus
+        name, status = datastore["name"], datastore.get("overallStatus")
         if status == "green":
-            okay.append((datastore.name, status))
+            okay.append((name, status))
         elif status == "yellow":
-            warning.append((datastore.name, status))
+            warning.append((name, status))
         elif status == "red":
-            critical.append((datastore.name, status))
+            critical.append((name, status))
         else:
-            unknown.append((datastore.name, status))
-        all_items.append((datastore.name, status))
+            unknown.append((name, status))
+        all_items.append((name, status))
 
     if critical:
         msg = ("Critical: the following datastore(s) definitely have an issue: {}\n "
                "Status of all datastores is: {}".format(critical, all_items))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     elif warning:
         msg = ("Warning: the following datastore(s) may have an issue: {}\n "
                "Status of all datastores is: {}".format(warning, all_items))
-        print(msg)
         logger.warning(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif unknown:
         msg = ("Unknown: the following datastore(s) are in an unknown state: {}\n"
                "Status of all datastores is: {}".format(unknown, all_items))
-        print(msg)
         logger.info(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
     else:
         msg = ("Ok: all datastore(s) are in the green state: {}".format(okay))
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
-def check_host_datastore_usage(host, warn=0.75, crit=0.9, **kwargs):
+def classify_host_datastore_usage(host, warn=0.75, crit=0.9, **kwargs):
     """ Check the usage of all the datastores on the host. """
     logger = kwargs["logger"]
     warn = float(warn)
     crit = float(crit)
     okay, warning, critical, unknown, all_items = [], [], [], [], []
 
-    datastores = host.datastore
+    datastores = host["datastore"]
     for datastore in datastores:
-        freespace = float(datastore.summary.freeSpace)
-        totalspace = float(datastore.summary.capacity)
+        name = datastore["name"]
+        freespace = float(datastore["summary.freeSpace"])
+        totalspace = float(datastore["summary.capacity"])
         
         try:
             usage = round(1 - (freespace / totalspace), 3)
         except ZeroDivisionError:
             continue
+        record_sample(kwargs, "datastore_usage", name, usage)
+        datastore_warn, datastore_crit = object_thresholds(kwargs, "datastore", name, warn, crit)
         
         pct = str(usage * 100) + "%"
-        if usage < warn:
-            okay.append((datastore.name, pct))
-        elif usage < crit:
-            warning.append((datastore.name, pct))
-        elif usage > crit:
-            critical.append((datastore.name, pct))
+        if usage < datastore_warn:
+            okay.append((name, pct))
+        elif usage < datastore_crit:
+            warning.append((name, pct))
+        elif usage > datastore_crit:
+            critical.append((name, pct))
         else:
-            unknown.append((datastore.name, pct))
-        all_items.append((datastore.name, pct))
+            unknown.append((name, pct))
+        all_items.append((name, pct))
 
     if critical:
         msg = ("Critical: the following datastore(s) are in critical usage: {}\n "
                "Usage of all datastores is: {}".format(critical, all_items))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     elif warning:
         msg = ("Warning: the following datastore(s) have high usage: {}\n "
                "Usage of all datastores is: {}".format(warning, all_items))
-        print(msg)
         logger.warning(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif unknown:
         msg = ("Unknown: the following datastore(s) have unknown usage: {}\n"
                "Usage of all datastores is: {}".format(unknown, all_items))
-        print(msg)
         logger.info(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
     else:
         msg = ("Ok: all datastore(s) have ample space: {}".format(okay))
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
-def check_host_memory_usage(host, warn=0.75, crit=0.9, **kwargs):
+def classify_host_memory_usage(host, warn=0.75, crit=0.9, **kwargs):
     """ Check memory usage of the host. """
     logger = kwargs["logger"]
     warn = float(warn)
     crit = float(crit)
 
-    mem_usage = float(host.summary.quickStats.overallMemoryUsage)
-    mem_total = float(host.hardware.memorySize / 1024 / 1024)
+    mem_usage = float(host["summary.quickStats.overallMemoryUsage"])
+    mem_total = float(host["summary.hardware.memorySize"] / 1024 / 1024)
 
     mem_frac = round(mem_usage / mem_total, 3)
     mem_pct = mem_frac * 100
+    record_sample(kwargs, "mem_frac", host["name"], mem_frac)
+    warn, crit = object_thresholds(kwargs, "host", host["name"], warn, crit)
 
     if mem_frac < warn:
         msg = ("Ok: memory usage is {}%.".format(mem_pct))
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
     elif mem_frac < crit:
         msg = ("Warning: memory usage is {}% ".format(mem_pct))
-        print(msg)
         logger.warning(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif mem_frac > crit:
         msg = ("Critical: memory usage is {}%".format(mem_pct))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
-        msg = ("Unknown: memory usage is unknown on host {}".format(host.name))
-        print(msg)
+        msg = ("Unknown: memory usage is unknown on host {}".format(host["name"]))
         logger.info(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
 
 
 #--------------- SYSTEM LEVEL CHECKS -------------------------------------------------------#
-def check_system_datastore_status(system, **kwargs):
+def classify_system_datastore_status(datastores, **kwargs):
     """ Check the status of all the datastores on vcenter. """
     logger = kwargs["logger"]
     okay, warning, critical, unknown, all_items = [], [], [], [], []
-    datastores = [
-        system.get_obj(vim.Datastore, datastore) for datastore in system.list_datastore()
-    ]
     for datastore in datastores:
-        status = datastore.overallStatus
+        name, status = datastore["name"], datastore.get("overallStatus")
         if status == "green":
-            okay.append((datastore.name, status))
+            okay.append((name, status))
         elif status == "yellow":
-            warning.append((datastore.name, status))
+            warning.append((name, status))
         elif status == "red":
-            critical.append((datastore.name, status))
+            critical.append((name, status))
         else:
-            unknown.append((datastore.name, status))
-        all_items.append((datastore.name, status))
+            unknown.append((name, status))
+        all_items.append((name, status))
 
     if critical:
         msg = ("Critical: the following datastore(s) definitely have an issue: {}\n "
                "Status of all datastores is: {}".format(critical, all_items))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     elif warning:
         msg = ("Warning: the following datastore(s) may have an issue: {}\n "
                "Status of all datastores is: {}".format(warning, all_items))
-        print(msg)
         logger.warning(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif unknown:
         msg = ("Unknown: the following datastore(s) are in an unknown state: {}\n"
                "Status of all datastores is: {}".format(unknown, all_items))
-        print(msg)
         logger.info(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
     else:
         msg = ("Ok: all datastore(s) are in the green state: {}".format(okay))
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
-def check_system_datastore_usage(system, warn=0.75, crit=0.9, **kwargs):
+def classify_system_datastore_usage(datastores, warn=0.75, crit=0.9, **kwargs):
     """ Check the usage of all the datastores on vcenter. """
     logger = kwargs["logger"]
     warn = float(warn)
     crit = float(crit)
 
     okay, warning, critical, unknown, all_items = [], [], [], [], []
-    datastores = [
-        system.get_obj(vim.Datastore, datastore) for datastore in system.list_datastore()
-    ]
-
     for datastore in datastores:
-        freespace = float(datastore.summary.freeSpace)
-        totalspace = float(datastore.summary.capacity)
+        # capacity and freeSpace are only valid while the datastore is accessible
+        if not datastore.get("summary.accessible"):
+            continue
+        name = datastore["name"]
+        freespace = float(datastore.get("summary.freeSpace", 0))
+        totalspace = float(datastore.get("summary.capacity", 0))
 
         try:
             usage = round(1 - (freespace / totalspace), 3)
         except ZeroDivisionError:
             continue
+        record_sample(kwargs, "datastore_usage", name, usage)
+        datastore_warn, datastore_crit = object_thresholds(kwargs, "datastore", name, warn, crit)
 
         pct = str(usage * 100) + "%"
-        if usage < warn:
-            okay.append((datastore.name, pct))
-        elif usage < crit:
-            warning.append((datastore.name, pct))
-        elif usage > crit:
-            critical.append((datastore.name, pct))
+        if usage < datastore_warn:
+            okay.append((name, pct))
+        elif usage < datastore_crit:
+            warning.append((name, pct))
+        elif usage > datastore_crit:
+            critical.append((name, pct))
         else:
-            unknown.append((datastore.name, pct))
-        all_items.append((datastore.name, pct))
+            unknown.append((name, pct))
+        all_items.append((name, pct))
 
     if critical:
         msg = ("Critical: the following datastore(s) are in critical usage: {}\n "
                "Usage of all datastores is: {}".format(critical, all_items))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     elif warning:
         msg = ("Warning: the following datastore(s) have high usage: {}\n "
                "Usage of all datastores is: {}".format(warning, all_items))
-        print(msg)
         logger.warning(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif unknown:
         msg = ("Unknown: the following datastore(s) have unknown usage: {}\n"
                "Usage of all datastores is: {}".format(unknown, all_items))
-        print(msg)
         logger.info(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
     else:
         msg = "Ok: all datastore(s) have ample space: {}".format(okay)
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
-def check_system_ping_vms(system, **kwargs):
+def classify_system_datastore_forecast(datastores, warn=30, crit=7, **kwargs):
+    """ Check the days left until each datastore on vcenter is full, extrapolated from its
+        usage over the past week. warn and crit are numbers of days. """
+    logger = kwargs["logger"]
+    warn = float(warn)
+    crit = float(crit)
+    # vmware_forecast is only imported by this check
+    from vmware_forecast import forecast
+
+    datastores = [
+        datastore for datastore in datastores
+        if datastore.get("summary.accessible") and datastore.get("summary.capacity")
+    ]
+    okay, warning, critical, unknown, all_items = [], [], [], [], []
+    for item in forecast(datastores):
+        if item.per_day is None:
+            unknown.append((item.name, "no usage history"))
+            all_items.append((item.name, "no usage history"))
+            continue
+        trend = "{}% used".format(round(item.usage * 100, 1))
+        if item.days_to_full is None:
+            trend += ", not growing"
+            okay.append((item.name, trend))
+        else:
+            days = round(item.days_to_full, 1)
+            trend += ", full in {} days".format(days)
+            if days > warn:
+                okay.append((item.name, trend))
+            elif days > crit:
+                warning.append((item.name, trend))
+            else:
+                critical.append((item.name, trend))
+        all_items.append((item.name, trend))
+
+    if critical:
+        msg = ("Critical: the following datastore(s) are full in {} days or less: {}\n "
+               "Forecast of all datastores is: {}".format(crit, critical, all_items))
+        logger.error(msg)
+        return CheckResult(CRITICAL, msg)
+    elif warning:
+        msg = ("Warning: the following datastore(s) are full in {} days or less: {}\n "
+               "Forecast of all datastores is: {}".format(warn, warning, all_items))
+        logger.warning(msg)
+        return CheckResult(WARNING, msg)
+    elif unknown:
+        msg = ("Unknown: the following datastore(s) have no usage history: {}\n"
+               "Forecast of all datastores is: {}".format(unknown, all_items))
+        logger.info(msg)
+        return CheckResult(UNKNOWN, msg)
+    else:
+        msg = "Ok: all datastore(s) keep ample space for more than {} days: {}".format(
+            warn, okay
+        )
+        logger.info(msg)
+        return CheckResult(OK, msg)
+
+
+def classify_system_ping_vms(vms, **kwargs):
     """ This checks the ping of all running VMs, no warning state for this check"""
-    # TODO: speed this check up
     logger = kwargs["logger"]
-    vms = system.list_vms()
+    running = []
+
+    def targets():
+        # read like VSphereSystem.list_vms does
+        for vm in (VirtualMachine(properties) for properties in vms):
+            if not vm.template and vm.state == "VmState.RUNNING" and vm.ip:
+                running.append((vm.name, vm.ip))
+                yield vm.ip
+
+    # all the VMs are pinged concurrently, asyncio is only imported by the checks that ping.
+    # Streamed VMs are pinged as their pages arrive
+    from vmware_ping import ping_all
+
+    statuses = ping_all(targets(), logger=logger)
 
     okay, critical, all_items = [], [], []
-    for vm in vms:
-        if vm.state == "VmState.RUNNING" and vm.ip:
-            status = test_ping(vm.ip)
-            if status == "Up":
-                okay.append((vm.name, vm.ip, status))
-            else:
-                critical.append((vm.name, vm.ip, status))
-            all_items.append((vm.name, vm.ip, status))
+    for name, ip in running:
+        status = statuses[ip]
+        if status == "Up":
+            okay.append((name, ip, status))
+        else:
+            critical.append((name, ip, status))
+        all_items.append((name, ip, status))
 
     if critical:
         msg = ("Critical: the following VMs are inaccessible: {}".format(critical))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
         msg = "Okay: all running VMs that have IPs are accessible"
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
-def check_system_connection_vms(system, **kwargs):
+def classify_system_connection_vms(vms, **kwargs):
     """ This checks the connection of all running VMs, no warning state for this check. This
         check will report if VMs are disconnected, inaccessible, invalid or orphaned. All of
         which will return a critical status. """
     logger = kwargs["logger"]
-    vms = system.get_obj_list(vim.VirtualMachine)
-
-    okay, critical, all_items = [], [], []
+    # vms may be streamed page by page, only the VMs that are not connected are kept
+    critical = []
     for vm in vms:
-        status = vm.summary.runtime.connectionState
-        if status == "connected":
-            okay.append((vm.name, status))
-        else:
-            critical.append((vm.name, status))
-        all_items.append((vm.name, status))
+        name, status = vm["name"], vm.get("summary.runtime.connectionState")
+        if status != "connected":
+            critical.append((name, status))
 
     if critical:
         msg = ("Critical: the following VMs are not connected: {}".format(critical))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
         msg = "Okay: all VMs are connected"
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
-def check_system_network_accessibility(system, **kwargs):
+def classify_system_network_accessibility(networks, **kwargs):
     """ Check that the network(s) is(are) accessible """
     logger = kwargs["logger"]
     okay, critical, all_items = [], [], []
 
-    networks = system.get_obj_list(vim.Network)
     for network in networks:
-        accessible = network.summary.accessible
+        name, accessible = network["name"], network.get("summary.accessible")
         if accessible:
-            okay.append((network.name, "accessible"))
+            okay.append((name, "accessible"))
         else:
-            critical.append((network.name, "inaccessible"))
-        all_items.append((network.name, "accessible" if accessible else "inaccessible"))
+            critical.append((name, "inaccessible"))
+        all_items.append((name, "accessible" if accessible else "inaccessible"))
     if critical:
         msg = ("Critical: The following networks are inaccessible: {}".format(critical))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
         msg = "Okay: All networks defined on this vcenter are accessible"
-        print(msg)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
-def check_system_recent_tasks(system, warn=7, crit=15, **kwargs):
+def check_system_recent_tasks(system, warn=7, crit=15, task_cursor=None, **kwargs):
+    """ Count the tasks that completed with an error in the past 10 minutes or, with a
+        vmware_cursor.TaskCursor, since the previous run. """
     logger = kwargs["logger"]
     warn, crit = int(warn), int(crit)
+    now = None
+    if task_cursor is not None:
+        # read up to the time the run started, a task failing while it runs is left to the
+        # next run
+        now = system.service_instance.CurrentTime()
+    if task_cursor is None or task_cursor.time is None:
+        # recentTask gets all tasks from 10 min - Present, their info is read in one call
+        tasks = retrieve_related_properties(
+            system, system.content.taskManager, "recentTask", vim.Task, ["info"]
+        )
+        failed = [
+            task["info"] for task in tasks if task.get("info") and task["info"].error and
+            (now is None or task["info"].completeTime <= now)
+        ]
+        period = "in past 10 minutes"
+    else:
+        failed = failed_tasks_since(system, task_cursor.time, now)
+        period = "since {}".format(task_cursor.time.isoformat())
+    if task_cursor is not None:
+        failed = [info for info in failed if task_cursor.is_new(info)]
+        task_cursor.advance(now, failed)
+
     # initialize empty list of tasks that have thrown an error
     error = []
-    # get recent system tasks (recentTask gets all tasks from 10 min - Present)
-    tasks = system.service_instance.content.taskManager.recentTask
-
-    for task in tasks:
-        if task.info.error:
-            try:
-                # not all tasks have a faultMessage
-                error_info = getattr(
-                    getattr(task.info.error, "faultMessage", [None])[0], "message", ""
-                )
-            except Exception:
-                error_info = getattr(task.info, "msg", "")
-
-            error.append((
-                getattr(task.info, "descriptionId", ""),
-                getattr(task.info, "state", ""),
-                getattr(task.info, "entityName", ""),
-                error_info,
-                task.info.completeTime.isoformat()
-            ))
+    for info in failed:
+        try:
+            # not all tasks have a faultMessage
+            error_info = getattr(getattr(info.error, "faultMessage", [None])[0], "message", "")
+        except Exception:
+            error_info = getattr(info, "msg", "")
 
+        error.append((
+            getattr(info, "descriptionId", ""),
+            getattr(info, "state", ""),
+            getattr(info, "entityName", ""),
+            error_info,
+            info.completeTime.isoformat()
+        ))
+
+    record_sample(kwargs, "failed_tasks", None, len(error))
     if len(error) > crit:
         msg = ("Critical: More than {} tasks have errors: \n {}".format(crit, error))
-        print(msg)
         logger.error(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     elif len(error) > warn:
         msg = ("Warning: More than {} tasks have errors: \n {}".format(warn, error))
-        print(msg)
         logger.warning(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     else:
-        msg = "Okay: Less than {} tasks in past 10 minutes completed without error".format(warn)
-        print(msg)
+        msg = "Okay: Less than {} tasks {} completed without error".format(warn, period)
         logger.info(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
 
 
 #----------------------------- VM/Template(SYSTEM) LEVEL CHECKS -----------------------------#
-def check_vm_count(system, warn=20, crit=30, **kwargs):
+def classify_vm_count(vms, warn=20, crit=30, **kwargs):
     """ Check count of VMs. """
     logger = kwargs["logger"]
     warn = int(warn)
     crit = int(crit)
-    vm_count = len(system.list_vms())
+    counts = count_vms(vms)
+    vm_count = counts["vms"]
+    record_sample(kwargs, "vm_count", None, vm_count)
+    breakdown = ", ".join(
+        "{} {}".format(counts[state], state) for state in VM_POWER_STATES if counts[state]
+    )
     # determine ok, warning, critical, unknown state
     if vm_count < warn:
-        msg = ("Ok: VM count is less than {}. VM Count = {}".format(warn, vm_count))
+        msg = ("Ok: VM count is less than {}. VM Count = {} ({})".format(warn, vm_count, breakdown))
         logger.info(msg)
-        print(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
     elif warn <= vm_count <= crit:
-        msg = ("Warning: VM count is greater than {} & less than {}. VM Count = {}"
-            .format(warn, crit, vm_count))
+        msg = ("Warning: VM count is greater than {} & less than {}. VM Count = {} ({})"
+            .format(warn, crit, vm_count, breakdown))
         logger.warning(msg)
-        print(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif vm_count > crit:
-        msg = ("Critical: VM count is greater than {}. VM Count = {}".format(crit, vm_count))
+        msg = ("Critical: VM count is greater than {}. VM Count = {} ({})".format(
+            crit, vm_count, breakdown
+        ))
         logger.error(msg)
-        print(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
         msg = ("Unknown: VM count is unknown")
         logger.info(msg)
-        print(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
 
 
-def check_template_count(system, warn=20, crit=30, **kwargs):
+def classify_template_count(vms, warn=20, crit=30, **kwargs):
     """ Check count of templates. """
     logger = kwargs["logger"]
     warn = int(warn)
     crit = int(crit)
-    template_count = len(system.list_templates())
+    template_count = count_vms(vms)["templates"]
+    record_sample(kwargs, "template_count", None, template_count)
     # determine ok, warning, critical, unknown state
     if template_count < warn:
         msg = ("Ok: Template count is less than {}. Template Count = {}".format(warn, template_count))
         logger.info(msg)
-        print(msg)
-        sys.exit(0)
+        return CheckResult(OK, msg)
     elif warn <= template_count <= crit:
         msg = ("Warning: Template count is greater than {} & less than {}. Template Count = {}"
             .format(warn, crit, template_count))
         logger.warning(msg)
-        print(msg)
-        sys.exit(1)
+        return CheckResult(WARNING, msg)
     elif template_count > crit:
         msg = ("Critical: Template count is greater than {}. Template Count = {}".format(crit, template_count))
         logger.error(msg)
-        print(msg)
-        sys.exit(2)
+        return CheckResult(CRITICAL, msg)
     else:
         msg = ("Unknown: Template count is unknown")
         logger.info(msg)
-        print(msg)
-        sys.exit(3)
+        return CheckResult(UNKNOWN, msg)
 
 
 #----------- UTILITY FUNCTION ---------------------------------------------#
-def test_ping(ip):
-    # TODO: faster implementation of this?
-    pingstatus = "Up"
+def count_vms(vms):
+    """ Tally the VMs by power state, and the templates, from their config.template and
+        runtime.powerState instead of building a VM wrapper per object. Like wrapanapi's
+        list_vms and list_templates, the inaccessible VMs and those without a config (e.g.
+        still being created) are not counted. Returns a Counter with "vms", "templates" and
+        the VM power states (e.g. "poweredOn"). """
+    counts = Counter()
+    for vm in vms:
+        if vm.get("summary.runtime.connectionState") == "inaccessible":
+            continue
+        template = vm.get("config.template")
+        if template is True:
+            counts["templates"] += 1
+        elif template is False:
+            counts["vms"] += 1
+            counts[vm.get("runtime.powerState")] += 1
+    return counts
+
+
+def record_sample(kwargs, metric, entity, value):
+    """ Append value to the samples option of a check, a vmware_samples.SampleStore, if it
+        was given. entity None stands for the vcenter. A sample that can not be recorded is
+        logged, it does not change the result of the check. """
+    samples = kwargs.get("samples")
+    if samples is None:
+        return
+    entity = samples.vcenter if entity is None else entity
     try:
-        subprocess.check_output(
-            "ping -c 1 -W 4 {}".format(ip),
-            shell=True,
-            stderr=subprocess.STDOUT
+        samples.append(metric, entity, value)
+    except (OSError, ValueError):
+        kwargs["logger"].warning("Unable to record the %s sample of %s", metric, entity,
+                                 exc_info=True)
+
+
+def object_thresholds(kwargs, kind, name, warn, crit):
+    """ The (warning, critical) thresholds of the kind object called name from the thresholds
+        option of a check, a vmware_thresholds.ThresholdRules, warn and crit without it. """
+    thresholds = kwargs.get("thresholds")
+    if thresholds is None:
+        return warn, crit
+    return thresholds.lookup(kind, name, warn, crit)
+
+
+def failed_tasks_since(system, since, until=None):
+    """ TaskInfo of the tasks that completed with an error since since (and up to until, when
+        given), read through a TaskHistoryCollector TASK_PAGE_SIZE tasks at a time. """
+    collector = system.content.taskManager.CreateCollector(vim.TaskFilterSpec(
+        state=["error"],
+        time=vim.TaskFilterSpec.ByTime(
+            timeType="completedTime", beginTime=since, endTime=until
         )
-    except subprocess.CalledProcessError:
-        pingstatus = "Down"
-    return pingstatus
+    ))
+    try:
+        infos = []
+        while True:
+            page = collector.ReadNext(TASK_PAGE_SIZE)
+            if not page:
+                return infos
+            infos.extend(page)
+    finally:
+        collector.Remove()
+
+
+def test_ping(ip):
+    from vmware_ping import ping_all
+
+    return ping_all([ip])[ip]
+
+
+def read_datastore_history(system, datastores):
+    """ The usage history of datastores, the history fetch of system_datastore_forecast. """
+    from vmware_forecast import read_history
+
+    return read_history(system, datastores)
+
+
+# name: the objects the check reads and its classifier, see vmware_planner
+DEFINITIONS = {
+    "host_status": define(
+        vim.HostSystem, ["name", "overallStatus"], classify_host_overall_status, per_object=True
+    ),
+    "host_cpu": define(
+        vim.HostSystem,
+        [
+            "name",
+            "summary.quickStats.overallCpuUsage",
+            "summary.hardware.cpuMhz",
+            "summary.hardware.numCpuCores",
+        ],
+        classify_host_cpu_usage,
+        per_object=True
+    ),
+    "host_memory": define(
+        vim.HostSystem,
+        ["name", "summary.quickStats.overallMemoryUsage", "summary.hardware.memorySize"],
+        classify_host_memory_usage,
+        per_object=True
+    ),
+    "host_datastore_accessibility": define(
+        vim.HostSystem, ["name"], classify_host_datastore_accessibility, per_object=True,
+        related=("datastore", vim.Datastore, ["name", "summary.accessible"])
+    ),
+    "host_datastore_status": define(
+        vim.HostSystem, ["name"], classify_host_datastore_status, per_object=True,
+        related=("datastore", vim.Datastore, ["name", "overallStatus"])
+    ),
+    "host_datastore_usage": define(
+        vim.HostSystem, ["name"], classify_host_datastore_usage, per_object=True,
+        related=("datastore", vim.Datastore, ["name", "summary.freeSpace", "summary.capacity"])
+    ),
+    "system_datastore_status": define(
+        vim.Datastore, ["name", "overallStatus"], classify_system_datastore_status
+    ),
+    "system_datastore_usage": define(
+        vim.Datastore,
+        ["name", "summary.accessible", "summary.freeSpace", "summary.capacity"],
+        classify_system_datastore_usage
+    ),
+    "system_datastore_forecast": define(
+        vim.Datastore,
+        ["name", "summary.accessible", "summary.freeSpace", "summary.capacity"],
+        classify_system_datastore_forecast, history=("history", read_datastore_history)
+    ),
+    "system_ping_vms": define(vim.VirtualMachine, VM_PROPERTIES, classify_system_ping_vms),
+    "system_connection_vms": define(
+        vim.VirtualMachine, VM_CONNECTION_PROPERTIES, classify_system_connection_vms
+    ),
+    "system_network_accessibility": define(
+        vim.Network, ["name", "summary.accessible"], classify_system_network_accessibility
+    ),
+    "vm_count": define(
+        vim.VirtualMachine,
+        ["config.template", "runtime.powerState", "summary.runtime.connectionState"],
+        classify_vm_count
+    ),
+    "template_count": define(
+        vim.VirtualMachine,
+        ["config.template", "summary.runtime.connectionState"],
+        classify_template_count
+    ),
+}
+
+
+def run_definition(name, target, **kwargs):
+    """ Run the check name of DEFINITIONS alone against target, the host for per object
+        checks, the system otherwise. kwargs are passed on to the classifier. """
+    definition = DEFINITIONS[name]
+    [fetch] = plan({name: definition})
+    if definition.per_object:
+        [values] = collect(object_system(target), fetch, objs=[target])
+    else:
+        values = collect(target, fetch)
+    return definition.classify(values, **kwargs)
+
+
+def check_host_overall_status(host, **kwargs):
+    """ Check overall host status. """
+    return run_definition("host_status", host, **kwargs)
+
+
+def check_host_cpu_usage(host, **kwargs):
+    """ Check cpu usage of the host. """
+    return run_definition("host_cpu", host, **kwargs)
+
+
+def check_host_memory_usage(host, **kwargs):
+    """ Check memory usage of the host. """
+    return run_definition("host_memory", host, **kwargs)
+
+
+def check_host_datastore_accessibility(host, **kwargs):
+    """ Check that the datastores are accessible to the host. """
+    return run_definition("host_datastore_accessibility", host, **kwargs)
+
+
+def check_host_datastore_status(host, **kwargs):
+    """ Check the status of all the datastores on the host. """
+    return run_definition("host_datastore_status", host, **kwargs)
+
+
+def check_host_datastore_usage(host, **kwargs):
+    """ Check the usage of all the datastores on the host. """
+    return run_definition("host_datastore_usage", host, **kwargs)
+
+
+def check_system_datastore_status(system, **kwargs):
+    """ Check the status of all the datastores on vcenter. """
+    return run_definition("system_datastore_status", system, **kwargs)
+
+
+def check_system_datastore_usage(system, **kwargs):
+    """ Check the usage of all the datastores on vcenter. """
+    return run_definition("system_datastore_usage", system, **kwargs)
+
+
+def check_system_datastore_forecast(system, **kwargs):
+    """ Check the usage of all the datastores on vcenter forecast from their history. """
+    return run_definition("system_datastore_forecast", system, **kwargs)
+
+
+def check_system_ping_vms(system, **kwargs):
+    """ Check the ping of all running VMs. """
+    return run_definition("system_ping_vms", system, **kwargs)
+
+
+def check_system_connection_vms(system, **kwargs):
+    """ Check the connection of all VMs. """
+    return run_definition("system_connection_vms", system, **kwargs)
+
+
+def check_system_network_accessibility(system, **kwargs):
+    """ Check that the networks are accessible. """
+    return run_definition("system_network_accessibility", system, **kwargs)
+
+
+def check_vm_count(system, **kwargs):
+    """ Check count of VMs. """
+    return run_definition("vm_count", system, **kwargs)
+
+
+def check_template_count(system, **kwargs):
+    """ Check count of templates. """
+    return run_definition("template_count", system, **kwargs)
 
 
 CHECKS = {
@@ -535,6 +815,7 @@ CHECKS = {
     "host_datastore_usage": check_host_datastore_usage,
     "system_datastore_status": check_system_datastore_status,
     "system_datastore_usage": check_system_datastore_usage,
+    "system_datastore_forecast": check_system_datastore_forecast,
     "system_ping_vms": check_system_ping_vms,
     "system_connection_vms": check_system_connection_vms,
     "system_network_accessibility": check_system_network_accessibility,
@@ -542,3 +823,299 @@ CHECKS = {
     "vm_count": check_vm_count,
     "template_count": check_template_count,
 }
+
+
+#----------- RUNNER -------------------------------------------------------#
+HOST_CHECKS = [name for name in CHECKS if name.startswith("host_")]
+SYSTEM_CHECKS = [name for name in CHECKS if not name.startswith("host_")]
+
+# worst first when several results are folded into one
+SEVERITY = [CRITICAL, WARNING, UNKNOWN, OK]
+
+# the unit of the warning and critical thresholds of the checks that have some. Every check
+# has its own default thresholds, -w/-c given for several checks have to fit all of them
+THRESHOLD_UNITS = {
+    "host_cpu": "fraction",
+    "host_memory": "fraction",
+    "host_datastore_usage": "fraction",
+    "system_datastore_usage": "fraction",
+    # fewer days is worse, the warning is above the critical threshold
+    "system_datastore_forecast": "days",
+    "system_tasks": "count",
+    "vm_count": "count",
+    "template_count": "count",
+}
+
+
+def run_definitions(system, definitions, objs=None, container=None, warn=None, crit=None,
+                    logger=None, **options):
+    """ Run definitions, a dict of name: Definition, from the fewest fetches, see
+        vmware_planner.plan. The per object checks run against each of objs, or of the objects
+        below container. Yields (values, name, CheckResult), values being the fetched values of
+        the object for per object checks and None for the others. A failed fetch gives
+        UNKNOWN, with None values, for the checks that needed it. """
+    for fetch in plan(definitions):
+        try:
+            items = collect(system, fetch, objs, container)
+        except Exception as e:
+            logger.error("Unable to fetch %s properties for %s", fetch.obj_type.__name__,
+                         ", ".join(fetch.names), exc_info=True)
+            for name in fetch.names:
+                yield None, name, CheckResult(
+                    UNKNOWN,
+                    "ERROR: exception '{}' occurred while fetching the properties of '{}', "
+                    "check logs for trace".format(e, name)
+                )
+            continue
+        if fetch.per_object:
+            for values in items:
+                for name in fetch.names:
+                    yield values, name, _call_check(
+                        definitions[name].classify, values, warn, crit, logger, **options
+                    )
+        else:
+            for name in fetch.names:
+                yield None, name, _call_check(
+                    definitions[name].classify, items, warn, crit, logger, **options
+                )
+
+
+def run_host_batch(system, measurements, container=None, warn=None, crit=None, logger=None,
+                   cache=None, hosts=None, **options):
+    """ Run the host measurements against every esxi host below container (default all hosts)
+        from a single bulk fetch, or only against the hosts called hosts, a list of names.
+        options are passed on to the checks (e.g. samples). Returns a list of (hostname,
+        measurement, CheckResult). """
+    snapshot = Snapshot(system, cache=cache)
+    definitions = OrderedDict((m, DEFINITIONS[m]) for m in measurements)
+    results = []
+    objs = None
+    if hosts is not None:
+        found = dict(
+            (item["name"], item["obj"])
+            for item in retrieve_properties(snapshot, vim.HostSystem, ["name"], container)
+        )
+        objs = [found[name] for name in hosts if name in found]
+        for name in hosts:
+            if name not in found:
+                results.extend(
+                    (name, measurement, result)
+                    for measurement, result in _unknown_host(system, name, measurements, logger)
+                )
+        if not objs:
+            return results
+    results.extend(
+        # a failed fetch is reported against the vcenter
+        (values["name"] if values else system.hostname, measurement, result)
+        for values, measurement, result in run_definitions(
+            snapshot, definitions, objs=objs, container=container, warn=warn, crit=crit,
+            logger=logger, **options
+        )
+    )
+    return results
+
+
+def run_measurement(system, measurement, hostname=None, warn=None, crit=None, logger=None):
+    """ Resolve the esxi host (for host checks) and run a single measurement against it.
+        Lookup failures and exceptions raised by the check are returned as UNKNOWN. """
+    return run_measurements(
+        system, [measurement], hostname=hostname, warn=warn, crit=crit, logger=logger
+    )[0][1]
+
+
+def run_measurements(system, measurements, hostname=None, warn=None, crit=None, logger=None,
+                     cache=None, host_index=None, **options):
+    """ Run several measurements against one snapshot of the host and system. The checks of
+        DEFINITIONS are planned together, so every object type is fetched once for all of them.
+        Inventory wide retrievals go through cache, an InventoryCache, when given. hostname is
+        resolved through host_index, a HostIndex, when given. The checks use their own default
+        thresholds where warn or crit is None. options are passed on to the checks (e.g.
+        task_cursor, samples). Returns a list of (measurement, CheckResult). """
+    error = threshold_error(measurements, warn, crit)
+    if error:
+        logger.error(error)
+        return [(measurement, CheckResult(UNKNOWN, error)) for measurement in measurements]
+    results = {}
+    for measurement in measurements:
+        if measurement not in CHECKS:
+            msg = "Error: measurement {} not understood".format(measurement)
+            logger.error(msg)
+            results[measurement] = CheckResult(UNKNOWN, msg)
+    known = [measurement for measurement in measurements if measurement not in results]
+    host_definitions = OrderedDict(
+        (m, DEFINITIONS[m]) for m in known if m in DEFINITIONS and DEFINITIONS[m].per_object
+    )
+    system_definitions = OrderedDict(
+        (m, DEFINITIONS[m]) for m in known if m in DEFINITIONS and not DEFINITIONS[m].per_object
+    )
+
+    # get the host object
+    host = None
+    # an indexed host is validated by the fetch of its properties, it reads the name anyway
+    indexed = bool(host_index and host_definitions)
+    if hostname and known:
+        host = host_index.get(system, hostname) if indexed else None
+        if host is None:
+            host = find_host(system, hostname, host_index)
+            indexed = False
+        if not host:
+            return _unknown_host(system, hostname, measurements, logger)
+
+    if len(known) > 1 or cache:
+        system = Snapshot(system, cache=cache)
+    check_options = dict(warn=warn, crit=crit, logger=logger, **options)
+    if host_definitions and host is None:
+        for measurement in host_definitions:
+            msg = "Error: measurement {} needs an esxi host (-H)".format(measurement)
+            logger.error(msg)
+            results[measurement] = CheckResult(UNKNOWN, msg)
+    elif host_definitions:
+        host_results = list(run_definitions(system, host_definitions, [host], **check_options))
+        if indexed and not (host_results and host_results[0][0] and
+                            host_results[0][0].get("name") == hostname):
+            # the host was removed or renamed since it was indexed
+            host_index.forget(hostname)
+            host = host_index.find(unwrap(system), hostname)
+            if host is None:
+                return _unknown_host(system, hostname, measurements, logger)
+            host_results = list(run_definitions(
+                system, host_definitions, [host], **check_options
+            ))
+        results.update((measurement, result) for _, measurement, result in host_results)
+    results.update(
+        (measurement, result)
+        for _, measurement, result in run_definitions(system, system_definitions, **check_options)
+    )
+
+    for measurement in known:
+        if measurement not in DEFINITIONS:
+            results[measurement] = _call_check(CHECKS[measurement], system, **check_options)
+    return [(measurement, results[measurement]) for measurement in measurements]
+
+
+def mixed_thresholds(measurements, warn=None, crit=None):
+    """ The error message when warn or crit is given for measurements with thresholds in
+        different THRESHOLD_UNITS, a fraction means nothing to a count. None otherwise. """
+    if warn is None and crit is None:
+        return None
+    units = OrderedDict()
+    for measurement in measurements:
+        if measurement in THRESHOLD_UNITS:
+            units.setdefault(THRESHOLD_UNITS[measurement], []).append(measurement)
+    if len(units) < 2:
+        return None
+    return "Error: one -w/-c can not fit the {}, run them separately or without -w/-c".format(
+        " and the ".join(
+            "{} thresholds of {}".format(unit, ", ".join(names)) for unit, names in units.items()
+        )
+    )
+
+
+def threshold_error(measurements, warn=None, crit=None):
+    """ The error message when warn and crit do not fit measurements: given for a mix of
+        units (see mixed_thresholds), or warn past crit. None otherwise. """
+    error = mixed_thresholds(measurements, warn, crit)
+    if error or None in (warn, crit):
+        return error
+    # the days left of the forecast count down
+    if "days" in (THRESHOLD_UNITS.get(m) for m in measurements):
+        if float(warn) < float(crit):
+            return "Error: warning value can not be less than critical value"
+    elif float(warn) > float(crit):
+        return "Error: warning value can not be greater than critical value"
+    return None
+
+
+def select_measurements(measurements, all_host_checks=False, all_system_checks=False):
+    """ measurements, a list of names, followed by every host and/or vcenter level check,
+        without duplicates, in the order given. [None] when there are none, which is reported
+        as a measurement not understood. """
+    selected = list(measurements)
+    if all_host_checks:
+        selected.extend(HOST_CHECKS)
+    if all_system_checks:
+        selected.extend(SYSTEM_CHECKS)
+    selected = [m for i, m in enumerate(selected) if m not in selected[:i]]
+    return selected or [None]
+
+
+def find_host(system, hostname, host_index=None):
+    """ The esxi host called hostname, None when there is none. With a host_index (a
+        vmware_hostindex.HostIndex) it is looked up through the SearchIndex of the vcenter
+        first and recorded in the index. """
+    if host_index is not None:
+        return host_index.find(system, hostname)
+    return system.get_obj(vim.HostSystem, hostname)
+
+
+def _unknown_host(system, hostname, measurements, logger):
+    msg = "Error: esxi hostname {} does not exist on vSphere {}".format(
+        hostname, system.hostname
+    )
+    logger.error(msg)
+    return [(measurement, CheckResult(UNKNOWN, msg)) for measurement in measurements]
+
+
+def fold_results(results, scope="", problems_only=False, details=()):
+    """ Fold results, (label, CheckResult) pairs, into one result in shinken's multi-line
+        output format: the worst status and a count line, e.g. "Critical: 4 checks run on 2
+        hosts, 1 critical, 0 warning, 0 unknown" where scope is " on 2 hosts", the lines of
+        details, then one "label - message" line per check, only for the non-ok ones with
+        problems_only. """
+    status = min((result.status for _, result in results), key=SEVERITY.index)
+    counts = Counter(result.status for _, result in results)
+    lines = ["{}: {} checks run{}, {}".format(
+        STATUS_LABELS[status], len(results), scope, ", ".join(
+            "{} {}".format(counts[state], label)
+            for state, label in ((CRITICAL, "critical"), (WARNING, "warning"), (UNKNOWN, "unknown"))
+        )
+    )]
+    lines.extend(details)
+    lines.extend(
+        "{} - {}".format(label, result.message)
+        for label, result in results if not problems_only or result.status != OK
+    )
+    return CheckResult(status, "\n".join(lines))
+
+
+def combine_results(results):
+    """ Fold (measurement, CheckResult) pairs into one result: a summary line with the worst
+        status, then one line per check. """
+    if len(results) == 1:
+        return results[0][1]
+    return fold_results(results)
+
+
+def summarize_batch(results):
+    """ One result for a host batch: the worst status, a count line and the non-ok checks. """
+    if not results:
+        return CheckResult(UNKNOWN, "Unknown: no esxi hosts found")
+    hosts = set(hostname for hostname, _, _ in results)
+    return fold_results(
+        [("{} {}".format(hostname, measurement), result)
+         for hostname, measurement, result in results],
+        " on {} hosts".format(len(hosts)), problems_only=True
+    )
+
+
+def _call_check(measure_func, target, warn, crit, logger, **options):
+    # without warn or crit the check keeps its own default
+    for name, value in (("warn", warn), ("crit", crit)):
+        if value is not None:
+            options[name] = value
+    try:
+        logger.info("Calling check %s", measure_func.__name__)
+        return measure_func(target, logger=logger, **options)
+    except Exception as e:
+        logger.error(
+            "Exception occurred during execution of %s",
+            measure_func.__name__,
+            exc_info=True
+        )
+        return CheckResult(
+            UNKNOWN,
+            "ERROR: exception '{}' occurred during execution of '{}', check logs for trace".format(
+                e,
+                measure_func.__name__
+            )
+        )
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Helpers to read managed object properties in bulk through the vcenter
+PropertyCollector. Reading a property off a pyVmomi managed object costs one
+round trip per object and property, these helpers fetch only the requested
+property paths for every object of a type in a constant number of calls.
+"""
+from pyVmomi import vim, vmodl
+from pyVmomi.VmomiSupport import ManagedObject
+
+PC = vmodl.query.PropertyCollector
+# objects per page when streaming with iter_properties
+PAGE_SIZE = 1000
+
+
+def retrieve_properties(system, obj_type, path_set, container=None):
+    """ Retrieve path_set for every obj_type object below container (default rootFolder).
+        Returns a list of dicts keyed by property path, the managed object is under "obj".
+        Properties vcenter did not return (e.g. unset optional values) are missing from the
+        dict, so use .get() on them. """
+    if isinstance(system, Snapshot):
+        key = ("retrieve_properties", obj_type, tuple(path_set), unwrap(container))
+        return system.memoize(key, lambda: system.cached(
+            key, lambda: retrieve_properties(system.target, obj_type, path_set, container)
+        ))
+    content = system.content
+    view = content.viewManager.CreateContainerView(
+        unwrap(container) or content.rootFolder, [obj_type], True
+    )
+    try:
+        return _collect(content.propertyCollector, view_filter_spec(view, obj_type, path_set))
+    finally:
+        view.Destroy()
+
+
+def iter_properties(system, obj_type, path_set, container=None, page_size=PAGE_SIZE):
+    """ Like retrieve_properties, but yields the objects as the pages of page_size objects
+        arrive instead of building the whole list, so memory stays bounded on large
+        inventories. Through a Snapshot with a cache the cached list is iterated. """
+    if isinstance(system, Snapshot):
+        if system.cache is not None:
+            for item in retrieve_properties(system, obj_type, path_set, container):
+                yield item
+            return
+        system = system.target
+    content = system.content
+    view = content.viewManager.CreateContainerView(
+        unwrap(container) or content.rootFolder, [obj_type], True
+    )
+    try:
+        for item in _iter_collect(
+            content.propertyCollector, view_filter_spec(view, obj_type, path_set), page_size
+        ):
+            yield item
+    finally:
+        view.Destroy()
+
+
+def view_filter_spec(view, obj_type, path_set):
+    """ FilterSpec selecting path_set on every object of a ContainerView. """
+    return PC.FilterSpec(
+        objectSet=[
+            PC.ObjectSpec(
+                obj=view,
+                skip=True,
+                selectSet=[
+                    PC.TraversalSpec(
+                        name="traverseView",
+                        path="view",
+                        skip=False,
+                        type=vim.view.ContainerView
+                    )
+                ]
+            )
+        ],
+        propSet=[PC.PropertySpec(type=obj_type, pathSet=list(path_set), all=False)]
+    )
+
+
+def retrieve_object_properties(system, objs, obj_type, path_set):
+    """ Retrieve path_set for an explicit list of obj_type objects in a single call, in the
+        same format as retrieve_properties. """
+    if isinstance(system, Snapshot):
+        return system.memoize(
+            ("retrieve_object_properties", tuple(unwrap(obj) for obj in objs), obj_type, tuple(path_set)),
+            lambda: retrieve_object_properties(system.target, objs, obj_type, path_set)
+        )
+    if not objs:
+        return []
+    filter_spec = PC.FilterSpec(
+        objectSet=[PC.ObjectSpec(obj=unwrap(obj), skip=False) for obj in objs],
+        propSet=[PC.PropertySpec(type=obj_type, pathSet=list(path_set), all=False)]
+    )
+    return _collect(system.content.propertyCollector, filter_spec)
+
+
+def retrieve_related_properties(system, obj, path, obj_type, path_set):
+    """ Retrieve path_set for the obj_type objects obj refers to in its path property (e.g. the
+        recentTask of the TaskManager) in a single call, in the same format as
+        retrieve_properties. """
+    if isinstance(system, Snapshot):
+        return system.memoize(
+            ("retrieve_related_properties", unwrap(obj), path, obj_type, tuple(path_set)),
+            lambda: retrieve_related_properties(system.target, obj, path, obj_type, path_set)
+        )
+    filter_spec = PC.FilterSpec(
+        objectSet=[
+            PC.ObjectSpec(
+                obj=unwrap(obj),
+                skip=True,
+                selectSet=[
+                    PC.TraversalSpec(name="traverse", path=path, skip=False, type=type(unwrap(obj)))
+                ]
+            )
+        ],
+        propSet=[PC.PropertySpec(type=obj_type, pathSet=list(path_set), all=False)]
+    )
+    return _collect(system.content.propertyCollector, filter_spec)
+
+
+def _collect(collector, filter_spec):
+    return list(_iter_collect(collector, filter_spec))
+
+
+def _iter_collect(collector, filter_spec, page_size=None):
+    result = collector.RetrievePropertiesEx([filter_spec], PC.RetrieveOptions(maxObjects=page_size))
+    while result:
+        try:
+            for obj_content in result.objects:
+                yield _to_dict(obj_content)
+        except GeneratorExit:
+            # the caller stopped early, free the rest of the result on the server
+            if result.token:
+                collector.CancelRetrievePropertiesEx(result.token)
+            raise
+        if not result.token:
+            break
+        result = collector.ContinueRetrievePropertiesEx(result.token)
+
+
+def _to_dict(obj_content):
+    item = {prop.name: prop.val for prop in obj_content.propSet}
+    item["obj"] = obj_content.obj
+    return item
+
+
+class Snapshot(object):
+    """ Read-through cache around a managed object or a VMWareSystem for the length of one run.
+        Every property read or method call on the target is done once and then shared by all the
+        checks evaluated against the snapshot. Managed objects reached through it are wrapped as
+        well, so host.datastore[0].summary is also only fetched once. properties can prime the
+        cache with values already fetched in bulk. cache optionally serves the whole inventory
+        retrievals, it has a get(system, key, fetch) method where key is the
+        ("retrieve_properties", obj_type, path_set, container) tuple, see vmware_cache and
+        vmware_updates. """
+
+    def __init__(self, target, properties=None, cache=None):
+        self.target = target
+        self.cache = cache
+        self._cache = {name: _wrap(value) for name, value in (properties or {}).items()}
+        self._memo = {}
+
+    def __getattr__(self, name):
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        value = getattr(self.target, name)
+        if callable(value) and not isinstance(value, ManagedObject):
+            value = self._memoized(value)
+        else:
+            value = _wrap(value)
+        self._cache[name] = value
+        return value
+
+    def __repr__(self):
+        return "Snapshot({!r})".format(self.target)
+
+    def memoize(self, key, func):
+        """ Return func() the first time key is seen, the cached value afterwards. """
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = func()
+            return value
+
+    def cached(self, key, func):
+        """ Like memoize, but through the on-disk inventory cache when there is one. """
+        if self.cache is None:
+            return func()
+        return self.cache.get(self.target, key, func)
+
+    def _memoized(self, method):
+        def call(*args, **kwargs):
+            key = (method.__name__, args, tuple(sorted(kwargs.items())))
+            return self.memoize(key, lambda: method(*args, **kwargs))
+        return call
+
+
+def unwrap(obj):
+    """ The object behind a Snapshot, pyVmomi calls type check their arguments. """
+    return obj.target if isinstance(obj, Snapshot) else obj
+
+
+def _wrap(value):
+    if isinstance(value, ManagedObject):
+        return Snapshot(value)
+    if isinstance(value, list) and value and isinstance(value[0], ManagedObject):
+        return [Snapshot(item) for item in value]
+    return value
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Lean vcenter connection built directly on pyVmomi.
+
+VSphereSystem offers the part of wrapanapi's VMWareSystem the checks use
+(get_obj, get_obj_list, list_vms, list_templates...) on top of a pyVmomi SOAP
+stub and bulk property retrievals. Importing it only loads pyVmomi, where
+wrapanapi pulls in pyvcloud and the rest of its dependency tree, which is a
+large share of the run time of a single check invocation. For the same
+reason it does not go through pyVim.connect.SmartConnect, which imports
+requests only to download the list of API versions the server supports.
+
+The http side is set by a Transport: gzip compressed responses (the XML of
+property retrievals is very repetitive), connections kept open between
+calls, and TLS sessions resumed by the next connections of the process to
+the same vcenter, which skips the key exchange. The version negotiation and
+the session share one connection, so a check makes a single TLS handshake.
+bench_transport.py compares the transports.
+"""
+import http.client
+import ssl
+import threading
+
+from collections import namedtuple
+from pyVmomi import SoapStubAdapter, VmomiSupport, vim
+from vmware_collector import retrieve_properties
+
+# every vcenter since 5.5 answers RetrieveServiceContent in this version
+BOOTSTRAP_VERSION = "vim.version.version9"
+
+Transport = namedtuple("Transport", ["compress", "keep_alive", "resume_tls"])
+TUNED = Transport(compress=True, keep_alive=True, resume_tls=True)
+PLAIN = Transport(compress=False, keep_alive=False, resume_tls=False)
+# connections kept open per session, pyVmomi's default
+POOL_SIZE = 5
+
+VM_PROPERTIES = ["name", "config.template", "runtime.powerState", "guest.ipAddress", "guest.net"]
+# the names wrapanapi gives to the vm power states, the checks compare against them
+VM_STATES = {
+    "poweredOn": "VmState.RUNNING",
+    "poweredOff": "VmState.STOPPED",
+    "suspended": "VmState.SUSPENDED",
+}
+
+
+def connect(hostname, username, password, wrapanapi=False, stats=None, retries=0, logger=None,
+            transport=TUNED):
+    """ A VSphereSystem, or wrapanapi's VMWareSystem when asked for. The API calls are recorded
+        into stats (a vmware_profile.CallStats) when given, for wrapanapi only from after the
+        login. The calls failing on transient faults are retried up to retries times, see
+        vmware_guard.retrying_stub, also only after the login for wrapanapi. transport only
+        applies to VSphereSystem. """
+    if wrapanapi:
+        from wrapanapi.systems.virtualcenter import VMWareSystem
+
+        system = VMWareSystem(hostname, username, password)
+        if retries:
+            from vmware_guard import retrying_stub
+
+            retrying_stub(system.service_instance._stub, retries, logger)
+        if stats is not None:
+            from vmware_profile import profile_stub
+
+            profile_stub(system.service_instance._stub, stats)
+        return system
+    return VSphereSystem(
+        hostname, username, password, stats=stats, retries=retries, logger=logger,
+        transport=transport
+    )
+
+
+class VSphereSystem(object):
+    """ Logged in pyVmomi session to a vcenter. """
+
+    def __init__(self, hostname, username, password, port=443, stub=None, stats=None, retries=0,
+                 logger=None, transport=TUNED):
+        """ stub is a pyVmomi stub adapter to use instead of connecting to hostname:port,
+            e.g. the one of a fake_vcenter.FakeVCenter. The API calls, login included, are
+            recorded into stats (a vmware_profile.CallStats) when given, and retried up to
+            retries times on transient faults. transport sets up the connection to
+            hostname:port, a Transport. """
+        self.hostname = hostname
+        if stub is None:
+            soap_stub = _soap_stub(hostname, port, transport)
+            stub = _wrapped(soap_stub, stats, retries, logger)
+            content = vim.ServiceInstance("ServiceInstance", stub).RetrieveContent()
+            # the rest of the session talks the version of the server, over the same
+            # connection
+            soap_stub.ComputeVersionInfo(api_version(content.about.apiVersion))
+        else:
+            stub = _wrapped(stub, stats, retries, logger)
+        self.service_instance = vim.ServiceInstance("ServiceInstance", stub)
+        self.content = self.service_instance.RetrieveContent()
+        self.content.sessionManager.Login(username, password)
+
+    def disconnect(self):
+        self.content.sessionManager.Logout()
+
+    def get_obj(self, obj_type, name):
+        """ The obj_type managed object called name, None when there is none. """
+        for item in retrieve_properties(self, obj_type, ["name"]):
+            if item["name"] == name:
+                return item["obj"]
+        return None
+
+    def get_obj_list(self, obj_type):
+        return [item["obj"] for item in retrieve_properties(self, obj_type, ["name"])]
+
+    def list_vms(self):
+        return [vm for vm in self._list_vms() if not vm.template]
+
+    def list_templates(self):
+        return [vm for vm in self._list_vms() if vm.template]
+
+    def list_datastore(self):
+        return [item["name"] for item in retrieve_properties(self, vim.Datastore, ["name"])]
+
+    def _list_vms(self):
+        return [VirtualMachine(item) for item in retrieve_properties(
+            self, vim.VirtualMachine, VM_PROPERTIES
+        )]
+
+
+def _soap_stub(hostname, port, transport):
+    if transport.resume_tls:
+        # a session is resumed by connections of the same context
+        context = _shared_ssl_context()
+    else:
+        # vcenters are usually deployed with self signed certificates
+        context = ssl._create_unverified_context()
+    stub = SoapStubAdapter(
+        host=hostname, port=port, version=BOOTSTRAP_VERSION, sslContext=context,
+        acceptCompressedResponses=transport.compress,
+        # the connections are closed after each call without a pool
+        poolSize=POOL_SIZE if transport.keep_alive else 0
+    )
+    if transport.resume_tls:
+        stub.scheme = _ResumingHTTPSConnection
+    return stub
+
+
+_ssl_context = None
+_ssl_lock = threading.Lock()
+# the latest TLS session of each host:port this process connected to
+_tls_sessions = {}
+
+
+def _shared_ssl_context():
+    global _ssl_context
+    with _ssl_lock:
+        if _ssl_context is None:
+            _ssl_context = ssl._create_unverified_context()
+        return _ssl_context
+
+
+class _ResumingHTTPSConnection(http.client.HTTPSConnection):
+    """ https connection resuming the TLS session of the previous connection to its server. """
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=self.host,
+            session=_tls_sessions.get((self.host, self.port))
+        )
+
+    def getresponse(self):
+        response = http.client.HTTPSConnection.getresponse(self)
+        # a TLS 1.3 server sends its session ticket after the handshake, it has arrived by
+        # the time a response is read
+        if self.sock is not None and self.sock.session is not None:
+            _tls_sessions[(self.host, self.port)] = self.sock.session
+        return response
+
+
+def _wrapped(stub, stats, retries, logger):
+    # retried inside the profiling, a call is recorded once with the time of all its attempts
+    if retries:
+        from vmware_guard import retrying_stub
+
+        stub = retrying_stub(stub, retries, logger)
+    if stats is None:
+        return stub
+    from vmware_profile import profile_stub
+
+    return profile_stub(stub, stats)
+
+
+def api_version(server_version):
+    """ The pyVmomi version to talk to a server of API version server_version (e.g. "6.7"),
+        the newest pyVmomi knows when the server is newer than that. """
+    version = VmomiSupport.versionMap.get("vim25/{}".format(server_version))
+    return version or VmomiSupport.newestVersions.Get("vim")
+
+
+class VirtualMachine(object):
+    """ The name, state and ip of a VM as read by VSphereSystem.list_vms. """
+
+    def __init__(self, properties):
+        self.raw = properties["obj"]
+        self.name = properties["name"]
+        self.template = properties.get("config.template", False)
+        self.state = VM_STATES.get(properties.get("runtime.powerState"), "VmState.UNKNOWN")
+        self.ip = _guest_ipv4(properties)
+
+    def __repr__(self):
+        return "VirtualMachine({!r})".format(self.name)
+
+
+def _guest_ipv4(properties):
+    """ The first ipv4 address the guest tools report, like wrapanapi's VM.ip. Loopback
+        addresses are skipped, pinged on this host they would always answer. """
+    addresses = [properties.get("guest.ipAddress")]
+    for nic in properties.get("guest.net") or []:
+        addresses.extend(nic.ipAddress or [])
+    for address in addresses:
+        if address and ":" not in address and not address.startswith("127."):
+            return address
+    return None
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Position of check_system_recent_tasks in the task history of a vcenter, kept
+in a small JSON file between runs (check_vmware.py --task-cursor), so each run
+only looks at the tasks that completed since the previous one.
+"""
+import json
+import os
+
+from pyVmomi.Iso8601 import ParseISO8601
+
+
+class TaskCursor(object):
+    """ The vcenter time the previous run read the task history up to, and the keys of the
+        tasks it reported that completed at that very time, which the next run reads again. """
+
+    def __init__(self, path, vcenter):
+        self.path = path
+        self.vcenter = vcenter
+        self.time = None
+        self.keys = set()
+        try:
+            with open(path) as stream:
+                state = json.load(stream)
+        except (IOError, ValueError):
+            # first run, or a damaged file: start over from the recent tasks
+            return
+        if state.get("vcenter") == vcenter and state.get("time"):
+            self.time = ParseISO8601(state["time"])
+            self.keys = set(state.get("keys", []))
+
+    def is_new(self, info):
+        """ Whether the task of info completed after the previous run. """
+        if self.time is None or info.completeTime is None:
+            return True
+        return info.completeTime > self.time or (
+            info.completeTime == self.time and info.key not in self.keys
+        )
+
+    def advance(self, time, infos):
+        """ Move the cursor to time, infos being the tasks reported by this run. """
+        self.time = time
+        self.keys = set(info.key for info in infos if info.completeTime == time)
+        # write then rename, so a run killed halfway does not leave a damaged file. The
+        # temporary file is per process, concurrent runs do not write into each other's
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as stream:
+            json.dump({
+                "vcenter": self.vcenter,
+                "time": time.isoformat(),
+                "keys": sorted(self.keys),
+            }, stream)
+        os.rename(tmp_path, self.path)
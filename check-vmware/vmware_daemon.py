@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Long-lived check daemon. It keeps one authenticated vcenter session per
+vSphere endpoint and runs the CHECKS functions for check_vmware.py clients
+that connect over a local Unix socket, so a check no longer pays for python
+start-up, imports and a vcenter login on every invocation.
+
+The protocol is one JSON object per line each way: the client sends the
+check_vmware.py arguments, the daemon answers with the status and message.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from argparse import RawTextHelpFormatter
+from vmware_logconf import get_logger
+from vmware_status import UNKNOWN, CheckResult
+
+DEFAULT_SOCKET = "/var/lib/shinken/vmware-checks.sock"
+# re-validate a pooled session when it has not been used for this many seconds
+SESSION_CHECK_INTERVAL = 60
+# seconds a client has to send its request in
+REQUEST_TIMEOUT = 10
+
+
+class SessionPool(object):
+    """ Authenticated vcenter sessions, one per (vsphere, user, password), each with the
+        InventoryTrackers keeping its inventory retrievals current between checks unless
+        trackers is False. connect(vsphere, user, password) opens the sessions, default
+        vmware_connection.connect. """
+
+    def __init__(self, logger, trackers=True, connect=None):
+        self.logger = logger
+        self.trackers = trackers
+        self.connect = connect
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, vsphere, user, password):
+        key = (vsphere, user, password)
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = self._sessions[key] = {
+                    "lock": threading.Lock(), "system": None, "trackers": None
+                }
+        # connect/validate under a per-endpoint lock so a slow vcenter does not block the others
+        with entry["lock"]:
+            system, last_used = entry["system"], entry.get("last_used", 0)
+            if system and time.time() - last_used > SESSION_CHECK_INTERVAL:
+                if not self._is_alive(system):
+                    self.logger.info("Session to Vsphere %s expired, reconnecting", vsphere)
+                    system = None
+            if system is None:
+                connect = self.connect
+                if connect is None:
+                    from vmware_connection import connect
+
+                if entry["trackers"]:
+                    entry["trackers"].destroy()
+                self.logger.info("Connecting to Vsphere %s as user %s", vsphere, user)
+                system = connect(vsphere, user, password)
+                entry["system"] = system
+                entry["trackers"] = None
+                if self.trackers:
+                    from vmware_updates import InventoryTrackers
+
+                    entry["trackers"] = InventoryTrackers(self.logger)
+            entry["last_used"] = time.time()
+            trackers = entry["trackers"]
+        # the trackers of the vcenters no longer checked are not used by their get
+        with self._lock:
+            others = [other["trackers"] for other in self._sessions.values()
+                      if other is not entry and other["trackers"]]
+        for other in others:
+            other.expire()
+        return system, trackers
+
+    def _is_alive(self, system):
+        try:
+            return system.content.sessionManager.currentSession is not None
+        except Exception:
+            self.logger.warning("Session validation against %s failed", system.hostname,
+                                exc_info=True)
+            return False
+
+
+class CheckRequestHandler(socketserver.StreamRequestHandler):
+    """ Runs one check per connection and writes the result back. """
+    # a client that never finishes its request does not hold a thread for long
+    timeout = REQUEST_TIMEOUT
+
+    def handle(self):
+        logger = self.server.logger
+        try:
+            line = self.rfile.readline()
+        except socket.timeout:
+            logger.warning("No check request received within %s seconds", self.timeout)
+            return
+        try:
+            # the checks are only imported by the daemon, its clients relay the results
+            from vmware_checks import (
+                combine_results,
+                run_measurements,
+                select_measurements,
+                threshold_error
+            )
+
+            request = json.loads(line.decode("utf-8"))
+            measurements = select_measurements(
+                request["measurements"], request.get("all_host_checks"),
+                request.get("all_system_checks")
+            )
+            error = threshold_error(measurements, request.get("warning"), request.get("critical"))
+            if error:
+                logger.error(error)
+                result = CheckResult(UNKNOWN, error)
+            elif request.get("endpoints"):
+                from vmware_fanout import run_fanout, summarize_vcenters
+
+                tallies = {}
+                results = run_fanout(
+                    self.server.sessions,
+                    request["endpoints"],
+                    measurements,
+                    hostname=request.get("hostname"),
+                    warn=request.get("warning"),
+                    crit=request.get("critical"),
+                    logger=logger,
+                    tallies=tallies
+                )
+                result = summarize_vcenters(results, tallies, warn=request.get("warning"))
+            else:
+                system, trackers = self.server.sessions.get(
+                    request["vsphere"], request["user"], request["password"]
+                )
+                result = combine_results(run_measurements(
+                    system,
+                    measurements,
+                    hostname=request.get("hostname"),
+                    warn=request.get("warning"),
+                    crit=request.get("critical"),
+                    logger=logger,
+                    cache=trackers
+                ))
+        except Exception as e:
+            logger.error("Exception occurred while serving a check request", exc_info=True)
+            result = CheckResult(
+                UNKNOWN, "ERROR: daemon failed to run the check: '{}', check logs for trace".format(e)
+            )
+        self.wfile.write((json.dumps(result._asdict()) + "\n").encode("utf-8"))
+
+
+class CheckServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ The daemon listening on the Unix socket path, running the checks through sessions, a
+        SessionPool (default a new one). """
+    daemon_threads = True
+
+    def __init__(self, path, logger, sessions=None):
+        self.logger = logger
+        self.sessions = sessions or SessionPool(logger)
+        socketserver.UnixStreamServer.__init__(self, path, CheckRequestHandler)
+
+    def server_bind(self):
+        # the requests carry vcenter credentials, the socket is private to the shinken user
+        # from the moment it is created
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+
+def request_check(path, request, timeout=60, logger=None):
+    """ Client side: send a check request to the daemon listening on path. """
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as stream:
+                response = json.loads(stream.readline().decode("utf-8"))
+        finally:
+            sock.close()
+    except (socket.error, ValueError) as e:
+        msg = "Error: unable to run check through daemon socket {}: {}".format(path, e)
+        if logger:
+            logger.error(msg)
+        return CheckResult(UNKNOWN, msg)
+    return CheckResult(response["status"], response["message"])
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "-S",
+        "--socket",
+        dest="socket",
+        help="Unix socket to listen on",
+        type=str,
+        default=DEFAULT_SOCKET
+    )
+    parser.add_argument(
+        "-l",
+        "--local",
+        dest="local",
+        help="Use this field when testing locally",
+        action="store_true",
+        default=False
+    )
+    args = parser.parse_args()
+    # the request threads only queue their log records, one thread writes them to the file
+    logger = get_logger(args.local, queued=True)
+    # imported up front, not by the first request
+    import vmware_checks  # noqa: F401
+
+    # a socket file left over from a previous run would make bind() fail
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = CheckServer(args.socket, logger)
+    logger.info("Serving checks on %s", args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
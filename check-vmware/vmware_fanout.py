@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Runs the checks against several vcenters at once, for check_vmware.py given
+a comma separated -V or a --vsphere-file, and for the daemon.
+
+Every vcenter is checked in a bounded thread pool through its own session of
+a vmware_daemon.SessionPool, so the run takes about as long as the slowest
+vcenter instead of the sum of all of them. The results are folded into one
+status, with one line per vcenter and check, after the totals across the
+vcenters: VMs, templates, failed tasks and the datastores over the warning
+threshold.
+"""
+import json
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from vmware_status import UNKNOWN, CheckResult
+
+# vcenters checked at the same time
+DEFAULT_WORKERS = 8
+# the default warning threshold of the datastore usage checks
+DATASTORE_WARNING = 0.75
+# the counts added up across the vcenters: metric (see vmware_checks.record_sample), label
+TOTALS = [("vm_count", "VMs"), ("template_count", "templates"), ("failed_tasks", "failed tasks")]
+
+
+def parse_endpoints(vsphere, user, password, path=None):
+    """ The endpoints, dicts of vsphere, user and password, of a comma separated list of
+        vcenters and of the JSON file at path. The file holds a list of such dicts, a missing
+        user or password is the one given. """
+    endpoints = [
+        {"vsphere": name.strip(), "user": user, "password": password}
+        for name in (vsphere or "").split(",") if name.strip()
+    ]
+    if path:
+        with open(path) as stream:
+            for entry in json.load(stream):
+                endpoints.append({
+                    "vsphere": entry["vsphere"],
+                    "user": entry.get("user", user),
+                    "password": entry.get("password", password),
+                })
+    return endpoints
+
+
+def run_fanout(sessions, endpoints, measurements, hostname=None, warn=None, crit=None,
+               logger=None, workers=DEFAULT_WORKERS, tallies=None):
+    """ Run the measurements against every endpoint concurrently, through the sessions of
+        sessions, a vmware_daemon.SessionPool. A vcenter that can not be reached gives UNKNOWN
+        for its checks. The values the checks measured go to a Tally per vcenter in tallies,
+        a dict, when given. Returns a list of (vsphere, measurement, CheckResult) in the order
+        of endpoints. """
+    # like fold_results below, only imported when checks run: the daemon client only parses
+    # the endpoints
+    from vmware_checks import run_measurements
+
+    def run(endpoint):
+        try:
+            system, trackers = sessions.get(
+                endpoint["vsphere"], endpoint["user"], endpoint["password"]
+            )
+            options = {}
+            if tallies is not None:
+                options["samples"] = tallies[endpoint["vsphere"]] = Tally(endpoint["vsphere"])
+            return run_measurements(
+                system, measurements, hostname=hostname, warn=warn, crit=crit, logger=logger,
+                cache=trackers, **options
+            )
+        except Exception as e:
+            logger.error("Unable to run checks on Vsphere %s", endpoint["vsphere"], exc_info=True)
+            msg = "ERROR: unable to run checks on vSphere {}: '{}', check logs for trace".format(
+                endpoint["vsphere"], e
+            )
+            return [(measurement, CheckResult(UNKNOWN, msg)) for measurement in measurements]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(endpoints)))) as pool:
+        per_endpoint = list(pool.map(run, endpoints))
+    return [
+        (endpoint["vsphere"], measurement, result)
+        for endpoint, results in zip(endpoints, per_endpoint)
+        for measurement, result in results
+    ]
+
+
+def summarize_vcenters(results, tallies=None, warn=None):
+    """ One result for checks run on several vcenters: the worst status and a count line, the
+        totals across the vcenters of tallies (see run_fanout), then one line per vcenter and
+        check. The datastores are over the threshold from warn, default DATASTORE_WARNING. """
+    from vmware_checks import fold_results
+
+    if not results:
+        return CheckResult(UNKNOWN, "Unknown: no vSphere to check")
+    vcenters = set(vsphere for vsphere, _, _ in results)
+    details = []
+    if tallies:
+        details.append(totals(tallies, DATASTORE_WARNING if warn is None else float(warn)))
+    return fold_results(
+        [("{} {}".format(vsphere, measurement), result)
+         for vsphere, measurement, result in results],
+        " on {} vSphere".format(len(vcenters)), details=[line for line in details if line]
+    )
+
+
+def totals(tallies, warn):
+    """ The line of the totals across the vcenters of tallies, None when there are none. """
+    parts = []
+    for metric, label in TOTALS:
+        counts = [tally.values[metric] for tally in tallies.values() if metric in tally.values]
+        if counts:
+            parts.append("{} {}".format(sum(counts), label))
+    usages = [
+        ("{} {}".format(vsphere, name), usage)
+        for vsphere, tally in tallies.items() for name, usage in tally.datastores.items()
+    ]
+    if usages:
+        over = [
+            "{} ({}%)".format(name, round(usage * 100, 1)) for name, usage in usages if usage >= warn
+        ]
+        parts.append("{} of {} datastores over {}% usage{}".format(
+            len(over), len(usages), round(warn * 100, 1), ": " + ", ".join(over) if over else ""
+        ))
+    if not parts:
+        return None
+    return "Across {} vSphere: {}".format(len(tallies), ", ".join(parts))
+
+
+class Tally(object):
+    """ The values measured by the checks of one vcenter, taken as their samples option (see
+        vmware_checks.record_sample): the counts, and the usage of every datastore. """
+
+    def __init__(self, vcenter):
+        self.vcenter = vcenter
+        self.values = {}
+        self.datastores = OrderedDict()
+
+    def append(self, metric, entity, value):
+        if metric == "datastore_usage":
+            self.datastores[entity] = value
+        elif entity == self.vcenter:
+            self.values[metric] = value
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Usage trend of datastores, for the system_datastore_forecast check.
+
+The used space and capacity of every datastore over the past week are read
+from the performance history of the vcenter with one PerformanceManager
+QueryPerf call per MAX_QUERY_METRICS metrics, as csv, and a least squares line is
+fitted to the usage of each datastore. The history is read as a history
+fetch of the check (see vmware_planner), with the other datastore properties.
+With numpy installed and enough samples the lines are fitted in one
+vectorized pass over all of them.
+"""
+from collections import namedtuple
+from pyVmomi import vim
+from pyVmomi.Iso8601 import ParseISO8601
+from vmware_collector import unwrap
+
+# datastore space is sampled every 30 minutes, kept at that interval for a week
+INTERVAL = 1800
+HISTORY_SAMPLES = 7 * 24 * 2
+# vpxd.stats.maxQueryMetrics, metrics vcenter accepts per historical query by default
+MAX_QUERY_METRICS = 64
+USED, CAPACITY = "disk.used.latest", "disk.capacity.latest"
+# below this many samples importing numpy costs more than fitting in python
+VECTORIZE_SAMPLES = 100000
+
+# per_day and days_to_full are None without history, days_to_full also when not growing
+Forecast = namedtuple("Forecast", ["name", "usage", "per_day", "days_to_full"])
+
+
+def read_history(system, datastores):
+    """ The usage history of datastores, see usage_history, read through the PerformanceManager
+        of system. """
+    return usage_history(unwrap(system).content.perfManager, [unwrap(obj) for obj in datastores])
+
+
+def forecast(datastores):
+    """ Forecast of every datastore of datastores, dicts with the name, summary.capacity,
+        summary.freeSpace and history (see usage_history, None without samples) of accessible
+        datastores: the current usage, the growth per day of the usage fitted over the past
+        week and the days until the datastore is full. """
+    slopes = iter(fit_slopes(
+        [datastore["history"] for datastore in datastores if datastore.get("history")]
+    ))
+
+    forecasts = []
+    for datastore in datastores:
+        usage = 1 - float(datastore["summary.freeSpace"]) / datastore["summary.capacity"]
+        slope = next(slopes) if datastore.get("history") else None
+        if slope is None:
+            forecasts.append(Forecast(datastore["name"], usage, None, None))
+            continue
+        per_day = slope * 86400
+        days_to_full = (1 - usage) / per_day if per_day > 0 else None
+        forecasts.append(Forecast(datastore["name"], usage, per_day, days_to_full))
+    return forecasts
+
+
+def usage_history(perf_manager, datastores):
+    """ The usage fractions of datastores over the past week: dict of datastore to
+        (seconds, usages), seconds counted from the latest sample of the datastore. Datastores
+        without samples are missing. """
+    counters = counter_ids(perf_manager)
+    if len(counters) < 2:
+        # not collected at the statistics level of the vcenter
+        return {}
+    metric_ids = [
+        vim.PerformanceManager.MetricId(counterId=counters[name], instance="")
+        for name in (USED, CAPACITY)
+    ]
+    per_query = max(MAX_QUERY_METRICS // len(metric_ids), 1)
+    # the datastores share their sample times, each is parsed once
+    timestamps = {}
+    history = {}
+    for i in range(0, len(datastores), per_query):
+        specs = [
+            # without a time range vcenter returns the latest maxSample samples. As csv the
+            # samples are a few strings instead of thousands of objects to parse
+            vim.PerformanceManager.QuerySpec(
+                entity=datastore, metricId=metric_ids, intervalId=INTERVAL,
+                maxSample=HISTORY_SAMPLES, format="csv"
+            )
+            for datastore in datastores[i:i + per_query]
+        ]
+        for metric in perf_manager.QueryPerf(specs) or []:
+            if not metric.sampleInfoCSV:
+                continue
+            values = dict(
+                (series.id.counterId, series.value.split(",")) for series in metric.value
+            )
+            # interval,timestamp pairs
+            times = metric.sampleInfoCSV.split(",")[1::2]
+            seconds, usages = [], []
+            for text, used, capacity in zip(
+                times, values.get(counters[USED], []), values.get(counters[CAPACITY], [])
+            ):
+                used, capacity = float(used), float(capacity)
+                # -1 stands for a missing sample
+                if used >= 0 and capacity > 0:
+                    if text not in timestamps:
+                        timestamps[text] = ParseISO8601(text)
+                    seconds.append(timestamps[text])
+                    usages.append(used / capacity)
+            if seconds:
+                latest = seconds[-1]
+                seconds = [(timestamp - latest).total_seconds() for timestamp in seconds]
+                history[unwrap(metric.entity)] = (seconds, usages)
+    return history
+
+
+def counter_ids(perf_manager):
+    """ The ids of the USED and CAPACITY counters on this vcenter, they differ between
+        vcenters. """
+    counters = {}
+    for counter in perf_manager.QueryPerfCounterByLevel(1):
+        name = "{}.{}.{}".format(counter.groupInfo.key, counter.nameInfo.key, counter.rollupType)
+        if name in (USED, CAPACITY):
+            counters[name] = counter.key
+    return counters
+
+
+def fit_slopes(series):
+    """ Least squares slope of each (xs, ys) of series, None for the series with fewer than two
+        distinct xs. """
+    if sum(len(xs) for xs, _ in series) < VECTORIZE_SAMPLES:
+        return [_slope(xs, ys) for xs, ys in series]
+    try:
+        import numpy
+    except ImportError:
+        return [_slope(xs, ys) for xs, ys in series]
+
+    # one row per series, padded with nan
+    width = max(len(xs) for xs, _ in series)
+    x = numpy.full((len(series), width), numpy.nan)
+    y = numpy.full((len(series), width), numpy.nan)
+    for row, (xs, ys) in enumerate(series):
+        x[row, :len(xs)] = xs
+        y[row, :len(ys)] = ys
+    present = ~numpy.isnan(x)
+    counts = numpy.maximum(present.sum(axis=1), 1)
+    dx = numpy.where(present, x - (numpy.nansum(x, axis=1) / counts)[:, None], 0)
+    dy = numpy.where(present, y - (numpy.nansum(y, axis=1) / counts)[:, None], 0)
+    variance = (dx * dx).sum(axis=1)
+    slopes = numpy.divide(
+        (dx * dy).sum(axis=1), variance, out=numpy.full(len(series), numpy.nan),
+        where=variance > 0
+    )
+    return [None if numpy.isnan(slope) else float(slope) for slope in slopes]
+
+
+def _slope(xs, ys):
+    n = len(xs)
+    if n < 2:
+        return None
+    x_mean, y_mean = sum(xs) / n, sum(ys) / n
+    variance = sum((x - x_mean) ** 2 for x in xs)
+    if not variance:
+        return None
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / variance
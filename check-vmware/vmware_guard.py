@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Protection of the vcenters against bursts of check processes
+(check_vmware.py --guard-dir).
+
+When the poller starts hundreds of checks at once they all log in and query
+the same vcenter together, its latency climbs, the checks time out and turn
+into UNKNOWN results, which the retries of the poller make worse. Guard:
+
+* lets at most max_sessions processes of this machine talk to a vcenter at
+  once. The slots are lock files, taken with flock, so the slot of a check
+  that dies is freed with it. A check waiting longer than SLOT_WAIT for a
+  slot gives up with an UNKNOWN result.
+* is a circuit breaker: after BREAKER_FAILURES consecutive failed
+  connections the vcenter is known down for down_for seconds, the checks
+  return an UNKNOWN result at once instead of connecting. Then one check
+  tries again while the others still get the UNKNOWN, its success closes
+  the breaker, its failure opens it for another down_for seconds.
+
+retrying_stub retries the API calls failing on transient faults (network
+errors, http errors, vcenter busy) with an exponential backoff.
+"""
+import fcntl
+import json
+import os
+import random
+import time
+
+from http.client import HTTPException
+from pyVmomi import vmodl
+from urllib.parse import quote
+from vmware_checks import UNKNOWN, CheckResult
+
+# faults worth trying again, login and permission errors are not
+TRANSIENT = (OSError, HTTPException, vmodl.fault.HostCommunication, vmodl.fault.SystemError)
+DEFAULT_RETRIES = 2
+# the first retry waits up to this long, each next one twice as long
+BASE_DELAY = 0.5
+MAX_DELAY = 8
+DEFAULT_MAX_SESSIONS = 4
+# seconds a check waits for a free slot
+SLOT_WAIT = 20
+BREAKER_FAILURES = 3
+DEFAULT_DOWN_FOR = 120
+
+
+def retrying_stub(stub, retries=DEFAULT_RETRIES, logger=None):
+    """ Retry the calls made through stub (a pyVmomi stub adapter) that fail on TRANSIENT
+        faults, up to retries times. The checks only read, so a call is safe to repeat. """
+    invoke_method, invoke_accessor = stub.InvokeMethod, stub.InvokeAccessor
+
+    def call(name, invoke):
+        for attempt in range(retries + 1):
+            try:
+                return invoke()
+            except TRANSIENT as e:
+                if attempt == retries:
+                    raise
+                delay = backoff(attempt)
+                if logger:
+                    logger.warning("%s failed: '%s', retrying in %.1f seconds", name, e, delay)
+                time.sleep(delay)
+
+    stub.InvokeMethod = lambda mo, info, args, *rest: call(
+        info.wsdlName, lambda: invoke_method(mo, info, args, *rest)
+    )
+    stub.InvokeAccessor = lambda mo, info: call(
+        "{} read".format(info.name), lambda: invoke_accessor(mo, info)
+    )
+    return stub
+
+
+def backoff(attempt):
+    """ Seconds to wait before retry attempt + 1: doubling from BASE_DELAY up to MAX_DELAY, and
+        randomly shortened by up to half so the processes failing together do not all retry
+        together. """
+    delay = min(BASE_DELAY * 2 ** attempt, MAX_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class Guard(object):
+    """ The session slots and the breaker of one vcenter, kept below directory and shared by
+        every process using the same directory. """
+
+    def __init__(self, directory, vcenter, max_sessions=DEFAULT_MAX_SESSIONS,
+                 down_for=DEFAULT_DOWN_FOR, logger=None):
+        self.directory = os.path.join(directory, quote(vcenter, safe=""))
+        self.vcenter = vcenter
+        self.max_sessions = max_sessions
+        self.down_for = down_for
+        self.logger = logger
+        self._slot = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def enter(self, wait=SLOT_WAIT):
+        """ Take a session slot. Returns an UNKNOWN CheckResult instead when the vcenter is
+            known down or no slot freed up within wait seconds. """
+        down = self._check_breaker()
+        if down:
+            return CheckResult(UNKNOWN, down)
+        deadline = time.time() + wait
+        attempt = 0
+        while not self._take_slot():
+            if time.time() >= deadline:
+                msg = "Unknown: {} checks already running on vSphere {}, waited {} " \
+                      "seconds".format(self.max_sessions, self.vcenter, wait)
+                self._log("%s", msg)
+                return CheckResult(UNKNOWN, msg)
+            time.sleep(min(0.05 * 2 ** attempt, 1) * random.uniform(0.5, 1))
+            attempt += 1
+        return None
+
+    def exit(self):
+        """ Free the session slot. """
+        if self._slot is not None:
+            self._slot.close()
+            self._slot = None
+
+    def succeeded(self):
+        """ The vcenter answered: close the breaker. """
+        with self._breaker() as state:
+            if state.get("failures"):
+                self._log("vSphere %s is back", self.vcenter)
+                state.clear()
+
+    def failed(self, error):
+        """ Connecting failed with the exception error: opens the breaker after
+            BREAKER_FAILURES TRANSIENT ones in a row, a wrong password does not count. """
+        if not isinstance(error, TRANSIENT):
+            return
+        with self._breaker() as state:
+            state["failures"] = state.get("failures", 0) + 1
+            state["error"] = str(error)
+            if state["failures"] >= BREAKER_FAILURES:
+                state["down_until"] = time.time() + self.down_for
+                self._log("vSphere %s is down after %s failures, not checked for %s seconds",
+                          self.vcenter, state["failures"], self.down_for)
+
+    def _take_slot(self):
+        for i in range(self.max_sessions):
+            slot = open(os.path.join(self.directory, "slot-{}".format(i)), "a")
+            try:
+                fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                slot.close()
+                continue
+            self._slot = slot
+            return True
+        return False
+
+    def _check_breaker(self):
+        # the message of the UNKNOWN result while the vcenter is known down, None otherwise
+        with self._breaker() as state:
+            down_until = state.get("down_until", 0)
+            if state.get("failures", 0) < BREAKER_FAILURES:
+                return None
+            if time.time() >= down_until:
+                # this check tries again, the others keep failing fast meanwhile
+                state["down_until"] = time.time() + self.down_for
+                return None
+            return "Unknown: vSphere {} is down, not checked until {}: '{}'".format(
+                self.vcenter, time.strftime("%H:%M:%S", time.localtime(down_until)),
+                state.get("error")
+            )
+
+    def _breaker(self):
+        return _BreakerState(os.path.join(self.directory, "breaker.json"))
+
+    def _log(self, msg, *args):
+        if self.logger:
+            self.logger.warning(msg, *args)
+
+
+class _BreakerState(object):
+    # the breaker file read and written back under an exclusive lock, as a dict
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self._lock = open(self.path + ".lock", "a")
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        try:
+            with open(self.path) as stream:
+                self.state = json.load(stream)
+        except (IOError, ValueError):
+            self.state = {}
+        self._saved = dict(self.state)
+        return self.state
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.state != self._saved:
+                # write then rename, so a process killed halfway does not leave a damaged file
+                with open(self.path + ".tmp", "w") as stream:
+                    json.dump(self.state, stream)
+                os.rename(self.path + ".tmp", self.path)
+        finally:
+            self._lock.close()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Index of the esxi host names of a vcenter to their managed object ids, kept
+in a small JSON file between runs (check_vmware.py --host-index).
+
+Without it every host check resolves -H by listing the name of every host of
+the vcenter. With it the host comes straight from the index, and the entry
+is validated by the host prefetch of the check, which reads the name anyway.
+A missing or stale entry (host removed or renamed) is looked up with the
+SearchIndex of the vcenter, then by listing the host names as before, which
+refreshes every entry of the index at once.
+"""
+import json
+import os
+import socket
+
+from pyVmomi import vim
+from vmware_collector import retrieve_object_properties, retrieve_properties
+
+
+class HostIndex(object):
+    """ Host name -> managed object id of the esxi hosts of one vcenter. """
+
+    def __init__(self, path, vcenter):
+        self.path = path
+        self.vcenter = vcenter
+        self.hosts = {}
+        try:
+            with open(path) as stream:
+                state = json.load(stream)
+        except (IOError, ValueError):
+            # first run, or a damaged file: it is rebuilt as hosts are looked up
+            return
+        if state.get("vcenter") == vcenter:
+            self.hosts = state.get("hosts", {})
+
+    def get(self, system, name):
+        """ The host the index has for name, None when it has none. It is not checked against
+            the vcenter, the caller validates it when it reads the host properties. """
+        moid = self.hosts.get(name)
+        if moid is None:
+            return None
+        return vim.HostSystem(moid, system.service_instance._stub)
+
+    def find(self, system, name):
+        """ The host called name looked up on the vcenter and recorded in the index, None when
+            there is none. """
+        host = self._search(system, name)
+        if host is not None:
+            self._update({name: host._moId})
+            return host
+        hosts = dict(
+            (item["name"], item["obj"])
+            for item in retrieve_properties(system, vim.HostSystem, ["name"])
+        )
+        # the names of every host were listed, drop the entries of the hosts that are gone
+        self._update(dict((host_name, obj._moId) for host_name, obj in hosts.items()), True)
+        return hosts.get(name)
+
+    def forget(self, name):
+        """ Drop the entry of name, found stale by the caller. """
+        if self.hosts.pop(name, None) is not None:
+            self._save()
+
+    def _search(self, system, name):
+        search_index = system.content.searchIndex
+        host = search_index.FindByDnsName(dnsName=name, vmSearch=False)
+        if host is None and _is_ip(name):
+            host = search_index.FindByIp(ip=name, vmSearch=False)
+        if host is None:
+            return None
+        # the dns name of a host is not necessarily its name in the inventory
+        props = retrieve_object_properties(system, [host], vim.HostSystem, ["name"])
+        return host if props and props[0].get("name") == name else None
+
+    def _update(self, hosts, complete=False):
+        if complete:
+            changed = hosts != self.hosts
+            self.hosts = hosts
+        else:
+            changed = any(self.hosts.get(name) != moid for name, moid in hosts.items())
+            self.hosts.update(hosts)
+        if changed:
+            self._save()
+
+    def _save(self):
+        # write then rename, so concurrent checks never read a half written file
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as stream:
+            json.dump({"vcenter": self.vcenter, "hosts": self.hosts}, stream)
+        os.rename(tmp_path, self.path)
+
+
+def _is_ip(name):
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, name)
+            return True
+        except (socket.error, ValueError):
+            pass
+    return False
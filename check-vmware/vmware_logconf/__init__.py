@@ -1,13 +1,76 @@
+import atexit
 import logging
-import os
 
-from logging.config import fileConfig
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+
+# the settings of local_config.ini and logging_config.ini, applied without parsing them
+LOG_FILES = {
+    True: "vmware-checks.log",
+    False: "/var/log/shinken/vmware-checks.log",
+}
+LOG_FORMAT = "[%(asctime)s %(filename)-17s %(levelname)-7s] %(message)s"
+# longer messages (e.g. the status of thousands of datastores) are cut in the log file, the
+# plugin output keeps them whole
+MESSAGE_LIMIT = 4096
+
+_listener = None
 
 
 # setup logger
-def get_logger(local):
-    if local:
-        fileConfig(os.getcwd() + "/vmware_logconf/local_config.ini")
+def get_logger(local, queued=False, config=None):
+    """ The root logger, writing INFO and above to the checks log file. With queued the file is
+        written by a background thread, logging only puts the records on a queue. config is an
+        INI file for logging.config.fileConfig to use instead, e.g. one of the files of this
+        directory edited. """
+    global _listener
+    if config:
+        from logging.config import fileConfig
+
+        fileConfig(config)
+        return logging.getLogger()
+
+    handler = logging.FileHandler(LOG_FILES[local], "a")
+    handler.setLevel(logging.INFO)
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+    # replace the handlers of a previous call, like fileConfig does
+    _stop_listener()
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+        old.close()
+    if queued:
+        # the message is cut before the traceback is added to it and the record queued
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        queue = Queue()
+        _listener = QueueListener(queue, handler, respect_handler_level=True)
+        _listener.start()
+        handler = QueueHandler(queue)
+        handler.setLevel(logging.INFO)
+        handler.setFormatter(CappedFormatter("%(message)s"))
     else:
-        fileConfig("/var/lib/shinken/libexec/check-vmware/vmware_logconf/logging_config.ini")
-    return logging.getLogger()
+        handler.setFormatter(CappedFormatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    return logger
+
+
+class CappedFormatter(logging.Formatter):
+    """ Formatter cutting the messages longer than MESSAGE_LIMIT characters. """
+
+    def formatMessage(self, record):
+        if len(record.message) > MESSAGE_LIMIT:
+            record.message = "{} ... [{} more characters]".format(
+                record.message[:MESSAGE_LIMIT], len(record.message) - MESSAGE_LIMIT
+            )
+        return logging.Formatter.formatMessage(self, record)
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# write out the records still queued when the process exits
+atexit.register(_stop_listener)
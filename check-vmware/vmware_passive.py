@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Helpers to hand check results to shinken/nagios as passive results through
+the external command file, instead of as the output of a forked plugin.
+"""
+import time
+
+
+def format_service_result(hostname, service, result, timestamp=None):
+    """ A PROCESS_SERVICE_CHECK_RESULT external command line for one CheckResult. """
+    # the external command is a single line, long output lines are joined with a literal \n,
+    # and shinken splits the command on ";"
+    output = result.message.replace("\n", "\\n").replace(";", ",")
+    return "[{}] PROCESS_SERVICE_CHECK_RESULT;{};{};{};{}\n".format(
+        int(timestamp or time.time()), hostname, service, result.status, output
+    )
+
+
+def submit(lines, command_file):
+    """ Write external command lines to the shinken/nagios command file (a named pipe). """
+    with open(command_file, "a") as stream:
+        # one write per command, writes to a pipe are only atomic up to PIPE_BUF
+        for line in lines:
+            stream.write(line)
+            stream.flush()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Asynchronous pinger used by check_system_ping_vms. All the targets are pinged
+at once over a single ICMP socket, replies are matched back to their request
+by address and sequence number, so a whole fleet is checked in roughly one
+timeout period instead of one `ping` process per VM.
+
+An unprivileged ICMP datagram socket is used when the kernel allows it
+(net.ipv4.ping_group_range), a raw socket when running as root. When neither
+is permitted, or for non IPv4 targets, a TCP connect to a few well known
+ports is used instead: a completed handshake or a refused connection both
+prove the host is up.
+"""
+import asyncio
+import ipaddress
+import os
+import socket
+import struct
+
+UP, DOWN = "Up", "Down"
+
+TIMEOUT = 4
+RETRIES = 1
+CONCURRENCY = 256
+TCP_PORTS = (22, 443)
+# room for the replies of a whole concurrency window arriving at once
+RECV_BUFFER = 1024 * 1024
+
+ICMP_ECHO_REQUEST, ICMP_ECHO_REPLY = 8, 0
+
+
+def ping_all(targets, timeout=TIMEOUT, retries=RETRIES, concurrency=CONCURRENCY, logger=None):
+    """ Ping every address in targets. Returns a dict of address -> "Up"/"Down".
+        Each address gets retries + 1 attempts of timeout seconds, at most concurrency
+        addresses are in flight at any time. targets other than a list, tuple or set (e.g. a
+        generator over VMs streamed from vcenter) are read in a thread, the addresses are
+        pinged as they come. """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            _ping_all(loop, targets, timeout, retries, concurrency, logger)
+        )
+    finally:
+        loop.close()
+
+
+async def _ping_all(loop, targets, timeout, retries, concurrency, logger):
+    pinger = _open_icmp_pinger(loop, logger)
+    window = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def ping_one(address):
+        async with window:
+            if pinger and _is_ipv4(address):
+                results[address] = await pinger.ping(address, timeout, retries)
+            else:
+                results[address] = await tcp_ping(address, timeout, retries)
+
+    pings = {}
+
+    def start(address):
+        if address not in pings:
+            pings[address] = loop.create_task(ping_one(address))
+
+    try:
+        if isinstance(targets, (list, tuple, set, frozenset)):
+            for address in targets:
+                start(address)
+        else:
+            await loop.run_in_executor(None, _feed, loop, targets, start)
+        await asyncio.gather(*pings.values())
+    finally:
+        # left running when reading the targets failed
+        for ping in pings.values():
+            ping.cancel()
+        if pinger:
+            pinger.close()
+    return results
+
+
+def _feed(loop, targets, start):
+    # runs in a thread, reading the next targets may block (e.g. on the next page of VMs)
+    for address in targets:
+        loop.call_soon_threadsafe(start, address)
+
+
+def _open_icmp_pinger(loop, logger):
+    for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+        except (OSError, socket.error):
+            continue
+        return IcmpPinger(loop, sock)
+    if logger:
+        logger.info("ICMP sockets are not permitted, falling back to TCP connect ping")
+    return None
+
+
+def _is_ipv4(address):
+    try:
+        return ipaddress.ip_address(address).version == 4
+    except ValueError:
+        return False
+
+
+class IcmpPinger(object):
+    """ Sends echo requests over one non-blocking ICMP socket and resolves the pending
+        request future when its reply arrives. """
+
+    def __init__(self, loop, sock):
+        self.loop = loop
+        self.sock = sock
+        # a datagram socket gets the IP header stripped and its echo id rewritten by the kernel
+        self.raw = sock.type == socket.SOCK_RAW
+        self.ident = os.getpid() & 0xFFFF
+        self.seq = 0
+        self.pending = {}
+        # resolved when the full send buffer has room again, shared by the pings waiting for it
+        self._writable = None
+        # replies overflowing the default buffer are dropped and cost their target a timeout
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        sock.setblocking(False)
+        loop.add_reader(sock.fileno(), self._on_readable)
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        if self._writable is not None:
+            self.loop.remove_writer(self.sock.fileno())
+        self.sock.close()
+
+    async def ping(self, address, timeout, retries):
+        for _ in range(retries + 1):
+            self.seq = (self.seq + 1) & 0xFFFF
+            key = (address, self.seq)
+            reply = self.pending[key] = self.loop.create_future()
+            try:
+                await self._send(_echo_request(self.ident, self.seq), address, timeout)
+                await asyncio.wait_for(reply, timeout)
+                return UP
+            except asyncio.TimeoutError:
+                continue
+            except (OSError, socket.error):
+                # e.g. no route to host, retrying will not help
+                return DOWN
+            finally:
+                self.pending.pop(key, None)
+        return DOWN
+
+    async def _send(self, packet, address, timeout):
+        # a full send buffer is not an answer from address: wait, up to timeout, until the
+        # socket is writable again and send once more
+        deadline = self.loop.time() + timeout
+        while True:
+            try:
+                self.sock.sendto(packet, (address, 0))
+                return
+            except BlockingIOError:
+                if self._writable is None:
+                    self._writable = self.loop.create_future()
+                    self.loop.add_writer(self.sock.fileno(), self._on_writable)
+                # shielded, a ping timing out does not cancel the wait of the others
+                await asyncio.wait_for(
+                    asyncio.shield(self._writable), max(0, deadline - self.loop.time())
+                )
+
+    def _on_writable(self):
+        self.loop.remove_writer(self.sock.fileno())
+        writable, self._writable = self._writable, None
+        if not writable.done():
+            writable.set_result(True)
+
+    def _on_readable(self):
+        while True:
+            try:
+                packet, (address, _) = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except (OSError, socket.error):
+                return
+            if self.raw:
+                packet = packet[(packet[0] & 0x0F) * 4:]
+            if len(packet) < 8:
+                continue
+            icmp_type, _, _, ident, seq = struct.unpack("!BBHHH", packet[:8])
+            if icmp_type != ICMP_ECHO_REPLY or (self.raw and ident != self.ident):
+                continue
+            reply = self.pending.get((address, seq))
+            if reply and not reply.done():
+                reply.set_result(True)
+
+
+def _echo_request(ident, seq):
+    payload = b"check-vmware"
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + payload)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack("!{}H".format(len(data) // 2), data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+async def tcp_ping(address, timeout, retries, ports=None):
+    """ Up if any of ports (default TCP_PORTS) completes a handshake or actively refuses
+        the connection. """
+    ports = ports or TCP_PORTS
+    for _ in range(retries + 1):
+        answers = await asyncio.gather(*[_tcp_answers(address, port, timeout) for port in ports])
+        if any(answers):
+            return UP
+    return DOWN
+
+
+async def _tcp_answers(address, port, timeout):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except ConnectionRefusedError:
+        return True
+    except (asyncio.TimeoutError, OSError):
+        return False
+    writer.close()
+    return True
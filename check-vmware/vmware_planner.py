@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Fetch planning for declaratively defined checks.
+
+A check is defined by the managed object type it reads, the property paths
+it needs from it and a classifier, a function of the fetched values that
+returns the check result (see DEFINITIONS in vmware_checks). For any set of
+checks plan() merges the paths read from the same objects, so every object
+type is fetched once with the union of the paths, and collect() fetches
+them in as few PropertyCollector calls as the collector helpers allow.
+
+Checks either classify every object of their type in the vcenter at once
+(all datastores, all VMs...), or each object of a given list separately
+(per_object, e.g. the -H host or every host of a batch). A per object check
+can also read properties of the objects one of its properties refers to
+(related, e.g. the datastores of a host), they are fetched in one more call
+for all the objects. Data that is not a property, like the performance
+history of the objects, is declared as a history fetch: a function reading it
+for all the fetched objects at once, its values are added to theirs, so the
+classifiers only ever look at fetched values.
+"""
+from collections import OrderedDict, namedtuple
+from pyVmomi import vim
+from vmware_collector import (
+    iter_properties,
+    retrieve_object_properties,
+    retrieve_properties,
+    unwrap
+)
+
+# related is a (property, obj_type, paths) tuple or None, history a (key, read) tuple or None:
+# read(system, objs) returns a dict of obj to its value, added to the values of obj as key
+Definition = namedtuple(
+    "Definition", ["obj_type", "paths", "classify", "per_object", "related", "history"]
+)
+# related maps a property to the (obj_type, paths) read from the objects it refers to, history
+# a key to its read function, names are the definitions the fetch serves
+Fetch = namedtuple("Fetch", ["obj_type", "per_object", "paths", "related", "history", "names"])
+
+
+def define(obj_type, paths, classify, per_object=False, related=None, history=None):
+    """ A Definition, see the module docstring. """
+    return Definition(obj_type, list(paths), classify, per_object, related, history)
+
+
+def plan(definitions):
+    """ The fetches running definitions, a dict of name: Definition, takes: one Fetch per object
+        type and scope with the union of the paths the definitions read, in the order the
+        definitions are given. """
+    fetches = OrderedDict()
+    for name, definition in definitions.items():
+        key = (definition.obj_type, definition.per_object)
+        if key not in fetches:
+            fetches[key] = Fetch(
+                definition.obj_type, definition.per_object, [], OrderedDict(), OrderedDict(), []
+            )
+        fetch = fetches[key]
+        _extend(fetch.paths, definition.paths)
+        if definition.related:
+            prop, obj_type, paths = definition.related
+            _extend(fetch.paths, [prop])
+            _extend(fetch.related.setdefault(prop, (obj_type, []))[1], paths)
+        if definition.history:
+            key, read = definition.history
+            fetch.history.setdefault(key, read)
+        fetch.names.append(name)
+    return list(fetches.values())
+
+
+def collect(system, fetch, objs=None, container=None):
+    """ The values of fetch, dicts keyed by property path like retrieve_properties returns them,
+        with the values of the related objects (e.g. the datastores of a host) in place of their
+        references. A per object fetch reads objs, or every object below container, the others
+        every object of the vcenter. A fetch serving a single definition is streamed unless it
+        has related objects or history. """
+    if fetch.per_object and objs is not None:
+        items = retrieve_object_properties(system, objs, fetch.obj_type, fetch.paths)
+    elif fetch.per_object:
+        items = retrieve_properties(system, fetch.obj_type, fetch.paths, container)
+    elif len(fetch.names) == 1 and not fetch.related and not fetch.history:
+        return iter_properties(system, fetch.obj_type, fetch.paths)
+    else:
+        items = retrieve_properties(system, fetch.obj_type, fetch.paths)
+    for prop, (obj_type, paths) in fetch.related.items():
+        items = _resolve(system, items, prop, obj_type, paths)
+    for key, read in fetch.history.items():
+        items = _add_history(system, items, key, read)
+    return items
+
+
+def object_system(obj):
+    """ A stand-in for the system a managed object was read from, as far as the collector
+        helpers use it, to fetch properties when only the object is at hand. """
+    return _ObjectSystem(unwrap(obj))
+
+
+def _resolve(system, items, prop, obj_type, paths):
+    # objects are often shared (the datastores of the hosts of a cluster), fetch each one once
+    refs = OrderedDict()
+    for item in items:
+        refs.update((ref, None) for ref in item.get(prop) or [])
+    related = dict(
+        (values["obj"], values)
+        for values in retrieve_object_properties(system, list(refs), obj_type, paths)
+    )
+    resolved = []
+    for item in items:
+        # the items may be shared through a Snapshot memo, do not modify them
+        item = dict(item)
+        item[prop] = [related[ref] for ref in item.get(prop) or [] if ref in related]
+        resolved.append(item)
+    return resolved
+
+
+def _add_history(system, items, key, read):
+    history = read(system, [item["obj"] for item in items]) if items else {}
+    # copies, like _resolve
+    return [dict(item, **{key: history.get(unwrap(item["obj"]))}) for item in items]
+
+
+def _extend(paths, more):
+    paths.extend(path for path in more if path not in paths)
+
+
+class _ObjectSystem(object):
+
+    def __init__(self, obj):
+        self._obj = obj
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            service_instance = vim.ServiceInstance("ServiceInstance", self._obj._stub)
+            self._content = service_instance.RetrieveContent()
+        return self._content
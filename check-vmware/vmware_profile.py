@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+vSphere API call profiling, enabled with check_vmware.py --profile.
+
+CallStats counts the calls per API method and managed object type, with the
+bytes sent and received and a latency histogram. profile_stub hooks a pyVmomi
+stub adapter so every call made through it is recorded. Properties read off a
+managed object (e.g. datastore.summary in a loop over datastores) are recorded
+as "<property> read" rather than as the RetrievePropertiesEx they turn into,
+so N+1 patterns stand out from the bulk retrievals in the report.
+"""
+import bisect
+import collections
+import threading
+import time
+
+from pyVmomi import VmomiSupport
+
+# upper bounds of the latency histogram buckets in seconds, the last bucket is open ended
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+
+class CallStats(object):
+    """ Calls, bytes each way, time spent and latency histogram per API method and managed
+        object type. """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = collections.Counter()
+        self.bytes_out = collections.Counter()
+        self.bytes_in = collections.Counter()
+        self.seconds = collections.Counter()
+        self.histograms = collections.defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def record(self, method, mo, bytes_out, bytes_in, seconds):
+        key = (method, VmomiSupport.GetWsdlName(mo.__class__))
+        self.calls[key] += 1
+        self.bytes_out[key] += bytes_out
+        self.bytes_in[key] += bytes_in
+        self.seconds[key] += seconds
+        self.histograms[key][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    @property
+    def total_bytes(self):
+        return sum(self.bytes_out.values()) + sum(self.bytes_in.values())
+
+    @property
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    @property
+    def property_reads(self):
+        """ Calls made by reading a property off a managed object. """
+        return sum(calls for (method, _), calls in self.calls.items() if method.endswith(" read"))
+
+    def report(self):
+        """ One line per method and type, the most time consuming first. """
+        lines = ["{} vSphere API calls, {:.3f}s, {} bytes sent, {} bytes received".format(
+            self.total_calls, self.total_seconds, sum(self.bytes_out.values()),
+            sum(self.bytes_in.values())
+        )]
+        for key in sorted(self.calls, key=lambda key: -self.seconds[key]):
+            lines.append("  {} on {}: {} calls, {:.3f}s, {}B out, {}B in, latency {}".format(
+                key[0], key[1], self.calls[key], self.seconds[key], self.bytes_out[key],
+                self.bytes_in[key], _format_histogram(self.histograms[key])
+            ))
+        return lines
+
+    def perfdata(self):
+        """ Nagios performance data of the totals. """
+        return " ".join([
+            "soap_calls={};;;0".format(self.total_calls),
+            "soap_property_reads={};;;0".format(self.property_reads),
+            "soap_seconds={:.3f}s;;;0".format(self.total_seconds),
+            "soap_bytes_out={}B;;;0".format(sum(self.bytes_out.values())),
+            "soap_bytes_in={}B;;;0".format(sum(self.bytes_in.values())),
+        ])
+
+
+def _format_histogram(histogram):
+    bounds = ["<={}ms".format(int(bound * 1000)) for bound in LATENCY_BUCKETS]
+    bounds.append(">{}ms".format(int(LATENCY_BUCKETS[-1] * 1000)))
+    return " ".join(
+        "{}:{}".format(bound, count) for bound, count in zip(bounds, histogram) if count
+    )
+
+
+def add_perfdata(message, perfdata):
+    """ message with perfdata after the "|" of its first line, as nagios expects it. """
+    first, newline, rest = message.partition("\n")
+    separator = " " if "|" in first else " | "
+    return first + separator + perfdata + newline + rest
+
+
+def profile_stub(stub, stats):
+    """ Record every call made through stub (a pyVmomi stub adapter) into stats. The bytes are
+        counted on the wire for SoapStubAdapter, they are 0 for stubs that do not do http. """
+    state = threading.local()
+    invoke_method, invoke_accessor = stub.InvokeMethod, stub.InvokeAccessor
+
+    def call(method, mo, invoke):
+        if getattr(state, "active", False):
+            # the RetrievePropertiesEx of a property read, accounted to the read
+            return invoke()
+        state.active, state.bytes_out, state.bytes_in = True, 0, 0
+        start = time.time()
+        try:
+            return invoke()
+        finally:
+            stats.record(method, mo, state.bytes_out, state.bytes_in, time.time() - start)
+            state.active = False
+
+    stub.InvokeMethod = lambda mo, info, args, *rest: call(
+        info.wsdlName, mo, lambda: invoke_method(mo, info, args, *rest)
+    )
+    stub.InvokeAccessor = lambda mo, info: call(
+        "{} read".format(info.name), mo, lambda: invoke_accessor(mo, info)
+    )
+
+    # SessionOrientedStub does the http through the SoapStubAdapter it wraps
+    soap_stub = getattr(stub, "soapStub", stub)
+    if not hasattr(soap_stub, "requestModifierList"):
+        return stub
+
+    def count_request(request):
+        state.bytes_out = getattr(state, "bytes_out", 0) + len(request)
+        return request
+
+    def count_response(size):
+        state.bytes_in = getattr(state, "bytes_in", 0) + size
+
+    get_connection = soap_stub.GetConnection
+
+    def GetConnection():
+        conn = get_connection()
+        if not getattr(conn, "profiled", False):
+            getresponse = conn.getresponse
+            conn.getresponse = lambda *args, **kwargs: _CountingResponse(
+                getresponse(*args, **kwargs), count_response
+            )
+            conn.profiled = True
+        return conn
+
+    soap_stub.requestModifierList.append(count_request)
+    soap_stub.GetConnection = GetConnection
+    return stub
+
+
+class _CountingResponse(object):
+    """ http response reporting the size of what is read from it. """
+
+    def __init__(self, response, count):
+        self._response = response
+        self._count = count
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._count(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Local store of the values measured by the checks (check_vmware.py --samples),
+so trends can be read back without querying the performance history of the
+vcenter.
+
+Every metric of every entity (cpu_frac of a host, datastore_usage of a
+datastore, failed_tasks of the vcenter...) is a ring file of fixed-width
+(timestamp, value) records, memory mapped and read as an array of doubles:
+appending overwrites the oldest record once the ring is full, and the
+records are in time order so a time range is found by bisection. A store
+keeps at most MAX_OPEN files open, a check recording thousands of datastores
+does not run out of file descriptors.
+
+    ./vmware_samples.py /var/lib/shinken/samples vcenter cpu_frac esxi1 --window 3600
+"""
+import argparse
+import bisect
+import fcntl
+import mmap
+import os
+import struct
+import sys
+import time
+
+from argparse import RawTextHelpFormatter
+from collections import OrderedDict, namedtuple
+from urllib.parse import quote
+
+# magic, capacity, records ever appended; the records follow, two doubles each
+HEADER = struct.Struct("<4sIQ")
+MAGIC = b"VSR1"
+RECORD_SIZE = 16
+# 14 days of samples taken every 5 minutes
+DEFAULT_CAPACITY = 4096
+# series kept open per store, the least recently used ones are closed first
+MAX_OPEN = 64
+
+Stats = namedtuple("Stats", ["count", "min", "max", "avg"])
+
+
+class SampleStore(object):
+    """ The ring files of one vcenter, below directory. """
+
+    def __init__(self, directory, vcenter, capacity=DEFAULT_CAPACITY, max_open=MAX_OPEN):
+        self.directory = os.path.join(directory, quote(vcenter, safe=""))
+        self.vcenter = vcenter
+        self.capacity = capacity
+        self.max_open = max_open
+        self._series = OrderedDict()
+
+    def append(self, metric, entity, value, timestamp=None):
+        """ Record value as the latest sample of metric for entity, now by default. """
+        self.series(metric, entity, create=True).append(timestamp, value)
+
+    def series(self, metric, entity, create=False):
+        """ The Series of metric for entity, None when nothing was recorded and not create. It
+            stays open until max_open other series were used after it. """
+        key = (metric, entity)
+        series = self._series.pop(key, None)
+        if series is None:
+            path = os.path.join(self.directory, quote(metric, safe=""), quote(entity, safe=""))
+            if not create and not os.path.exists(path):
+                return None
+            series = Series(path, self.capacity)
+        self._series[key] = series
+        while len(self._series) > self.max_open:
+            self._series.popitem(last=False)[1].close()
+        return series
+
+    def last(self, metric, entity, n=1):
+        """ The latest n (timestamp, value) samples, oldest first. """
+        series = self.series(metric, entity)
+        return series.last(n) if series else []
+
+    def scan(self, metric, entity, start=None, end=None):
+        """ The (timestamp, value) samples taken from start to end, oldest first. """
+        series = self.series(metric, entity)
+        return series.scan(start, end) if series else []
+
+    def stats(self, metric, entity, window, now=None):
+        """ Stats of the samples of the past window seconds, None when there are none. """
+        now = time.time() if now is None else now
+        values = [value for _, value in self.scan(metric, entity, now - window, now)]
+        if not values:
+            return None
+        return Stats(len(values), min(values), max(values), sum(values) / len(values))
+
+    def rate(self, metric, entity, window, now=None):
+        """ Change per second of the metric over the past window seconds, from the first and
+            last samples of the window, None with less than two samples. """
+        now = time.time() if now is None else now
+        samples = self.scan(metric, entity, now - window, now)
+        if len(samples) < 2 or samples[-1][0] == samples[0][0]:
+            return None
+        return (samples[-1][1] - samples[0][1]) / (samples[-1][0] - samples[0][0])
+
+    def close(self):
+        for series in self._series.values():
+            series.close()
+        self._series = OrderedDict()
+
+
+class Series(object):
+    """ One ring file. Appends are serialized between processes by a lock on the file, reads
+        take it shared. """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        if not os.path.exists(path):
+            self._create(capacity)
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, _ = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a sample file".format(path))
+        # timestamp of slot i at 2 * i, value at 2 * i + 1
+        self._values = memoryview(self._map)[HEADER.size:].cast("d")
+
+    def _create(self, capacity):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        # written whole then renamed, another process may be creating it as well
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp, "wb") as stream:
+            stream.write(HEADER.pack(MAGIC, capacity, 0))
+            stream.truncate(HEADER.size + capacity * RECORD_SIZE)
+        os.rename(tmp, self.path)
+
+    def append(self, timestamp, value):
+        """ Append a sample, taken now when timestamp is None. """
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            # read under the lock, the records of concurrent processes stay in time order
+            if timestamp is None:
+                timestamp = time.time()
+            count = self._count()
+            slot = 2 * (count % self.capacity)
+            self._values[slot] = timestamp
+            self._values[slot + 1] = value
+            # counted once written, readers never see a half written record
+            HEADER.pack_into(self._map, 0, MAGIC, self.capacity, count + 1)
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return min(self._count(), self.capacity)
+
+    def last(self, n=1):
+        with _Shared(self._file):
+            first, size = self._window()
+            return [self._sample(first, i) for i in range(max(size - n, 0), size)]
+
+    def scan(self, start=None, end=None):
+        with _Shared(self._file):
+            first, size = self._window()
+            times = _Timestamps(self, first, size)
+            lo = 0 if start is None else bisect.bisect_left(times, start)
+            hi = size if end is None else bisect.bisect_right(times, end)
+            return [self._sample(first, i) for i in range(lo, hi)]
+
+    def close(self):
+        if getattr(self, "_values", None) is not None:
+            self._values.release()
+            self._values = None
+        self._map.close()
+        self._file.close()
+
+    def _count(self):
+        return HEADER.unpack_from(self._map)[2]
+
+    def _window(self):
+        # the slot of the oldest sample and the number of samples
+        count = self._count()
+        if count <= self.capacity:
+            return 0, count
+        return count % self.capacity, self.capacity
+
+    def _sample(self, first, i):
+        slot = 2 * ((first + i) % self.capacity)
+        return self._values[slot], self._values[slot + 1]
+
+
+class _Timestamps(object):
+    # the timestamps of a series in time order, for bisect
+
+    def __init__(self, series, first, size):
+        self.series, self.first, self.size = series, first, size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        return self.series._sample(self.first, i)[0]
+
+
+class _Shared(object):
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __enter__(self):
+        fcntl.flock(self.stream, fcntl.LOCK_SH)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.stream, fcntl.LOCK_UN)
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument("directory", help="Directory given to check_vmware.py --samples")
+    parser.add_argument("vcenter", help="vSphere client the samples were taken from")
+    parser.add_argument("metric", help="e.g. cpu_frac, mem_frac, datastore_usage, failed_tasks")
+    parser.add_argument("entity", help="Host, datastore or vSphere client name")
+    parser.add_argument("--last", dest="last", help="Print the latest samples", type=int,
+                        default=10)
+    parser.add_argument("--window", dest="window",
+                        help="Print min/max/avg and rate over this many seconds instead",
+                        type=float)
+    args = parser.parse_args()
+
+    store = SampleStore(args.directory, args.vcenter)
+    if store.series(args.metric, args.entity) is None:
+        print("No samples of {} for {}".format(args.metric, args.entity))
+        sys.exit(1)
+    if args.window:
+        stats = store.stats(args.metric, args.entity, args.window)
+        if stats is None:
+            print("No samples in the past {} seconds".format(args.window))
+            sys.exit(1)
+        print("count {} min {} max {} avg {:.4f} rate {}/s".format(
+            stats.count, stats.min, stats.max, stats.avg,
+            store.rate(args.metric, args.entity, args.window)
+        ))
+    else:
+        for timestamp, value in store.last(args.metric, args.entity, args.last):
+            print("{} {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+                                 value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Push mode: a long-lived scheduler that runs the checks of a manifest on its
+own timers and hands the results to shinken/nagios as passive results,
+instead of shinken forking check_vmware.py for every host and measurement.
+
+The manifest is a JSON file:
+
+    {
+        "command_file": "/var/lib/shinken/nagios.cmd",
+        "checks": [
+            {"vsphere": "vcenter1", "user": "...", "password": "...",
+             "hosts": ["esxi1", "esxi2"], "measurements": ["host_cpu", "host_memory"],
+             "interval": 300, "warning": 0.8, "critical": 0.9},
+            {"vsphere": "vcenter1", "user": "...", "password": "...",
+             "measurements": ["system_datastore_usage", "system_tasks"], "interval": 600,
+             "host_name": "vcenter1"},
+            {"vsphere": "vcenter1", "user": "...", "password": "...",
+             "measurements": ["vm_count"], "interval": 600, "warning": 200, "critical": 300}
+        ]
+    }
+
+"hosts" is a list of esxi host names or "all", the results of the host
+measurements are submitted for the esxi host, those of the vcenter level
+measurements for "host_name" (default the vsphere name); the service is the
+measurement name. Without "warning" or "critical" every check uses its own
+default, those given have to fit all the measurements of the check: usage
+fractions and counts are not mixed. Instead of "command_file", "spool" names a directory the
+result lines are written to, one file per run, for another process to
+forward.
+
+The checks of a vcenter with the same interval and thresholds form one job:
+they run together from one snapshot, so the data they share is fetched once
+(see vmware_planner), and only the results of the hosts and measurements a
+check of the manifest asked for are submitted. Every job starts at a random offset within its
+interval, so the jobs do not all hit the vcenters at the same time, then
+runs every interval. The sessions, and the inventory trackers keeping their
+retrievals current, are kept between runs like in the daemon.
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from argparse import RawTextHelpFormatter
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from vmware_checks import (
+    CHECKS,
+    HOST_CHECKS,
+    UNKNOWN,
+    CheckResult,
+    run_host_batch,
+    run_measurements
+)
+from vmware_passive import format_service_result, submit
+
+DEFAULT_INTERVAL = 300
+# jobs run at the same time
+DEFAULT_WORKERS = 8
+
+# hosts is None for the jobs without host measurements, "all" or a list of names otherwise.
+# wanted maps each host measurement to the hosts it was asked for, "all" or a list of names
+Job = namedtuple("Job", [
+    "vsphere", "user", "password", "interval", "warning", "critical", "host_name", "hosts",
+    "measurements", "wanted"
+])
+
+
+def parse_manifest(path):
+    """ The jobs of the manifest at path and the place to write the results to, a
+        CommandFile or a Spool. Raises ValueError for an invalid manifest. """
+    with open(path) as stream:
+        manifest = json.load(stream)
+    if manifest.get("command_file"):
+        output = CommandFile(manifest["command_file"])
+    elif manifest.get("spool"):
+        output = Spool(manifest["spool"])
+    else:
+        raise ValueError("the manifest sets neither command_file nor spool")
+    return group_checks(manifest.get("checks", [])), output
+
+
+def group_checks(checks):
+    """ The Jobs running the checks of the manifest, the checks of a vcenter with the same
+        interval and thresholds merged. """
+    jobs = OrderedDict()
+    for check in checks:
+        unknown = [m for m in check.get("measurements", []) if m not in CHECKS]
+        if unknown or not check.get("measurements"):
+            raise ValueError("check of {} has no or unknown measurements: {}".format(
+                check.get("vsphere"), unknown
+            ))
+        host_checks = [m for m in check["measurements"] if m in HOST_CHECKS]
+        if host_checks and not check.get("hosts"):
+            raise ValueError("{} need the hosts to check".format(", ".join(host_checks)))
+        key = (
+            check["vsphere"], check.get("user"), check.get("password"),
+            check.get("interval", DEFAULT_INTERVAL), check.get("warning"),
+            check.get("critical"), check.get("host_name", check["vsphere"])
+        )
+        job = jobs.setdefault(key, {"hosts": None, "measurements": [], "wanted": {}})
+        hosts = check.get("hosts") if host_checks else None
+        if hosts:
+            job["hosts"] = _merge_hosts(job["hosts"], hosts)
+        for measurement in host_checks:
+            job["wanted"][measurement] = _merge_hosts(job["wanted"].get(measurement), hosts)
+        job["measurements"].extend(m for m in check["measurements"] if m not in job["measurements"])
+    return [
+        Job(*(key + (job["hosts"], job["measurements"], job["wanted"])))
+        for key, job in jobs.items()
+    ]
+
+
+def _merge_hosts(known, hosts):
+    # "all" or the list of the host names of known and hosts, in order
+    if hosts == "all" or known == "all":
+        return "all"
+    known = known or []
+    return known + [host for host in hosts if host not in known]
+
+
+def is_wanted(job, hostname, measurement):
+    """ Whether a check of job asked for the result of measurement on hostname. The failures
+        of a whole fetch, reported against the vcenter, are always wanted. """
+    hosts = job.wanted.get(measurement)
+    return hosts is None or hosts == "all" or hostname in hosts or hostname == job.vsphere
+
+
+def run_job(job, sessions, logger):
+    """ Run the checks of job through sessions, a vmware_daemon.SessionPool. Returns a list of
+        (host name, service, CheckResult), UNKNOWN results when the vcenter can not be
+        checked. """
+    host_measurements = [m for m in job.measurements if m in HOST_CHECKS]
+    system_measurements = [m for m in job.measurements if m not in HOST_CHECKS]
+    try:
+        system, trackers = sessions.get(job.vsphere, job.user, job.password)
+        results = []
+        if host_measurements:
+            # the hosts share one fetch, a host only gets the measurements asked for it
+            results.extend(
+                (hostname, measurement, result)
+                for hostname, measurement, result in run_host_batch(
+                    system, host_measurements, warn=job.warning, crit=job.critical,
+                    logger=logger, cache=trackers, hosts=None if job.hosts == "all" else job.hosts
+                ) if is_wanted(job, hostname, measurement)
+            )
+        if system_measurements:
+            results.extend(
+                (job.host_name, measurement, result)
+                for measurement, result in run_measurements(
+                    system, system_measurements, warn=job.warning, crit=job.critical,
+                    logger=logger, cache=trackers
+                )
+            )
+        return results
+    except Exception as e:
+        logger.error("Unable to run checks on Vsphere %s", job.vsphere, exc_info=True)
+        result = CheckResult(
+            UNKNOWN, "ERROR: unable to run checks on vSphere {}: '{}', check logs for "
+                     "trace".format(job.vsphere, e)
+        )
+        hosts = job.hosts if isinstance(job.hosts, list) else [job.host_name]
+        return [
+            (hostname, measurement, result)
+            for hostname in hosts for measurement in host_measurements
+            if is_wanted(job, hostname, measurement)
+        ] + [(job.host_name, measurement, result) for measurement in system_measurements]
+
+
+class Scheduler(object):
+    """ Runs every job of jobs every job.interval seconds, in a pool of workers threads, and
+        writes the results to output. """
+
+    def __init__(self, jobs, output, sessions, logger, workers=DEFAULT_WORKERS):
+        self.jobs = jobs
+        self.output = output
+        self.sessions = sessions
+        self.logger = logger
+        self.workers = workers
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def run_once(self):
+        """ Run every job now, and return when they are all done. """
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(self.jobs)))) as pool:
+            list(pool.map(self._run, self.jobs))
+
+    def run(self, stop=None):
+        """ Run the jobs on their timers until stop, a threading.Event, is set. """
+        stop = stop or threading.Event()
+        now = time.time()
+        # (due time, index, job), the index breaks the ties
+        due = [
+            (now + random.uniform(0, job.interval), i, job) for i, job in enumerate(self.jobs)
+        ]
+        heapq.heapify(due)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while due and not stop.is_set():
+                when, i, job = due[0]
+                if stop.wait(max(0, when - time.time())):
+                    break
+                heapq.heapreplace(due, (when + job.interval, i, job))
+                with self._lock:
+                    if i in self._running:
+                        self.logger.warning(
+                            "Checks of Vsphere %s still running after %s seconds, skipping "
+                            "this run", job.vsphere, job.interval
+                        )
+                        continue
+                    self._running.add(i)
+                pool.submit(self._run, job, i)
+
+    def _run(self, job, index=None):
+        try:
+            start = time.time()
+            results = run_job(job, self.sessions, self.logger)
+            self.output.write([
+                format_service_result(hostname, measurement, result)
+                for hostname, measurement, result in results
+            ])
+            self.logger.info("Ran %s checks on Vsphere %s in %.1f seconds", len(results),
+                             job.vsphere, time.time() - start)
+        except Exception:
+            self.logger.error("Unable to submit the results of Vsphere %s", job.vsphere,
+                              exc_info=True)
+        finally:
+            with self._lock:
+                self._running.discard(index)
+
+
+class CommandFile(object):
+    """ The shinken/nagios external command file, a named pipe. """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, lines):
+        with self._lock:
+            submit(lines, self.path)
+
+
+class Spool(object):
+    """ A directory getting one file of external command lines per run. """
+
+    def __init__(self, path):
+        self.path = path
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def write(self, lines):
+        with self._lock:
+            self._count += 1
+            name = "{:.6f}-{}-{}.cmd".format(time.time(), os.getpid(), self._count)
+        # written under another name then renamed, the reader never sees a partial file
+        tmp = os.path.join(self.path, "." + name)
+        with open(tmp, "w") as stream:
+            stream.writelines(lines)
+        os.rename(tmp, os.path.join(self.path, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "-M",
+        "--manifest",
+        dest="manifest",
+        help="JSON file of the checks to run, see the docstring of this module",
+        type=str,
+        required=True
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Jobs run at the same time",
+        type=int,
+        default=DEFAULT_WORKERS
+    )
+    parser.add_argument(
+        "--once",
+        dest="once",
+        help="Run every job once and exit",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "-l",
+        "--local",
+        dest="local",
+        help="Use this field when testing locally",
+        action="store_true",
+        default=False
+    )
+    args = parser.parse_args()
+    from vmware_daemon import SessionPool
+    from vmware_logconf import get_logger
+
+    logger = get_logger(args.local, queued=True)
+    try:
+        jobs, output = parse_manifest(args.manifest)
+    except (IOError, ValueError, KeyError) as e:
+        logger.error("Error: invalid manifest %s: %s", args.manifest, e)
+        print("Error: invalid manifest {}: {}".format(args.manifest, e))
+        sys.exit(3)
+
+    scheduler = Scheduler(jobs, output, SessionPool(logger), logger, workers=args.workers)
+    logger.info("Scheduling %s jobs from %s", len(jobs), args.manifest)
+    if args.once:
+        scheduler.run_once()
+    else:
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
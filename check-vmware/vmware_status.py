@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+The result of a check and the plugin return codes, apart from vmware_checks
+so the daemon client (check_vmware.py --socket) can relay a result without
+importing pyVmomi and the checks.
+"""
+from collections import namedtuple
+
+# nagios/shinken plugin return codes
+OK, WARNING, CRITICAL, UNKNOWN = 0, 1, 2, 3
+
+STATUS_LABELS = {OK: "Ok", WARNING: "Warning", CRITICAL: "Critical", UNKNOWN: "Unknown"}
+
+CheckResult = namedtuple("CheckResult", ["status", "message"])
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Per object thresholds (check_vmware.py --thresholds), so scratch and
+production datastores, or big and small hosts, are held to different
+warning and critical values by the same check.
+
+The rules file is a JSON list, each rule names the type of object it is for
+and its name, a glob pattern or a regex matching the whole name:
+
+    [
+        {"type": "datastore", "name": "scratch-*", "warning": 0.95, "critical": 0.98},
+        {"type": "datastore", "regex": "prod-(db|web)[0-9]+", "warning": 0.7, "critical": 0.8},
+        {"type": "host", "name": "esxi1.example.com", "critical": 0.95}
+    ]
+
+The thresholds of an object are those of the rule naming it exactly, else
+those of the first rule matching it, else the -w/-c of the check; a rule
+without warning or critical keeps the -w or -c one. "datastore" rules are
+used by the datastore usage checks, "host" rules by host_cpu and host_memory.
+
+The rules are compiled once: the exact names go to a dict, the patterns of a
+type are joined into one regex, so an object costs a dict lookup and one
+match whatever the number of rules. A regex with named groups, backreferences
+or inline flags is matched on its own, in its place among the rules: joined
+to the others its groups would clash or refer to the wrong group.
+"""
+import fnmatch
+import json
+import re
+
+from collections import defaultdict
+
+TYPES = ("datastore", "host")
+
+# the parts of a regex that do not survive being joined to others: escapes (numeric ones are
+# backreferences), named groups and references, conditionals and inline flags
+STANDALONE = re.compile(r"\\(.)|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+class ThresholdRules(object):
+    """ The compiled rules of a rules file. """
+
+    def __init__(self, rules):
+        """ rules is the list of a rules file. Raises ValueError for an invalid rule. """
+        self._exact = {}
+        self._thresholds = {}
+        # per type, the (group, regex, standalone) of the patterns in order
+        patterns = defaultdict(list)
+        for i, rule in enumerate(rules):
+            if rule.get("type") not in TYPES:
+                raise ValueError("rule {}: type should be one of {}".format(i, ", ".join(TYPES)))
+            thresholds = (rule.get("warning"), rule.get("critical"))
+            if None not in thresholds and float(thresholds[0]) > float(thresholds[1]):
+                raise ValueError("rule {}: warning is greater than critical".format(i))
+            thresholds = tuple(None if value is None else float(value) for value in thresholds)
+            if "regex" in rule:
+                regex = rule["regex"]
+                try:
+                    re.compile(regex)
+                except re.error as e:
+                    raise ValueError("rule {}: invalid regex: {}".format(i, e))
+            elif "name" in rule:
+                if not any(char in rule["name"] for char in "*?["):
+                    # an earlier rule for the same name wins, like for the patterns
+                    self._exact.setdefault((rule["type"], rule["name"]), thresholds)
+                    continue
+                regex = fnmatch.translate(rule["name"])
+            else:
+                raise ValueError("rule {}: name or regex is missing".format(i))
+            # the group of the alternative that matched tells the rule
+            group = "rule{}".format(i)
+            patterns[rule["type"]].append((group, regex, _standalone(regex)))
+            self._thresholds[group] = thresholds
+        # per type, the compiled patterns to try in order: the runs of rules joined into one
+        # regex, and the standalone rules
+        self._patterns = {}
+        for kind, rules in patterns.items():
+            compiled = self._patterns[kind] = []
+            joined = []
+            for group, regex, standalone in rules + [(None, None, True)]:
+                if not standalone:
+                    joined.append("(?P<{}>{})".format(group, regex))
+                    continue
+                if joined:
+                    try:
+                        compiled.append((re.compile("|".join(joined)), None))
+                    except re.error as e:
+                        raise ValueError("invalid {} regex: {}".format(kind, e))
+                    joined = []
+                if group is not None:
+                    compiled.append((re.compile(regex), group))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as stream:
+            return cls(json.load(stream))
+
+    def lookup(self, kind, name, warn, crit):
+        """ The (warning, critical) thresholds of the kind object called name, warn and crit
+            where no rule sets them. """
+        thresholds = self._exact.get((kind, name))
+        if thresholds is None:
+            for pattern, group in self._patterns.get(kind, []):
+                match = pattern.fullmatch(name)
+                if match is not None:
+                    thresholds = self._thresholds[group or match.lastgroup]
+                    break
+            else:
+                return warn, crit
+        return (
+            warn if thresholds[0] is None else thresholds[0],
+            crit if thresholds[1] is None else thresholds[1]
+        )
+
+
+def _standalone(regex):
+    # whether regex has to be matched on its own, see STANDALONE
+    for match in STANDALONE.finditer(regex):
+        if match.group(1) is None or match.group(1) in "123456789":
+            return True
+    return False
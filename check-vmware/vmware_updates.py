@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Incremental inventory tracking through PropertyCollector.WaitForUpdatesEx.
+
+An InventoryTracker creates its property filter once and keeps an in-memory
+model of the requested properties current: the first poll returns every
+object, later polls only transfer the properties that changed since the
+version token of the previous one. This only pays off in a long-lived
+process (vmware_daemon.py), where InventoryTrackers serves the inventory wide
+retrievals of the checks from the tracked models. Every tracker holds a
+property collector on the vcenter, InventoryTrackers destroys those not used
+for TRACKER_IDLE seconds and keeps MAX_TRACKERS of them at most.
+"""
+import threading
+import time
+
+from collections import OrderedDict
+from vmware_collector import PC, unwrap, view_filter_spec
+
+# trackers kept per session, the least recently used ones are destroyed first
+MAX_TRACKERS = 32
+# seconds after which an unused tracker is destroyed
+TRACKER_IDLE = 3600
+
+
+class InventoryTracker(object):
+    """ Model of path_set for every obj_type object below container, kept current with
+        WaitForUpdatesEx. items() has the same format as retrieve_properties. """
+
+    def __init__(self, system, obj_type, path_set, container=None):
+        self.obj_type = obj_type
+        self.path_set = path_set
+        content = system.content
+        # a private collector, so the filter and version do not clash with other users
+        self.collector = content.propertyCollector.CreatePropertyCollector()
+        self.view = content.viewManager.CreateContainerView(
+            unwrap(container) or content.rootFolder, [obj_type], True
+        )
+        self.filter = self.collector.CreateFilter(
+            view_filter_spec(self.view, obj_type, path_set), partialUpdates=True
+        )
+        self.version = ""
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def poll(self, max_wait=0):
+        """ Apply every update vcenter has queued since the last poll, waiting at most max_wait
+            seconds for the first one. Returns the number of objects that changed. """
+        with self.lock:
+            changed = 0
+            options = PC.WaitOptions(maxWaitSeconds=max_wait)
+            update_set = self.collector.WaitForUpdatesEx(self.version, options)
+            while update_set:
+                changed += self.apply(update_set)
+                self.version = update_set.version
+                # a truncated update set has more updates waiting right away
+                if not update_set.truncated:
+                    break
+                update_set = self.collector.WaitForUpdatesEx(
+                    self.version, PC.WaitOptions(maxWaitSeconds=0)
+                )
+            return changed
+
+    def apply(self, update_set):
+        changed = 0
+        for filter_update in update_set.filterSet:
+            for update in filter_update.objectSet:
+                changed += 1
+                if update.kind == "leave":
+                    self.objects.pop(update.obj, None)
+                    continue
+                item = self.objects.setdefault(update.obj, {"obj": update.obj})
+                for change in update.changeSet:
+                    if change.op in ("remove", "indirectRemove"):
+                        item.pop(change.name, None)
+                    else:
+                        item[change.name] = change.val
+        return changed
+
+    def items(self):
+        with self.lock:
+            return [dict(item) for item in self.objects.values()]
+
+    def destroy(self):
+        try:
+            self.filter.Destroy()
+            self.view.Destroy()
+            self.collector.Destroy()
+        except Exception:
+            # best effort, with an expired session these objects are already gone
+            pass
+
+
+class InventoryTrackers(object):
+    """ Serves the whole inventory retrievals of the checks (see Snapshot's cache argument)
+        from an InventoryTracker per distinct retrieval, created on first use. At most
+        max_trackers are kept, and none unused for idle seconds. """
+
+    def __init__(self, logger=None, max_trackers=MAX_TRACKERS, idle=TRACKER_IDLE):
+        self.logger = logger
+        self.max_trackers = max_trackers
+        self.idle = idle
+        # key: (tracker, last used), least recently used first
+        self._trackers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, system, key, fetch):
+        if key[0] != "retrieve_properties":
+            return fetch()
+        _, obj_type, path_set, container = key
+        now = time.time()
+        with self._lock:
+            tracker, _ = self._trackers.pop(key, (None, None))
+            if tracker is None:
+                if self.logger:
+                    self.logger.info("Tracking %s %s on %s", obj_type.__name__, list(path_set),
+                                     system.hostname)
+                tracker = InventoryTracker(system, obj_type, path_set, container)
+            self._trackers[key] = (tracker, now)
+            stale = self._evict(now)
+        self._destroy(stale)
+        try:
+            changed = tracker.poll()
+        except Exception:
+            # e.g. the session expired, start over with a new tracker next time
+            if self.logger:
+                self.logger.warning("Polling updates for %s failed, falling back to a full fetch",
+                                    obj_type.__name__, exc_info=True)
+            with self._lock:
+                self._trackers.pop(key, None)
+            return fetch()
+        if self.logger:
+            self.logger.debug("%d %s objects changed on %s", changed, obj_type.__name__,
+                              system.hostname)
+        return tracker.items()
+
+    def expire(self):
+        """ Destroy the trackers not used for idle seconds, e.g. of a vcenter no longer
+            checked. """
+        with self._lock:
+            stale = self._evict(time.time())
+        self._destroy(stale)
+
+    def destroy(self):
+        with self._lock:
+            stale = [tracker for tracker, _ in self._trackers.values()]
+            self._trackers = OrderedDict()
+        self._destroy(stale)
+
+    def _evict(self, now):
+        stale = []
+        while self._trackers:
+            key, (tracker, last_used) = next(iter(self._trackers.items()))
+            if len(self._trackers) <= self.max_trackers and now - last_used < self.idle:
+                break
+            del self._trackers[key]
+            stale.append(tracker)
+        return stale
+
+    def _destroy(self, trackers):
+        # outside the lock, these are calls to the vcenter
+        for tracker in trackers:
+            if self.logger:
+                self.logger.info("Destroying the tracker of %s %s", tracker.obj_type.__name__,
+                                 list(tracker.path_set))
+            tracker.destroy()